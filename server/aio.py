@@ -0,0 +1,189 @@
+# aio.py
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import metrics
+import quota
+import upstream
+from gpt import complete_async
+from ytapi import API_BASE, YouTubeApiError, api_error, playlist_page
+
+
+# What a failed upstream call raises
+UPSTREAM_ERRORS = (YouTubeApiError, httpx.HTTPError, asyncio.TimeoutError, upstream.UpstreamUnavailable)
+
+# Threads for the file and database work of the event loop routes: the quota ledger, the
+# verdict log, persisted and shared caches, the library
+io_pool = ThreadPoolExecutor(max_workers=int(os.getenv('ASYNC_IO_THREADS', '8')), thread_name_prefix='async-io')
+
+
+async def blocking(fn, *args, **kwargs):
+    """
+    Runs `fn(*args, **kwargs)` on io_pool, so blocking I/O never stalls the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(io_pool, functools.partial(fn, *args, **kwargs))
+
+
+class Upstream:
+    """
+    Pooled async HTTP client for one upstream service.
+
+    Connections are kept alive and reused; at most `max_concurrency` calls are in
+    flight at once and the rest queue. `timeout` bounds each call including its time
+    in the queue, so a slow upstream sheds load instead of piling it up.
+
+    Args:
+        name (str): Label used in metrics.
+        max_concurrency (int): Calls allowed in flight (also the connection pool size).
+        timeout (float): Seconds allowed per call.
+        keepalive (int): Idle connections kept open.
+    """
+
+    def __init__(self, name, max_concurrency=64, timeout=10, keepalive=32):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self._client = None
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    @property
+    def client(self):
+        # Built on first use, inside the event loop that will run it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.keepalive),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3))
+            )
+        return self._client
+
+    async def call(self, fn, *args, timeout=None, **kwargs):
+        """
+        Awaits `fn(client, *args, **kwargs)` within the concurrency limit and timeout.
+
+        Args:
+            timeout (float): Shorter timeout for this call, e.g. what is left of the request deadline.
+
+        Raises:
+            asyncio.TimeoutError: If the call (queueing included) exceeds the timeout.
+        """
+        return await asyncio.wait_for(self._call(fn, *args, **kwargs),
+                                      self.timeout if timeout is None else min(timeout, self.timeout))
+
+    async def _call(self, fn, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await fn(self.client, *args, **kwargs)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'waiting': self.waiting, 'max_concurrency': self.max_concurrency}
+
+
+youtube = Upstream('youtube',
+                   max_concurrency=int(os.getenv('YOUTUBE_MAX_CONCURRENCY', '64')),
+                   timeout=float(os.getenv('YOUTUBE_TIMEOUT', '10')))
+openai = Upstream('openai',
+                  max_concurrency=int(os.getenv('OPENAI_MAX_CONCURRENCY', '64')),
+                  timeout=float(os.getenv('OPENAI_TIMEOUT', '15')))
+upstreams = (youtube, openai)
+
+metrics.Callback('focustube_upstream_in_flight', 'Async upstream calls in flight.',
+                 lambda: [({'upstream': u.name}, u.in_flight) for u in upstreams])
+metrics.Callback('focustube_upstream_waiting', 'Async upstream calls queued for a connection slot.',
+                 lambda: [({'upstream': u.name}, u.waiting) for u in upstreams])
+
+
+async def youtube_call(endpoint, route=None, units=None, hedge=None, charged=None, **params):
+    """
+    Async counterpart of ytapi.call.
+
+    Args:
+        endpoint (str): Resource name, e.g. 'search' or 'playlistItems'.
+        route (str): Route charged in the quota ledger (thread-local routes do not
+            apply on the event loop).
+        units (int): Quota cost, defaults to QUOTA_COSTS.
+        hedge (bool): Whether a slow call may be hedged; by default only one-unit calls are.
+        charged (callable): Called with `units` each time an attempt is sent and charged.
+        **params: Query parameters; `None` values are dropped.
+
+    Returns:
+        dict: The decoded JSON response.
+    """
+    units = quota.QUOTA_COSTS.get(endpoint, 1) if units is None else units
+    if not quota.ledger.allow(quota.HIGH, units):
+        raise YouTubeApiError(429, 'Daily YouTube quota budget exhausted.')
+
+    params = {k: v for k, v in params.items() if v is not None}
+    params['key'] = os.getenv('YOUTUBE_API_KEY')
+
+    async def get(client):
+        # Charged once a connection slot is free: an attempt cancelled while queued costs nothing
+        quota.ledger.record(endpoint, units, route, flush=False)
+        if charged is not None:
+            charged(units)
+        return await client.get(f"{API_BASE}/{endpoint}", params=params)
+
+    async def attempt(seconds):
+        response = await youtube.call(get, timeout=seconds)
+        if quota.ledger.flush_due():
+            # The ledger file is locked and rewritten
+            await blocking(quota.ledger.flush)
+        if not response.is_success:
+            raise api_error(response)
+        return response
+
+    with metrics.upstream_call('youtube', endpoint):
+        # Under the request deadline and the circuit breaker
+        response = await upstream.youtube.call_async(endpoint, attempt, hedge=units == 1 if hedge is None else hedge)
+    return response.json()
+
+
+async def iter_playlist_pages(playlist_id, route=None):
+    """
+    Async counterpart of ytapi.iter_playlist_pages.
+    """
+    page_token = None
+    while True:
+        response = await youtube_call('playlistItems', route, part='snippet', playlistId=playlist_id,
+                                      maxResults=50, pageToken=page_token)
+        yield playlist_page(response)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+async def complete(args):
+    """
+    Async counterpart of gpt.complete, sent over the pooled OpenAI connections.
+    """
+    async def attempt(seconds):
+        return await openai.call(lambda client: complete_async(args, client, seconds), timeout=seconds)
+
+    with metrics.upstream_call('openai', 'chat.completions'):
+        return await upstream.openai.call_async('chat.completions', attempt)
+
+
+async def close():
+    for upstream in upstreams:
+        await upstream.close()
@@ -1,17 +1,43 @@
 # app.py
 
+import atexit
+import contextvars
 import json
 import os
+import re
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from flask import Flask, redirect, url_for, render_template, request, jsonify
+from flask import Flask, redirect, url_for, render_template, request, jsonify, Response
 from flask_dance.consumer import OAuth2ConsumerBlueprint
 from flask_login import LoginManager, login_user, logout_user, current_user, UserMixin
 from flask_cors import CORS
-from googleapiclient.discovery import build
-from gpt import askGpt
+from catalog import get_catalog, catalog_response
+import storage
+import gpt
+from batcher import VerdictBatcher
+from cache import LRUCache, SWRCache
+from classifier import QueryClassifier
+import enrich
+from filters import FILTERS
+from jobs import JobQueue
+from library import library
+from sync import library_sync
+from similar import SimilarityIndex
+from singleflight import SingleFlight, combined_stats
+import metrics
+import quota
+import state
+import upstream
+from validation import ValidationEngine
+from verdicts import VerdictCache, VerdictLog, normalize_query
+from ytapi import YouTubeApiError
+import ytapi
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
 
 load_dotenv()
 CLIENT_ID = os.getenv('CLIENT_ID')
@@ -20,8 +46,6 @@ YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
 app.secret_key = os.getenv('SECRET_KEY')
 
-print(CLIENT_SECRET)
-
 # OAuth2 Configuration
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # Remove this in production
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -57,41 +81,219 @@ youtube_api_key = os.getenv('YOUTUBE_API_KEY')
 if not youtube_api_key:
     raise EnvironmentError("Error: YOUTUBE_API_KEY is not set in environment variables.")
 
-youtube = build('youtube', 'v3', developerKey=youtube_api_key)
+# googleapiclient services are not thread-safe (httplib2), so each thread builds its own on
+# first use, from the discovery document bundled with the library (no network fetch)
+youtube_local = threading.local()
+
+def youtube_client_options():
+    # YOUTUBE_API_BASE (e.g. a local stand-in server) also redirects the googleapiclient service
+    if ytapi.API_BASE.endswith('/youtube/v3') and not ytapi.API_BASE.startswith('https://www.googleapis.com'):
+        return {'api_endpoint': ytapi.API_BASE[:-len('youtube/v3')]}
+    return None
+
+def get_youtube():
+    youtube = getattr(youtube_local, 'youtube', None)
+    if youtube is None:
+        from googleapiclient.discovery import build
+        youtube = youtube_local.youtube = build('youtube', 'v3', developerKey=youtube_api_key,
+                                                static_discovery=True, cache_discovery=False,
+                                                client_options=youtube_client_options())
+    return youtube
+
+def youtube_http(timeout):
+    # A connection per attempt, so an abandoned attempt gives its guard thread back once
+    # its own deadline passes instead of after upstream.youtube's full timeout
+    import httplib2
+    return httplib2.Http(timeout=timeout)
+
+# Search jobs, one per /api/search call, collected through /api/searchresults
+# With a shared STATE_BACKEND, jobs can be collected through any worker process
+search_jobs = JobQueue(
+    max_workers=int(os.getenv('SEARCH_WORKERS', '4')),
+    max_pending=int(os.getenv('SEARCH_MAX_PENDING', '64')),
+    ttl=int(os.getenv('SEARCH_RESULT_TTL', '300')),
+    results=state.shared_cache('job')
+)
 
-# In-memory store for search results
-recent_search = {
-    'query': None,
-    'results': []
+# YouTube search results, served stale while a background refresh runs
+search_cache = SWRCache(
+    ttl=int(os.getenv('SEARCH_CACHE_TTL', '3600')),
+    stale_ttl=int(os.getenv('SEARCH_CACHE_STALE_TTL', '86400')),
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', '2000')),
+    max_bytes=int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    # Background refreshes are the first thing dropped when quota runs low
+    refresh_allowed=lambda: quota.ledger.allow(quota.LOW, SEARCH_QUOTA_COST),
+    store=state.shared_cache('search')
+)
+
+# Uploads playlist of each channel (practically never changes) and each channel's video list,
+# shared by every client browsing the channel
+uploads_playlist_cache = (state.shared_cache('uploads_playlist', ttl=30 * 86400)
+                          or LRUCache(max_entries=1000, ttl=30 * 86400))
+channel_videos_cache = (state.shared_cache('channel_videos', ttl=int(os.getenv('CHANNEL_CACHE_TTL', '3600')))
+                        or LRUCache(max_entries=int(os.getenv('CHANNEL_CACHE_SIZE', '200')),
+                                    ttl=int(os.getenv('CHANNEL_CACHE_TTL', '3600'))))
+
+# Search pages are loaded one ahead of the page being viewed
+SEARCH_PREFETCH = os.getenv('SEARCH_PREFETCH', '1') == '1'
+prefetch_pool = ThreadPoolExecutor(max_workers=int(os.getenv('PREFETCH_WORKERS', '2')),
+                                   thread_name_prefix='search-prefetch')
+SEARCH_PREFETCHES = metrics.Counter('focustube_search_prefetch_total', 'Search pages loaded ahead of the client.',
+                                    ['outcome'])
+
+# YouTube page tokens, passed back to /api/search as `cursor`
+CURSOR_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+# Longest a /api/searchresults request is held open waiting for a job
+LONG_POLL_TIMEOUT = 25
+
+# Seconds a search job may spend on GPT and YouTube in total before it falls back
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE', '10'))
+
+# Default and largest page of /api/library/search results
+LIBRARY_PAGE_SIZE = 20
+LIBRARY_MAX_PAGE_SIZE = 100
+
+# Largest page of /api/channels/<id>/videos, also the default
+CHANNEL_VIDEOS_MAX_PAGE_SIZE = 5000
+
+# Quota units charged per youtube.search().list call
+SEARCH_QUOTA_COST = 100
+
+# Hedge slow searches like other YouTube calls; each hedge spends SEARCH_QUOTA_COST more units
+HEDGE_SEARCH = os.getenv('HEDGE_SEARCH', '0') == '1'
+
+# Speculative mode: run the YouTube search alongside GPT validation instead of after it.
+# Cuts latency to max(GPT, YouTube) at the price of quota spent on denied queries.
+SPECULATIVE_SEARCH = os.getenv('SPECULATIVE_SEARCH', '0') == '1'
+speculation_pool = ThreadPoolExecutor(max_workers=int(os.getenv('SPECULATION_WORKERS', '4')),
+                                      thread_name_prefix='speculative-search')
+speculation_lock = threading.Lock()
+FALLBACKS = metrics.Counter('focustube_fallbacks_total', 'Answers given without the upstream that failed or timed out.',
+                            ['kind'])
+speculation_stats = {
+    'enabled': SPECULATIVE_SEARCH,
+    'speculative_searches': 0,
+    'cancelled_searches': 0,
+    'wasted_searches': 0,
+    'wasted_quota_units': 0
 }
 
 # Load and save JSON Data
 def load_json(filename, key):
-    file_path = os.path.join(BASE_DIR, filename)
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            return data.get(key, [])
-    except FileNotFoundError:
-        return []
+    with metrics.STORAGE_LATENCY.time(operation='load_json', file=filename):
+        return get_catalog(BASE_DIR, filename, key).items()
 
 def save_json(filename, key, items):
-    data = {key: items}
-    file_path = os.path.join(BASE_DIR, filename)
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    with metrics.STORAGE_LATENCY.time(operation='save_json', file=filename):
+        storage.write_items(os.path.join(BASE_DIR, filename), key, items)
+
+def add_json_item(filename, key, item, id_field):
+    with metrics.STORAGE_LATENCY.time(operation='save_json', file=filename):
+        return storage.add_item(os.path.join(BASE_DIR, filename), key, item, id_field)
+
+def remove_json_item(filename, key, id_field, value):
+    with metrics.STORAGE_LATENCY.time(operation='save_json', file=filename):
+        return storage.remove_item(os.path.join(BASE_DIR, filename), key, id_field, value)
+
+
+# Identical validations and searches in flight at the same time share one upstream call
+# across threads. With several worker processes, set SINGLEFLIGHT_DIR to a directory they
+# share to coalesce across them too (each call then takes a file lock and writes its result)
+SINGLEFLIGHT_DIR = os.getenv('SINGLEFLIGHT_DIR') or None
+validation_flight = SingleFlight('validation', SINGLEFLIGHT_DIR)
+search_flight = SingleFlight('search', SINGLEFLIGHT_DIR)
+flights = [validation_flight, search_flight]
+
+# GPT verdicts for previously seen queries, persisted so restarts start warm
+verdict_cache = VerdictCache(
+    FILTERS,
+    max_entries=int(os.getenv('VERDICT_CACHE_SIZE', '10000')),
+    allow_ttl=int(os.getenv('VERDICT_ALLOW_TTL', str(7 * 86400))),
+    deny_ttl=int(os.getenv('VERDICT_DENY_TTL', '86400')),
+    path=os.getenv('VERDICT_CACHE_FILE', os.path.join(BASE_DIR, 'verdict_cache.json')) or None,
+    shared=state.shared_cache('verdict')
+)
+atexit.register(verdict_cache.save)
+
+# Every GPT verdict, kept to train and evaluate the local classifier
+verdict_log = VerdictLog(os.getenv('VERDICT_LOG_FILE', os.path.join(BASE_DIR, 'verdict_log.jsonl')))
 
+# Local fast path in front of GPT: answers confident cases, defers the rest
+LOCAL_CLASSIFIER = os.getenv('LOCAL_CLASSIFIER', '1') == '1'
+query_classifier = QueryClassifier(
+    FILTERS,
+    allow_threshold=float(os.getenv('CLASSIFIER_ALLOW_THRESHOLD', '0.95')),
+    deny_threshold=float(os.getenv('CLASSIFIER_DENY_THRESHOLD', '0.05'))
+)
+if LOCAL_CLASSIFIER:
+    # Trained off the startup path; until then every query is deferred to GPT or the term index
+    threading.Thread(target=lambda: query_classifier.fit(verdict_log.read()), daemon=True).start()
+
+# Near-duplicate queries ("learn python", "python learning") reuse each other's verdict and
+# results. Pages matching at SIMILAR_REUSE_THRESHOLD or more are served as they are; from
+# SIMILAR_REFRESH_THRESHOLD they are served while the query's own page loads for next time
+SIMILAR_QUERIES = os.getenv('SIMILAR_QUERIES', '1') == '1'
+SIMILAR_VERDICT_THRESHOLD = float(os.getenv('SIMILAR_VERDICT_THRESHOLD', '0.85'))
+SIMILAR_REUSE_THRESHOLD = float(os.getenv('SIMILAR_REUSE_THRESHOLD', '0.9'))
+SIMILAR_REFRESH_THRESHOLD = float(os.getenv('SIMILAR_REFRESH_THRESHOLD', '0.8'))
+similar_queries = SimilarityIndex(max_entries=int(os.getenv('SIMILAR_INDEX_SIZE', '20000')))
+if SIMILAR_QUERIES:
+    threading.Thread(target=lambda: similar_queries.fit(query for query, _ in verdict_log.read()),
+                     daemon=True).start()
+similar_lock = threading.Lock()
+similar_stats = {
+    'enabled': SIMILAR_QUERIES,
+    'verdict_reuses': 0,
+    'search_reuses': 0,
+    'search_refreshes': 0,
+    'quota_units_saved': 0
+}
 
-# Allowed filters for query validation
-FILTERS = (
-    "computer science, programming, software engineering, anything I'd study at the Faculty of Organizational Sciences "
-    "in Belgrade (operations research, management, IT-related topics), learning guitar. "
-    "Basically anything that has to do with tech, science, learning to play guitar, music in general, ex-yu rock is good"
+# Cache, queue, quota and classifier state, read at scrape time by /metrics
+metrics.register_cache('verdicts', verdict_cache.stats)
+metrics.register_cache('search', search_cache.stats)
+metrics.register_cache('channel_videos', channel_videos_cache.stats)
+metrics.Callback('focustube_search_jobs_pending', 'Search jobs queued or running.',
+                 lambda: [({}, search_jobs.pending)])
+metrics.Callback('focustube_youtube_quota_remaining', 'YouTube quota units left today.',
+                 lambda: [({}, quota.ledger.remaining())])
+metrics.Callback('focustube_classifier_decisions_total', 'Local classifier outcomes.',
+                 lambda: [({'outcome': k}, v) for k, v in query_classifier.stats().items()
+                          if k in ('local_allow', 'local_deny', 'deferred')], type='counter')
+metrics.Callback('focustube_singleflight_total', 'Upstream calls made and requests coalesced onto them.',
+                 lambda: [({'flight': name, 'outcome': outcome}, stats[outcome])
+                          for name, stats in combined_stats(flights).items()
+                          for outcome in ('calls', 'coalesced', 'coalesced_shared')], type='counter')
+
+# Keeps the library index, and the channel videos served from it, up to date (first pass
+# after LIBRARY_SYNC_DELAY seconds, so importing the app makes no YouTube calls)
+library_sync.start()
+
+metrics.Callback('focustube_speculation_total', 'Speculative search outcomes.',
+                 lambda: [({'outcome': k}, v) for k, v in speculation_stats.items() if k != 'enabled'],
+                 type='counter')
+metrics.Callback('focustube_similar_reuse_total', 'Verdicts and search pages reused from near-duplicate queries.',
+                 lambda: [({'kind': k}, v) for k, v in similar_stats.items() if k != 'enabled'],
+                 type='counter')
+
+# Builds the GPT validation requests: a fixed instructions-and-filters prefix, the query,
+# and a one-word answer
+validation_engine = ValidationEngine(
+    FILTERS,
+    model=os.getenv('GPT_MODEL', 'gpt-4o-mini'),
+    max_tokens=int(os.getenv('GPT_MAX_TOKENS', '2')),
+    logprobs=os.getenv('GPT_LOGPROBS', '0') == '1'
 )
 
+# With GPT_LOGPROBS, less certain verdicts are still served but not used to train the classifier
+GPT_MIN_CONFIDENCE = float(os.getenv('GPT_MIN_CONFIDENCE', '0.9'))
+
 def validate_query(query: str) -> bool:
     """
     Validates the query using GPT to determine if it matches the allowed filters.
+    Verdicts are cached per normalized query, so repeated queries skip GPT, and
+    queries the local classifier is confident about never reach it.
     
     Args:
         query (str): The search query to validate.
@@ -99,51 +301,264 @@ def validate_query(query: str) -> bool:
     Returns:
         bool: True if the query is allowed, False otherwise.
     """
-    init_prompt = (
-        "I will be sending you YouTube query requests for my focus YouTube wrapper, then a filter, "
-        "then the query to test. You need to respond with ALLOW if you think the query should run or DENY if the query "
-        "doesn't match the filters. Below I will provide the filters. "
-        "The query must only be about:"
-    )
+    known = known_verdict(query)
+    if known is not None:
+        return known
 
-    full_prompt = f"{init_prompt} {FILTERS} Query: {query}"
+    if upstream.openai.degraded():
+        return fallback_verdict(query)
 
     try:
-        gpt_response = askGpt(full_prompt)
-        return gpt_response == 'ALLOW'
+        # Concurrent identical queries wait for one GPT call
+        allowed = validation_flight.do(normalize_query(query) or query, lambda: validate_upstream(query))
+        verdict_cache.set(query, allowed)
+        return allowed
     except Exception as e:
-        print(f"GPT validation failed: {e}")
-        return False
+        app.logger.warning("GPT validation failed: %s", e)
+        return fallback_verdict(query)
+
+def fallback_verdict(query: str) -> bool:
+    """
+    Verdict for when GPT is down or too slow: the local classifier's confident verdict,
+    else DENY (a focus app fails closed).
+    Not cached, so GPT decides the query once it is back.
+    """
+    guess = query_classifier.guess(query) if LOCAL_CLASSIFIER else None
+    FALLBACKS.inc(kind='verdict_denied' if guess is None else 'verdict_classifier')
+    return bool(guess)
+
+def validate_upstream(query: str) -> bool:
+    verdict = verdict_batcher.validate(query) if GPT_BATCHING else validate_single(query)
+    record_verdict(query, verdict)
+    return verdict.allowed
+
+def complete(args):
+    with metrics.upstream_call('openai', 'chat.completions'):
+        return upstream.openai.call('chat.completions', lambda timeout: gpt.complete(args, timeout))
+
+def validate_single(query: str):
+    """
+    Returns:
+        Verdict: GPT's verdict on one query. Raises UnparseableVerdict on any other reply.
+    """
+    return validation_engine.verdict(complete(validation_engine.request(query)))
+
+def validate_batch(queries):
+    return validation_engine.batch_verdicts(complete(validation_engine.batch_request(queries)), len(queries))
+
+def known_verdict(query: str):
+    """
+    Returns:
+        bool: The cached or locally classified verdict, or None if GPT has to decide.
+    """
+    cached = verdict_cache.get(query)
+    if cached is not None:
+        return cached
+
+    similar = similar_verdict(query)
+    if similar is not None:
+        return similar
+
+    if LOCAL_CLASSIFIER:
+        return query_classifier.classify(query)
+    return None
+
+def similar_verdict(query: str):
+    """
+    Returns:
+        bool: The cached verdict of a near-duplicate query, or None. A query naming an
+        off-topic term never borrows an ALLOW, nor one naming an on-topic term a DENY.
+    """
+    if not SIMILAR_QUERIES:
+        return None
+    match = similar_queries.find(query, SIMILAR_VERDICT_THRESHOLD, verdict_cache.peek)
+    if match is None or query_classifier.term_signal(query) == (-1 if match.value else 1):
+        return None
+    with similar_lock:
+        similar_stats['verdict_reuses'] += 1
+    return match.value
+
+def record_verdict(query: str, verdict):
+    # Once per GPT verdict, however many requests were waiting on it
+    verdict_log.append(query, verdict.allowed, verdict.confidence)
+    # Only queries with a verdict or page of their own are indexed, so matches never drift
+    if SIMILAR_QUERIES:
+        similar_queries.add(query)
+    if LOCAL_CLASSIFIER and (verdict.confidence is None or verdict.confidence >= GPT_MIN_CONFIDENCE):
+        query_classifier.add_example(query, verdict.allowed)
+
+# Queries validated within a few milliseconds of each other share one GPT request
+GPT_BATCHING = os.getenv('GPT_BATCHING', '1') == '1'
+verdict_batcher = VerdictBatcher(
+    validate_batch, validate_single,
+    window=float(os.getenv('GPT_BATCH_WINDOW_MS', '30')) / 1000,
+    max_batch=int(os.getenv('GPT_BATCH_SIZE', '20'))
+)
+metrics.Callback('focustube_gpt_batching_total', 'Queries validated through the GPT batcher and requests it made.',
+                 lambda: [({'kind': k}, v) for k, v in verdict_batcher.stats().items()
+                          if k in ('queries', 'calls', 'batches', 'fallbacks')], type='counter')
 
-def perform_youtube_search(query: str):
+def perform_youtube_search(query: str, cursor=None):
     """
     Performs a YouTube search using the YouTube Data API.
+    Results are cached per query and page; stale entries are returned at once and refreshed
+    in the background. When quota runs low or YouTube is down, any cached copy is preferred
+    over a new call, and a failed call is answered with whatever copy is left.
     
     Args:
         query (str): The search query.
+        cursor (str): YouTube page token of the page to fetch; None for the first page.
         
     Returns:
-        list: A list of dictionaries containing video IDs and titles.
+        dict: 'results' (video IDs and titles) and 'next_cursor', or None on failure.
     """
+    key = search_cache_key(query, page_token=cursor)
+    if cursor is None and search_cache.peek(key) is None:
+        page = similar_search_page(query)
+        if page is not None:
+            return page
     try:
-        request = youtube.search().list(
+        prefer_stale = not quota.ledger.allow(quota.NORMAL, SEARCH_QUOTA_COST) or upstream.youtube.degraded()
+        return search_cache.get_or_load(key, lambda: load_search_page(query, cursor), prefer_stale=prefer_stale)
+    except Exception as e:
+        app.logger.warning("YouTube search failed: %s", e)
+        return stale_search_page(key)
+
+def similar_page(query: str):
+    """
+    Returns:
+        Match: The near-duplicate query with a cached first page (the Match value), or None.
+    """
+    if not SIMILAR_QUERIES:
+        return None
+    return similar_queries.find(query, SIMILAR_REFRESH_THRESHOLD,
+                                lambda similar: search_cache.peek(search_cache_key(similar)))
+
+def similar_search_page(query: str):
+    """
+    The cached first page of a near-duplicate query, marked with 'similar_to', or None.
+    Its next_cursor still works: YouTube search page tokens only encode the offset.
+    Looser matches are served while the query's own page loads in the background, as
+    LOW priority quota spend.
+    """
+    match = similar_page(query)
+    if match is None:
+        return None
+    refresh = match.similarity < SIMILAR_REUSE_THRESHOLD and quota.ledger.allow(quota.LOW, SEARCH_QUOTA_COST)
+    if refresh:
+        prefetch_pool.submit(load_own_page, query)
+    with similar_lock:
+        if refresh:
+            similar_stats['search_refreshes'] += 1
+        else:
+            similar_stats['search_reuses'] += 1
+            similar_stats['quota_units_saved'] += SEARCH_QUOTA_COST
+    return {**match.value, 'similar_to': match.query}
+
+def load_own_page(query: str):
+    try:
+        page = load_search_page(query)
+    except Exception as e:
+        app.logger.warning("Loading the results of %r failed: %s", query, e)
+        return
+    if page and page['results']:
+        search_cache.set(search_cache_key(query), page)
+        similar_queries.add(query)
+
+def stale_search_page(key):
+    page = search_cache.stale(key)
+    if page is not None:
+        FALLBACKS.inc(kind='search_stale')
+    return page
+
+def load_search_page(query: str, cursor=None):
+    key = search_cache_key(query, page_token=cursor)
+    return search_flight.do(key, lambda: search_youtube(query, page_token=cursor))
+
+def search_cache_key(query: str, max_results=10, page_token=None):
+    key = f"video:{max_results}:{' '.join(query.lower().split())}"
+    return f"{key}:{page_token}" if page_token else key
+
+def search_youtube(query: str, max_results=10, page_token=None):
+    """
+    Calls youtube.search().list without caching. Raises on API errors and when the
+    daily quota budget is used up.
+
+    Returns:
+        dict: 'results' and 'next_cursor', the page token of the following page (or None).
+    """
+    if not quota.ledger.allow(quota.HIGH, SEARCH_QUOTA_COST):
+        raise YouTubeApiError(429, 'Daily YouTube quota budget exhausted.')
+    # Attempts run on the guard's threads; the quota is charged to this thread's route
+    route = quota.current_route()
+
+    def attempt(timeout):
+        # Every attempt, a hedge included, is a search.list call of its own, built on the
+        # attempt's thread (HttpRequest objects are not thread-safe)
+        request = get_youtube().search().list(
             part='snippet',
             q=query,
             type='video',
-            maxResults=10  # Adjust as needed
+            maxResults=max_results,  # Adjust as needed
+            pageToken=page_token
         )
-        response = request.execute()
-        results = [
+        quota.ledger.record('search', SEARCH_QUOTA_COST, route)
+        return request.execute(http=youtube_http(timeout))
+
+    try:
+        with metrics.upstream_call('youtube', 'search'):
+            response = upstream.youtube.call('search', attempt, hedge=HEDGE_SEARCH)
+    except Exception as e:
+        if 'quotaExceeded' in str(e):
+            quota.ledger.mark_exhausted()
+        raise
+    return search_page(response)
+
+def search_page(response):
+    return {
+        'results': [
             {
                 'videoId': item['id']['videoId'],
                 'title': item['snippet']['title']
             }
             for item in response.get('items', [])
-        ]
-        return results
+        ],
+        'next_cursor': response.get('nextPageToken')
+    }
+
+def prefetch_cursor(query: str, page):
+    """
+    Returns:
+        str: The cursor of the page after `page` if it is worth loading ahead of the
+        client asking for it, else None. Prefetching is LOW priority quota spend.
+    """
+    cursor = page.get('next_cursor')
+    # A page borrowed from a near-duplicate query saved a call; its next page waits to be asked for
+    if 'similar_to' in page:
+        return None
+    if (not SEARCH_PREFETCH or not cursor or search_cache.peek(search_cache_key(query, page_token=cursor)) is not None
+            or not quota.ledger.allow(quota.LOW, SEARCH_QUOTA_COST)):
+        return None
+    return cursor
+
+def prefetch_next_page(query: str, page):
+    """
+    Loads the page after `page` into the search cache in the background, so the client's
+    request for it is answered from the cache.
+    """
+    cursor = prefetch_cursor(query, page)
+    if cursor is not None:
+        prefetch_pool.submit(prefetch_page, query, cursor)
+
+def prefetch_page(query: str, cursor):
+    try:
+        page = load_search_page(query, cursor)
     except Exception as e:
-        print(f"YouTube search failed: {e}")
-        return []
+        app.logger.warning("Prefetching the next page of %r failed: %s", query, e)
+        SEARCH_PREFETCHES.inc(outcome='failed')
+        return
+    search_cache.set(search_cache_key(query, page_token=cursor), page)
+    SEARCH_PREFETCHES.inc(outcome='fetched')
 
 
 
@@ -194,11 +609,8 @@ def add_playlist():
     if not name or not playlist_id:
         return 'Name and Playlist ID are required', 400
 
-    playlists = load_json('playlists.json', 'playlists')
-    # Check for duplication
-    if not any(p['id'] == playlist_id for p in playlists):
-        playlists.append({'name': name, 'id': playlist_id})
-        save_json('playlists.json', 'playlists', playlists)
+    # Skipped if a playlist with this ID already exists
+    add_json_item('playlists.json', 'playlists', {'name': name, 'id': playlist_id}, 'id')
 
     return redirect(url_for('admin'))
 
@@ -208,9 +620,8 @@ def remove_playlist():
         return redirect(url_for('google.login'))
 
     playlist_id = request.form.get('playlist_id')
-    playlists = load_json('playlists.json', 'playlists')
-    updated_playlists = [p for p in playlists if p['id'] != playlist_id]
-    save_json('playlists.json', 'playlists', updated_playlists)
+    remove_json_item('playlists.json', 'playlists', 'id', playlist_id)
+    library.remove_source(playlist_id)
     return redirect(url_for('admin'))
 
 
@@ -227,11 +638,8 @@ def add_channel():
     if not channel_name or not channel_id:
         return 'Channel Name and Channel ID are required', 400
 
-    channels = load_json('channels.json', 'channels')
-    # Check for duplication
-    if not any(c['channel_id'] == channel_id for c in channels):
-        channels.append({'name': channel_name, 'channel_id': channel_id})
-        save_json('channels.json', 'channels', channels)
+    # Skipped if a channel with this ID already exists
+    add_json_item('channels.json', 'channels', {'name': channel_name, 'channel_id': channel_id}, 'channel_id')
 
     return redirect(url_for('admin'))
 
@@ -241,67 +649,341 @@ def remove_channel():
         return redirect(url_for('google.login'))
 
     channel_id = request.form.get('channel_id')
-    channels = load_json('channels.json', 'channels')
-    updated_channels = [c for c in channels if c['channel_id'] != channel_id]
-    save_json('channels.json', 'channels', updated_channels)
+    remove_json_item('channels.json', 'channels', 'channel_id', channel_id)
+    library.remove_source(channel_id)
     return redirect(url_for('admin'))
 
 @app.route('/api/search', methods=['GET'])
 def search():
     """
-    Endpoint to handle search requests.
+    Endpoint to start a search.
     
     Expects a query parameter:
     /api/search?query=your+search+query
     
+    Later pages are requested with the `next_cursor` of the previous page:
+    /api/search?query=your+search+query&cursor=...
+    
+    Optional focus filters, which also add 'duration' (seconds), 'views' and 'likes' to each result:
+    /api/search?query=...&min_duration=600&max_duration=3600&exclude_shorts=1&sort=-views
+    /api/search?query=...&details=1   (details only)
+    
     Returns:
-        JSON response indicating success or an error message.
+        JSON response with the job id to pass to /api/searchresults, or an error message.
     """
     query = request.args.get('query', '').strip()
     if not query:
         return jsonify({'error': 'Missing or empty "query" parameter.'}), 400
+    cursor = request.args.get('cursor') or None
+    if cursor is not None and not valid_cursor(cursor):
+        return jsonify({'error': 'Invalid "cursor" parameter.'}), 400
+    try:
+        focus = enrich.parse_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter parameter.'}), 400
+
+    # The job's YouTube calls are charged to this endpoint, not to the job pool
+    job = search_jobs.submit(query, run_search_within_deadline, query, cursor, focus, request.endpoint)
+    if job is None:
+        return jsonify({'error': 'Too many searches in progress, try again shortly.'}), 503
+
+    return jsonify({'message': 'Search started.', 'query': query, 'job_id': job.id}), 202
+
+def valid_cursor(cursor):
+    return CURSOR_PATTERN.fullmatch(cursor) is not None
+
+def run_search_within_deadline(query, cursor=None, focus=None, route=None):
+    with upstream.deadline(SEARCH_DEADLINE), quota.route(route):
+        return run_search(query, cursor, focus)
+
+def run_search(query, cursor=None, focus=None):
+    """
+    Validates and runs a search. Executed on the search job pool.
+    The verdict is cached, so later pages of an allowed query skip GPT.
+    Focus filters are applied to the cached page, so a page they empty still has its next_cursor.
+    
+    Returns:
+        tuple: JSON payload and HTTP status code for the job.
+    """
+    if cursor is None and SPECULATIVE_SEARCH and should_speculate(query):
+        return run_speculative_search(query, focus)
 
     if not validate_query(query):
-        return jsonify({'error': 'Query does not match the allowed filters.'}), 403
+        return {'error': 'Query does not match the allowed filters.'}, 403
+
+    page = perform_youtube_search(query, cursor)
+    if not page or not page['results']:
+        return {'error': 'No results found or an error occurred during the search.'}, 500
+
+    remember_search(query, cursor, page)
+    prefetch_next_page(query, page)
+    return search_payload(query, filtered_page(page, focus)), 200
+
+def remember_search(query, cursor, page):
+    # Queries allowed without GPT join the similarity index once they have results of their own
+    if SIMILAR_QUERIES and cursor is None and 'similar_to' not in page:
+        similar_queries.add(query)
+
+def search_payload(query, page):
+    payload = {'query': query, 'results': page['results'], 'next_cursor': page['next_cursor']}
+    if 'similar_to' in page:
+        # Results of the near-duplicate query named here
+        payload['similar_to'] = page['similar_to']
+    return payload
+
+def filtered_page(page, focus):
+    if focus is None:
+        return page
+    return {**page, 'results': enrich.enrich_videos(page['results'], focus)}
+
+def should_speculate(query):
+    """
+    Speculation only pays off when both the verdict and the results would go upstream,
+    and is the first quota spend dropped when the budget runs low.
+    """
+    return (verdict_cache.peek(query) is None and search_cache.peek(search_cache_key(query)) is None
+            and similar_page(query) is None and quota.ledger.allow(quota.LOW, SEARCH_QUOTA_COST))
 
-    results = perform_youtube_search(query)
-    if not results:
-        return jsonify({'error': 'No results found or an error occurred during the search.'}), 500
+def run_speculative_search(query, focus=None):
+    """
+    Runs GPT validation and the YouTube search in parallel.
+    
+    The search result is only cached and returned once the query is allowed; on DENY it
+    is cancelled, or discarded and counted as wasted quota if it already started.
+    """
+    # The search runs under this job's deadline
+    future = speculation_pool.submit(contextvars.copy_context().run, search_youtube, query)
+    with speculation_lock:
+        speculation_stats['speculative_searches'] += 1
+
+    if not validate_query(query):
+        with speculation_lock:
+            if future.cancel():
+                speculation_stats['cancelled_searches'] += 1
+            else:
+                speculation_stats['wasted_searches'] += 1
+                speculation_stats['wasted_quota_units'] += SEARCH_QUOTA_COST
+        return {'error': 'Query does not match the allowed filters.'}, 403
 
-    # Update the recent search with the current query and its results
-    recent_search['query'] = query
-    recent_search['results'] = results
+    try:
+        page = future.result()
+    except Exception as e:
+        app.logger.warning("YouTube search failed: %s", e)
+        page = None
+    if not page or not page['results']:
+        return {'error': 'No results found or an error occurred during the search.'}, 500
 
-    return jsonify({'message': 'Search successful.', 'query': query, 'number_of_results': len(results)}), 200
+    search_cache.set(search_cache_key(query), page)
+    remember_search(query, None, page)
+    prefetch_next_page(query, page)
+    return search_payload(query, filtered_page(page, focus)), 200
 
 @app.route('/api/searchresults', methods=['GET'])
 def get_search_results():
     """
-    Endpoint to retrieve the most recent search results.
+    Endpoint to retrieve the results of a search job (long-poll).
+    
+    Expects query parameters:
+    /api/searchresults?job_id=...&wait=25
+    
+    The request is held open until the job finishes or `wait` seconds pass.
     
     Returns:
-        JSON response with video IDs and titles, or an error message if no search has been performed.
+        JSON response with video IDs and titles and the `next_cursor` of the following
+        page (null on the last one), 202 if the job is still running, or an error message.
     """
-    if not recent_search['query']:
-        return jsonify({'error': 'No search has been performed yet.'}), 404
+    job_id = request.args.get('job_id', '')
+    if not job_id:
+        return jsonify({'error': 'Missing "job_id" parameter.'}), 400
 
-    return jsonify({
-        'query': recent_search['query'],
-        'results': recent_search['results']
-    }), 200
+    try:
+        wait = min(float(request.args.get('wait', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+    except ValueError:
+        wait = LONG_POLL_TIMEOUT
+
+    job = search_jobs.wait(job_id, max(wait, 0))
+    if job is None:
+        return jsonify({'error': 'Unknown or expired search job.'}), 404
+    if not job.done.is_set():
+        return jsonify({'status': 'pending', 'job_id': job.id}), 202
+
+    return jsonify(job.payload), job.status_code
+
+@app.route('/api/searchresults/<job_id>/events', methods=['GET'])
+def stream_search_results(job_id):
+    """
+    Server-Sent Events variant of /api/searchresults.
+    
+    Emits a single `result` event with the job payload and status as soon as the
+    job finishes, sending keep-alive comments while it runs.
+    """
+    job = search_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired search job.'}), 404
+
+    def events():
+        current = job
+        while True:
+            # Jobs of other worker processes come back as a fresh snapshot on each wait
+            current = search_jobs.wait(job_id, 15) or current
+            if current.done.is_set():
+                break
+            yield ': keep-alive\n\n'
+        data = json.dumps({'status': current.status_code, **current.payload})
+        yield f'event: result\ndata: {data}\n\n'
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 
 
+@app.route('/api/cache/stats')
+def cache_stats():
+    """
+    Endpoint exposing cache hit/miss counters and speculative search costs.
+    
+    Returns:
+        JSON response with the counters of each cache.
+    """
+    with speculation_lock:
+        speculation = dict(speculation_stats)
+    with similar_lock:
+        similar = dict(similar_stats)
+    return jsonify({'verdicts': verdict_cache.stats(), 'search': search_cache.stats(),
+                    'speculation': speculation, 'classifier': query_classifier.stats(),
+                    'batching': {'enabled': GPT_BATCHING, **verdict_batcher.stats()},
+                    'singleflight': combined_stats(flights), 'state': state.stats(),
+                    'upstreams': upstream.stats(), 'similar': {**similar, **similar_queries.stats()}})
+
 @app.route('/api/playlists')
 def api_playlists():
-    playlists = load_json('playlists.json', 'playlists')
-    return jsonify(playlists)
+    return catalog_response(get_catalog(BASE_DIR, 'playlists.json', 'playlists'))
 
 @app.route('/api/channels')
 def api_channels():
-    channels = load_json('channels.json', 'channels')
-    return jsonify(channels)
+    return catalog_response(get_catalog(BASE_DIR, 'channels.json', 'channels'))
+
+@app.route('/api/library/search')
+def library_search():
+    """
+    Endpoint searching the titles and descriptions of every video in the curated
+    channels and playlists. Answered from the local index (see index_library.py),
+    so it needs neither GPT validation nor YouTube quota.
+    
+    Expects a query parameter, optionally narrowed to one channel or playlist:
+    /api/library/search?query=your+search+query&offset=0&limit=20
+    /api/library/search?query=your+search+query&source=<channel or playlist id>
+    
+    Returns:
+        JSON response with the total match count and the requested page of results, best first.
+    """
+    query = request.args.get('query', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing or empty "query" parameter.'}), 400
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', LIBRARY_PAGE_SIZE)), 1), LIBRARY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': '"offset" and "limit" must be integers.'}), 400
+
+    page = library.search(query, offset, limit, request.args.get('source') or None)
+    next_offset = offset + limit if offset + limit < page['total'] else None
+    return jsonify({'query': query, 'offset': offset, 'next_offset': next_offset, **page}), 200
+
+@app.route('/api/channels/<channel_id>/videos')
+def api_channel_videos(channel_id):
+    """
+    Endpoint listing every upload of a curated channel in one round trip.
+    
+    Optional query parameters:
+    /api/channels/<channel_id>/videos?offset=0&limit=500
+    /api/channels/<channel_id>/videos?format=ndjson   (one video per line, streamed as pages arrive)
+    /api/channels/<channel_id>/videos?min_duration=600&exclude_shorts=1&sort=-duration   (see /api/search)
+    
+    Returns:
+        JSON response with the channel's videos, or an error message.
+    """
+    if not any(c['channel_id'] == channel_id for c in load_json('channels.json', 'channels')):
+        return jsonify({'error': 'Unknown channel.'}), 404
+
+    stream = request.args.get('format') == 'ndjson'
+    try:
+        focus = enrich.parse_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter parameter.'}), 400
+    # Checked before any quota is spent
+    try:
+        offset, limit = channel_videos_page(request.args)
+    except ValueError:
+        return jsonify({'error': '"offset" and "limit" must be integers.'}), 400
+    # Synced channels are served from the library first (not cached, so syncs show up at
+    # once, even over an entry cached before the channel was synced)
+    videos = library.source_videos(channel_id)
+    if videos is None:
+        videos = channel_videos_cache.get(channel_id)
+    if videos is None:
+        if not quota.ledger.allow(quota.NORMAL):
+            return jsonify({'error': 'YouTube quota is running low, try again later.'}), 503
+        try:
+            playlist_id = get_uploads_playlist_id(channel_id)
+            if playlist_id is None:
+                return jsonify({'error': 'Channel not found on YouTube.'}), 404
+            pages = ytapi.iter_playlist_pages(playlist_id)
+            if stream:
+                return Response(stream_channel_videos(channel_id, pages, focus), mimetype='application/x-ndjson')
+            videos = [video for page in pages for video in page]
+        except (YouTubeApiError, requests.RequestException) as e:
+            app.logger.warning("Fetching uploads of %s failed: %s", channel_id, e)
+            return jsonify({'error': 'Could not fetch the channel videos.'}), 502
+        channel_videos_cache.set(channel_id, videos)
+
+    if focus is not None:
+        videos = enrich.enrich_videos(videos, focus)
+    if stream:
+        return Response((json.dumps(video) + '\n' for video in videos), mimetype='application/x-ndjson')
+
+    return jsonify({
+        'channel_id': channel_id,
+        'total': len(videos),
+        'offset': offset,
+        'videos': videos[offset:offset + limit]
+    }), 200
+
+def channel_videos_page(args):
+    """
+    Returns:
+        tuple: offset (0 or more) and limit (1..CHANNEL_VIDEOS_MAX_PAGE_SIZE) of a channel
+        videos request. Raises ValueError if either is not an integer.
+    """
+    offset = max(int(args.get('offset', 0)), 0)
+    limit = min(max(int(args.get('limit', CHANNEL_VIDEOS_MAX_PAGE_SIZE)), 1), CHANNEL_VIDEOS_MAX_PAGE_SIZE)
+    return offset, limit
+
+def get_uploads_playlist_id(channel_id):
+    playlist_id = uploads_playlist_cache.get(channel_id)
+    if playlist_id is None:
+        playlist_id = ytapi.get_uploads_playlist_id(channel_id)
+        if playlist_id is not None:
+            uploads_playlist_cache.set(channel_id, playlist_id)
+    return playlist_id
+
+def stream_channel_videos(channel_id, pages, focus=None):
+    """
+    Yields NDJSON lines page by page and caches the full list once every page arrived.
+    Focus filters (and sorting) apply to each page of 50 as it arrives.
+    """
+    videos = []
+    try:
+        for page in pages:
+            videos.extend(page)
+            if focus is not None:
+                page = enrich.enrich_videos(page, focus)
+            yield ''.join(json.dumps(video) + '\n' for video in page)
+    except (YouTubeApiError, requests.RequestException) as e:
+        app.logger.warning("Fetching uploads of %s failed: %s", channel_id, e)
+        yield json.dumps({'error': 'Could not fetch the channel videos.'}) + '\n'
+        return
+    channel_videos_cache.set(channel_id, videos)
 
 @app.route('/api/search')
 def get_search_query():
@@ -311,6 +993,31 @@ def get_search_query():
 
 
 
+@app.route('/admin/quota')
+def admin_quota():
+    """
+    Endpoint showing today's YouTube quota spend per endpoint and route, and the
+    remaining budget.
+    """
+    if not current_user.is_authenticated:
+        return redirect(url_for('google.login'))
+    return jsonify(quota.ledger.snapshot())
+
+@app.route('/admin/sync')
+def admin_sync():
+    """
+    Endpoint showing the library sync: progress of the running pass, and per channel
+    or playlist the time since its last sync, its last change and the quota units spent.
+    """
+    if not current_user.is_authenticated:
+        return redirect(url_for('google.login'))
+    return jsonify(library_sync.status())
+
+@app.before_request
+def set_quota_route():
+    # YouTube calls made while handling this request are charged to its endpoint
+    quota.route_local.name = request.endpoint
+
 @app.route('/logout')
 def logout():
     logout_user()
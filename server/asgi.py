@@ -0,0 +1,473 @@
+# asgi.py
+#
+# Asyncio serving mode. The upstream-heavy routes (/api/search, /api/searchresults and its
+# SSE variant, /api/channels/<id>/videos) run on the event loop with pooled async clients,
+# so a search waiting on GPT or YouTube holds no thread. Their file and database work (caches,
+# verdict log, quota ledger, library) runs on aio.io_pool. Every other request is passed to
+# the Flask app unchanged, through a2wsgi on a small thread pool.
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000
+#
+# Responses have the same status codes and JSON shapes as the Flask routes in app.py.
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import urllib.parse
+import aio
+import app
+import enrich
+import metrics
+import quota
+import state
+import upstream
+from a2wsgi import WSGIMiddleware
+from batcher import AsyncVerdictBatcher
+from jobs import AsyncJobQueue
+from singleflight import AsyncSingleFlight, SharedCallError
+from verdicts import normalize_query
+from ytapi import batches, uploads_playlist
+
+logger = logging.getLogger(__name__)
+
+search_jobs = AsyncJobQueue(
+    max_pending=int(os.getenv('ASYNC_SEARCH_MAX_PENDING', '1024')),
+    ttl=int(os.getenv('SEARCH_RESULT_TTL', '300')),
+    results=state.shared_cache('job')
+)
+validation_flight = AsyncSingleFlight('validation', app.SINGLEFLIGHT_DIR)
+search_flight = AsyncSingleFlight('search', app.SINGLEFLIGHT_DIR)
+app.flights += [validation_flight, search_flight]
+
+metrics.Callback('focustube_async_search_jobs_pending', 'Search jobs running on the event loop.',
+                 lambda: [({}, search_jobs.pending)])
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope['path']
+        self.args = {k: v[0] for k, v in urllib.parse.parse_qs(scope['query_string'].decode('latin-1')).items()}
+
+
+class StreamingResponse:
+    def __init__(self, chunks, mimetype, headers=None):
+        self.chunks = chunks
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+
+def encode_headers(mimetype, extra=None):
+    headers = {'content-type': mimetype, 'access-control-allow-origin': '*'}
+    headers.update(extra or {})
+    return [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]
+
+
+async def send_json(send, payload, status):
+    # Same encoding as Flask's jsonify
+    body = (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': encode_headers('application/json', {'content-length': len(body)})})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_stream(send, response):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': encode_headers(response.mimetype, response.headers)})
+    async for chunk in response.chunks:
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+# Search
+
+async def search(request):
+    query = request.args.get('query', '').strip()
+    if not query:
+        return {'error': 'Missing or empty "query" parameter.'}, 400
+    cursor = request.args.get('cursor') or None
+    if cursor is not None and not app.valid_cursor(cursor):
+        return {'error': 'Invalid "cursor" parameter.'}, 400
+    try:
+        focus = enrich.parse_filters(request.args)
+    except ValueError:
+        return {'error': 'Invalid filter parameter.'}, 400
+
+    job = search_jobs.submit(query, run_search, query, cursor, focus)
+    if job is None:
+        return {'error': 'Too many searches in progress, try again shortly.'}, 503
+
+    return {'message': 'Search started.', 'query': query, 'job_id': job.id}, 202
+
+
+async def run_search(query, cursor=None, focus=None):
+    # Tasks started below (batched GPT calls, speculative searches) inherit the deadline
+    with upstream.deadline(app.SEARCH_DEADLINE):
+        return await run_search_within_deadline(query, cursor, focus)
+
+
+async def run_search_within_deadline(query, cursor=None, focus=None):
+    if cursor is None and app.SPECULATIVE_SEARCH and await aio.blocking(app.should_speculate, query):
+        return await run_speculative_search(query, focus)
+
+    if not await validate_query(query):
+        return {'error': 'Query does not match the allowed filters.'}, 403
+
+    page = await perform_youtube_search(query, cursor)
+    if not page or not page['results']:
+        return {'error': 'No results found or an error occurred during the search.'}, 500
+
+    app.remember_search(query, cursor, page)
+    prefetch_next_page(query, page)
+    return app.search_payload(query, await filtered_page(page, focus, 'search')), 200
+
+
+async def filtered_page(page, focus, route):
+    if focus is None:
+        return page
+    return {**page, 'results': await enrich_videos(page['results'], focus, route)}
+
+
+async def enrich_videos(videos, focus, route):
+    """
+    Event loop version of enrich.enrich_videos; the videos.list batches go out concurrently.
+    """
+    async def fetch(batch):
+        response = await aio.youtube_call('videos', route, part=enrich.DETAIL_PARTS, id=','.join(batch),
+                                          maxResults=len(batch))
+        await aio.blocking(enrich.store, batch, response)
+
+    # The details cache is persisted or shared
+    missing = await aio.blocking(enrich.missing_ids, videos)
+    try:
+        await asyncio.gather(*(fetch(batch) for batch in batches(missing)))
+    except aio.UPSTREAM_ERRORS as e:
+        logger.warning("Fetching video details failed: %r", e)
+    return enrich.apply_filters(await aio.blocking(enrich.annotate, videos), focus)
+
+
+async def validate_query(query):
+    # The verdict cache may be persisted or shared
+    known = await aio.blocking(app.known_verdict, query)
+    if known is not None:
+        return known
+    if upstream.openai.degraded():
+        return app.fallback_verdict(query)
+
+    try:
+        allowed = await validation_flight.do(normalize_query(query) or query, lambda: validate_upstream(query))
+    except Exception as e:
+        logger.warning("GPT validation failed: %r", e)
+        return app.fallback_verdict(query)
+    await aio.blocking(app.verdict_cache.set, query, allowed)
+    return allowed
+
+
+async def validate_upstream(query):
+    if app.GPT_BATCHING:
+        verdict = await verdict_batcher.validate(query)
+    else:
+        verdict = await validate_single(query)
+    # Appends to the verdict log
+    await aio.blocking(app.record_verdict, query, verdict)
+    return verdict.allowed
+
+
+async def validate_single(query):
+    engine = app.validation_engine
+    return engine.verdict(await aio.complete(engine.request(query)))
+
+
+async def validate_batch(queries):
+    engine = app.validation_engine
+    return engine.batch_verdicts(await aio.complete(engine.batch_request(queries)), len(queries))
+
+
+verdict_batcher = AsyncVerdictBatcher(validate_batch, validate_single,
+                                      window=app.verdict_batcher.window, max_batch=app.verdict_batcher.max_batch)
+metrics.Callback('focustube_async_gpt_batching_total', 'Queries validated through the event loop GPT batcher and requests it made.',
+                 lambda: [({'kind': k}, v) for k, v in verdict_batcher.stats().items()
+                          if k in ('queries', 'calls', 'batches', 'fallbacks')], type='counter')
+
+
+async def perform_youtube_search(query, cursor=None):
+    key = app.search_cache_key(query, page_token=cursor)
+    found, page = await aio.blocking(cached_search_page, query, cursor)
+    if found:
+        return page
+    try:
+        page = await load_search_page(query, cursor)
+    except aio.UPSTREAM_ERRORS + (SharedCallError,) as e:
+        logger.warning("YouTube search failed: %r", e)
+        return await aio.blocking(app.stale_search_page, key)
+    await aio.blocking(app.search_cache.set, key, page)
+    return page
+
+
+def cached_search_page(query, cursor=None):
+    """
+    The cache half of perform_youtube_search, run on aio.io_pool as the search cache may
+    be backed by a shared store.
+
+    Returns:
+        tuple: (found, page).
+    """
+    key = app.search_cache_key(query, page_token=cursor)
+    if cursor is None and app.search_cache.peek(key) is None:
+        # A near-duplicate's page; its own is loaded on the app's threads when needed
+        page = app.similar_search_page(query)
+        if page is not None:
+            return True, page
+    prefer_stale = not quota.ledger.allow(quota.NORMAL, app.SEARCH_QUOTA_COST) or upstream.youtube.degraded()
+    # Stale entries are refreshed by the cache's own threads with the blocking client
+    return app.search_cache.lookup(key, lambda: app.load_search_page(query, cursor), prefer_stale)
+
+
+async def load_search_page(query, cursor=None):
+    key = app.search_cache_key(query, page_token=cursor)
+    return await search_flight.do(key, lambda: search_youtube(query, page_token=cursor))
+
+
+async def search_youtube(query, max_results=10, page_token=None, charged=None):
+    response = await aio.youtube_call('search', 'search', units=app.SEARCH_QUOTA_COST, hedge=app.HEDGE_SEARCH,
+                                      charged=charged, part='snippet', q=query, type='video',
+                                      maxResults=max_results, pageToken=page_token)
+    return app.search_page(response)
+
+
+# Prefetch tasks, referenced until they finish
+prefetches = set()
+
+
+def prefetch_next_page(query, page):
+    task = asyncio.get_running_loop().create_task(prefetch_page(query, page))
+    prefetches.add(task)
+    task.add_done_callback(prefetches.discard)
+
+
+async def prefetch_page(query, page):
+    cursor = await aio.blocking(app.prefetch_cursor, query, page)
+    if cursor is None:
+        return
+    try:
+        page = await load_search_page(query, cursor)
+    except aio.UPSTREAM_ERRORS + (SharedCallError,) as e:
+        logger.warning("Prefetching the next page of %r failed: %r", query, e)
+        app.SEARCH_PREFETCHES.inc(outcome='failed')
+        return
+    await aio.blocking(app.search_cache.set, app.search_cache_key(query, page_token=cursor), page)
+    app.SEARCH_PREFETCHES.inc(outcome='fetched')
+
+
+async def run_speculative_search(query, focus=None):
+    """
+    Event loop version of app.run_speculative_search. A search still waiting for a
+    connection slot when GPT says DENY is cancelled before it spends quota (aio.youtube_call
+    charges an attempt only once it has a slot).
+    """
+    spent = []
+
+    task = asyncio.create_task(search_youtube(query, charged=spent.append))
+    with app.speculation_lock:
+        app.speculation_stats['speculative_searches'] += 1
+
+    if not await validate_query(query):
+        task.cancel()
+        with app.speculation_lock:
+            if spent:
+                app.speculation_stats['wasted_searches'] += 1
+                app.speculation_stats['wasted_quota_units'] += sum(spent)
+            else:
+                app.speculation_stats['cancelled_searches'] += 1
+        return {'error': 'Query does not match the allowed filters.'}, 403
+
+    try:
+        page = await task
+    except aio.UPSTREAM_ERRORS as e:
+        logger.warning("YouTube search failed: %r", e)
+        page = None
+    if not page or not page['results']:
+        return {'error': 'No results found or an error occurred during the search.'}, 500
+
+    await aio.blocking(app.search_cache.set, app.search_cache_key(query), page)
+    app.remember_search(query, None, page)
+    prefetch_next_page(query, page)
+    return app.search_payload(query, await filtered_page(page, focus, 'search')), 200
+
+
+async def get_search_results(request):
+    job_id = request.args.get('job_id', '')
+    if not job_id:
+        return {'error': 'Missing "job_id" parameter.'}, 400
+
+    try:
+        wait = min(float(request.args.get('wait', app.LONG_POLL_TIMEOUT)), app.LONG_POLL_TIMEOUT)
+    except ValueError:
+        wait = app.LONG_POLL_TIMEOUT
+
+    job = await search_jobs.wait(job_id, max(wait, 0))
+    if job is None:
+        return {'error': 'Unknown or expired search job.'}, 404
+    if not job.done.is_set():
+        return {'status': 'pending', 'job_id': job.id}, 202
+
+    return job.payload, job.status_code
+
+
+async def stream_search_results(request, job_id):
+    job = await search_jobs.get(job_id)
+    if job is None:
+        return {'error': 'Unknown or expired search job.'}, 404
+
+    async def events():
+        current = job
+        while True:
+            current = await search_jobs.wait(job_id, 15) or current
+            if current.done.is_set():
+                break
+            yield ': keep-alive\n\n'
+        data = json.dumps({'status': current.status_code, **current.payload})
+        yield f'event: result\ndata: {data}\n\n'
+
+    return StreamingResponse(events(), 'text/event-stream', {'cache-control': 'no-cache'})
+
+
+# Channel videos
+
+async def api_channel_videos(request, channel_id):
+    channels = await aio.blocking(app.load_json, 'channels.json', 'channels')
+    if not any(c['channel_id'] == channel_id for c in channels):
+        return {'error': 'Unknown channel.'}, 404
+
+    stream = request.args.get('format') == 'ndjson'
+    try:
+        focus = enrich.parse_filters(request.args)
+    except ValueError:
+        return {'error': 'Invalid filter parameter.'}, 400
+    try:
+        offset, limit = app.channel_videos_page(request.args)
+    except ValueError:
+        return {'error': '"offset" and "limit" must be integers.'}, 400
+    videos = await aio.blocking(app.library.source_videos, channel_id)
+    if videos is None:
+        videos = await aio.blocking(app.channel_videos_cache.get, channel_id)
+    if videos is None:
+        if not quota.ledger.allow(quota.NORMAL):
+            return {'error': 'YouTube quota is running low, try again later.'}, 503
+        try:
+            playlist_id = await get_uploads_playlist_id(channel_id)
+            if playlist_id is None:
+                return {'error': 'Channel not found on YouTube.'}, 404
+            pages = aio.iter_playlist_pages(playlist_id, 'api_channel_videos')
+            if stream:
+                return StreamingResponse(stream_channel_videos(channel_id, pages, focus), 'application/x-ndjson')
+            videos = [video async for page in pages for video in page]
+        except aio.UPSTREAM_ERRORS as e:
+            logger.warning("Fetching uploads of %s failed: %r", channel_id, e)
+            return {'error': 'Could not fetch the channel videos.'}, 502
+        await aio.blocking(app.channel_videos_cache.set, channel_id, videos)
+
+    if focus is not None:
+        videos = await enrich_videos(videos, focus, 'api_channel_videos')
+    if stream:
+        async def lines():
+            for video in videos:
+                yield json.dumps(video) + '\n'
+        return StreamingResponse(lines(), 'application/x-ndjson')
+
+    return {
+        'channel_id': channel_id,
+        'total': len(videos),
+        'offset': offset,
+        'videos': videos[offset:offset + limit]
+    }, 200
+
+
+async def get_uploads_playlist_id(channel_id):
+    playlist_id = await aio.blocking(app.uploads_playlist_cache.get, channel_id)
+    if playlist_id is None:
+        response = await aio.youtube_call('channels', 'api_channel_videos', part='contentDetails', id=channel_id)
+        playlist_id = uploads_playlist(response)
+        if playlist_id is not None:
+            await aio.blocking(app.uploads_playlist_cache.set, channel_id, playlist_id)
+    return playlist_id
+
+
+async def stream_channel_videos(channel_id, pages, focus=None):
+    videos = []
+    try:
+        async for page in pages:
+            videos.extend(page)
+            if focus is not None:
+                page = await enrich_videos(page, focus, 'api_channel_videos')
+            yield ''.join(json.dumps(video) + '\n' for video in page)
+    except aio.UPSTREAM_ERRORS as e:
+        logger.warning("Fetching uploads of %s failed: %r", channel_id, e)
+        yield json.dumps({'error': 'Could not fetch the channel videos.'}) + '\n'
+        return
+    await aio.blocking(app.channel_videos_cache.set, channel_id, videos)
+
+
+# Native GET routes, named after the Flask endpoints they replace so metrics line up
+ROUTES = [
+    (re.compile(r'/api/search'), 'search', search),
+    (re.compile(r'/api/searchresults'), 'get_search_results', get_search_results),
+    (re.compile(r'/api/searchresults/(?P<job_id>[^/]+)/events'), 'stream_search_results', stream_search_results),
+    (re.compile(r'/api/channels/(?P<channel_id>[^/]+)/videos'), 'api_channel_videos', api_channel_videos)
+]
+
+
+async def handle(scope, send, endpoint, handler, params):
+    started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc(route=endpoint)
+    try:
+        try:
+            response = await handler(Request(scope), **params)
+        except Exception:
+            logger.exception("Request to %s failed", scope['path'])
+            response = {'error': 'Internal server error.'}, 500
+        status = 200 if isinstance(response, StreamingResponse) else response[1]
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, route=endpoint, method='GET', status=status)
+        if isinstance(response, StreamingResponse):
+            await send_stream(send, response)
+        else:
+            await send_json(send, *response)
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec(route=endpoint)
+
+
+# Everything else goes to Flask, through a2wsgi on its own thread pool
+flask_app = WSGIMiddleware(app.app, workers=int(os.getenv('WSGI_THREADS', '16')))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aio.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'GET':
+        for pattern, endpoint, handler in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                return await handle(scope, send, endpoint, handler, match.groupdict())
+    await flask_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host='127.0.0.1', port=int(os.getenv('PORT', '5000')))
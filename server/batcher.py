@@ -0,0 +1,219 @@
+# batcher.py
+
+import asyncio
+import threading
+from verdicts import normalize_query
+
+
+class Batch:
+    def __init__(self):
+        self.slots = {}     # normalized query -> (query, waiters)
+        self.size = 0
+
+
+class BatcherBase:
+    """
+    Shared bookkeeping for the thread and asyncio batchers.
+
+    Args:
+        window (float): Seconds the first query of a batch waits for others to join.
+        max_batch (int): Distinct queries per batch; a full batch is sent at once.
+    """
+
+    def __init__(self, window=0.03, max_batch=20):
+        self.window = window
+        self.max_batch = max_batch
+        self.batch = None
+        self.counts = {'queries': 0, 'calls': 0, 'batches': 0, 'batched_queries': 0, 'fallbacks': 0}
+        self.counts_lock = threading.Lock()
+
+    def _join(self, query, waiter):
+        """
+        Adds `query` to the open batch, opening one if needed. Identical queries share a slot.
+
+        Returns:
+            tuple: (batch, opened, full).
+        """
+        opened = self.batch is None
+        if opened:
+            self.batch = Batch()
+        batch = self.batch
+        key = normalize_query(query) or query
+        if key in batch.slots:
+            batch.slots[key][1].append(waiter)
+        else:
+            batch.slots[key] = (query, [waiter])
+        batch.size += 1
+        full = len(batch.slots) >= self.max_batch
+        if full:
+            self.batch = None
+        return batch, opened, full
+
+    def _close(self, batch):
+        if self.batch is batch:
+            self.batch = None
+
+    def _count(self, batch, fallbacks):
+        with self.counts_lock:
+            self.counts['queries'] += batch.size
+            self.counts['calls'] += 1 + fallbacks
+            self.counts['fallbacks'] += fallbacks
+            if len(batch.slots) > 1:
+                self.counts['batches'] += 1
+                self.counts['batched_queries'] += batch.size
+
+    def stats(self):
+        with self.counts_lock:
+            counts = dict(self.counts)
+        # GPT requests per validated query: 1.0 without batching
+        return {**counts, 'window_ms': self.window * 1000, 'max_batch': self.max_batch,
+                'calls_per_query': round(counts['calls'] / counts['queries'], 4) if counts['queries'] else 0.0}
+
+
+class Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.verdict = None
+        self.error = None
+
+
+class VerdictBatcher(BatcherBase):
+    """
+    Collects queries validated at about the same time and asks GPT about all of them
+    in one request, then hands each waiting thread its own verdict.
+
+    The first thread of a batch waits up to `window` for others (or until the batch
+    is full) and then makes the call; the rest just wait for their verdict. If the
+    reply cannot be parsed for some query, that query is asked again on its own.
+
+    Args:
+        ask (callable): Asks GPT about a list of queries in one request; returns a dict of
+            query number (from 1) -> verdict, leaving out the ones it could not read.
+        single (callable): Validates one query without batching; returns its verdict.
+        window, max_batch: See BatcherBase.
+    """
+
+    def __init__(self, ask, single, window=0.03, max_batch=20):
+        super().__init__(window, max_batch)
+        self.ask = ask
+        self.single = single
+        self.lock = threading.Lock()
+        self.full = {}      # batch -> Event set when it fills up
+
+    def validate(self, query):
+        """
+        Returns:
+            The verdict from `ask` or `single`. Raises if the GPT call failed.
+        """
+        waiter = Waiter()
+        with self.lock:
+            batch, opened, full = self._join(query, waiter)
+            if opened:
+                self.full[batch] = threading.Event()
+            if full:
+                self.full[batch].set()
+
+        if opened:
+            self.full[batch].wait(self.window)
+            with self.lock:
+                self._close(batch)
+                del self.full[batch]
+            self._run(batch)
+
+        waiter.event.wait()
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter.verdict
+
+    def _run(self, batch):
+        queries = [query for query, _ in batch.slots.values()]
+        verdicts = {}
+        error = None
+        try:
+            if len(queries) == 1:
+                verdicts = {1: self.single(queries[0])}
+            else:
+                verdicts = self.ask(queries)
+        except Exception as e:
+            error = e
+
+        fallbacks = 0
+        for number, (query, waiters) in enumerate(batch.slots.values(), 1):
+            verdict, slot_error = verdicts.get(number), error
+            if verdict is None and error is None:
+                fallbacks += 1
+                try:
+                    verdict = self.single(query)
+                except Exception as e:
+                    slot_error = e
+            for waiter in waiters:
+                waiter.verdict, waiter.error = verdict, slot_error
+                waiter.event.set()
+        self._count(batch, fallbacks)
+
+
+class AsyncVerdictBatcher(BatcherBase):
+    """
+    VerdictBatcher for the asyncio serving mode: `ask` and `single` are coroutine
+    functions and waiting queries hold futures instead of threads.
+    """
+
+    def __init__(self, ask, single, window=0.03, max_batch=20):
+        super().__init__(window, max_batch)
+        self.ask = ask
+        self.single = single
+        self.timers = {}
+
+    async def validate(self, query):
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        batch, opened, full = self._join(query, waiter)
+        if full:
+            self._flush(batch)
+        elif opened:
+            self.timers[batch] = loop.call_later(self.window, self._flush, batch)
+        return await waiter
+
+    def _flush(self, batch):
+        timer = self.timers.pop(batch, None)
+        if timer is not None:
+            timer.cancel()
+        self._close(batch)
+        asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        queries = [query for query, _ in batch.slots.values()]
+        verdicts = {}
+        error = None
+        try:
+            if len(queries) == 1:
+                verdicts = {1: await self.single(queries[0])}
+            else:
+                verdicts = await self.ask(queries)
+        except Exception as e:
+            error = e
+
+        fallbacks = []
+        for number, (query, waiters) in enumerate(batch.slots.values(), 1):
+            verdict = verdicts.get(number)
+            if verdict is None and error is None:
+                fallbacks.append((query, waiters))
+            else:
+                resolve(waiters, verdict, error)
+        results = await asyncio.gather(*(self.single(query) for query, _ in fallbacks), return_exceptions=True)
+        for (query, waiters), result in zip(fallbacks, results):
+            if isinstance(result, BaseException):
+                resolve(waiters, None, result)
+            else:
+                resolve(waiters, result, None)
+        self._count(batch, len(fallbacks))
+
+
+def resolve(futures, verdict, error):
+    for future in futures:
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(verdict)
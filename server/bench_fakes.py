@@ -0,0 +1,495 @@
+# bench_fakes.py
+#
+# Local stand-ins for the YouTube Data API and the OpenAI chat completions API, so the
+# server can be load tested without spending quota or money.
+#
+#   python bench_fakes.py [--youtube-port 9101] [--openai-port 9102] [--latency 0.15]
+#                         [--jitter 0.05] [--error-rate 0.0] [--payloads payloads.json]
+#                         [--slow-rate 0.0] [--slow-latency 5.0]
+#
+# Point the app at them with:
+#   YOUTUBE_API_BASE=http://127.0.0.1:9101/youtube/v3
+#   OPENAI_BASE_URL=http://127.0.0.1:9102/v1
+#
+# --payloads takes a JSON file mapping an endpoint ('search', 'channels', 'playlistItems',
+# 'videos', 'chat') to a canned response body that replaces the generated one.
+#
+# --slow-rate makes that fraction of requests take --slow-latency seconds instead, for
+# testing how the app copes with a slow tail (see bench_tail.py).
+#
+# --redis-port also starts a small Redis-protocol server for STATE_BACKEND=redis:
+#   STATE_REDIS_URL=redis://127.0.0.1:9103/0
+
+import argparse
+import json
+import math
+import random
+import socketserver
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Queries containing any of these words get DENY from the fake model
+DENY_WORDS = ('minecraft', 'prank', 'gossip', 'fortnite', 'reaction', 'vlog', 'tiktok')
+
+
+def fake_verdict(query):
+    return 'DENY' if any(word in query.lower() for word in DENY_WORDS) else 'ALLOW'
+
+
+def stable_hash(text):
+    return zlib.crc32(text.encode('utf-8'))
+
+
+class FakeConfig:
+    def __init__(self, latency=0.15, jitter=0.05, error_rate=0.0, payloads=None, playlist_pages=3,
+                 slow_rate=0.0, slow_latency=5.0, token_latency=0.0, chatty_rate=0.0, cache_min_tokens=1024):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        # Fake model: seconds per generated token, share of replies that explain themselves,
+        # and the shortest prompt prefix the provider caches
+        self.token_latency = token_latency
+        self.chatty_rate = chatty_rate
+        self.cache_min_tokens = cache_min_tokens
+        self.prefixes = set()
+        self.payloads = payloads or {}
+        self.playlist_pages = playlist_pages
+        # Videos uploaded since start; they go to the front of every playlist
+        self.new_uploads = 0
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + amount
+
+    def delay(self):
+        if self.slow_rate and random.random() < self.slow_rate:
+            self.count('slow')
+            time.sleep(self.slow_latency)
+            return
+        time.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def fail_or_delay(self, name):
+        self.config.count(name)
+        self.config.delay()
+        if self.config.should_fail():
+            self.send_json(503, {'error': {'code': 503, 'message': 'Injected failure'}})
+            return True
+        return False
+
+
+class FakeYouTubeHandler(FakeHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip('/').split('/')[-1]
+        if self.fail_or_delay(endpoint):
+            return
+        if endpoint in self.config.payloads:
+            return self.send_json(200, self.config.payloads[endpoint])
+        builder = getattr(self, f'fake_{endpoint}', None)
+        if builder is None:
+            return self.send_json(404, {'error': {'code': 404, 'message': f'Unknown endpoint {endpoint}'}})
+        body = builder(params)
+        etag = f'"{stable_hash(json.dumps(body, sort_keys=True)):08x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.config.count(f'{endpoint}_not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_json(200, {'etag': etag, **body}, {'ETag': etag})
+
+    def fake_search(self, params):
+        query = params.get('q', '')
+        count = int(params.get('maxResults', 5))
+        page = int(params.get('pageToken', '0') or 0)
+        items = []
+        for i in range(count):
+            n = page * count + i
+            if params.get('type') == 'channel':
+                items.append({'id': {'channelId': f'UC{n:022d}'}, 'snippet': {'channelId': f'UC{n:022d}', 'title': query}})
+            else:
+                items.append({'id': {'videoId': f'vid{stable_hash(query) % 10**6:06d}{n:03d}'},
+                              'snippet': {'title': f'{query} #{n}'}})
+        return {'items': items, 'nextPageToken': str(page + 1)}
+
+    def fake_channels(self, params):
+        ids = [i for i in params.get('id', '').split(',') if i]
+        if not ids:
+            name = params.get('forHandle') or params.get('forUsername') or ''
+            ids = [f'UC{stable_hash(name) % 10**22:022d}']
+        return {'items': [{
+            'id': channel_id,
+            'snippet': {'title': f'Channel {channel_id[-4:]}'},
+            'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}}
+        } for channel_id in ids]}
+
+    def fake_playlistItems(self, params):
+        playlist_id = params.get('playlistId', '')
+        page = int(params.get('pageToken', '0') or 0)
+        count = int(params.get('maxResults', 50))
+        items = []
+        for i in range(count):
+            n = page * count + i - self.config.new_uploads
+            number = f'{n:05d}' if n >= 0 else f'n{-n:04d}'
+            items.append({'snippet': {'title': f'{playlist_id} video {n}',
+                                      'description': 'Fake description',
+                                      'publishedAt': '2024-01-01T00:00:00Z',
+                                      'resourceId': {'videoId': f'{playlist_id[-6:]}{number}'}}})
+        body = {'items': items}
+        if page + 1 < self.config.playlist_pages:
+            body['nextPageToken'] = str(page + 1)
+        return body
+
+    def fake_videos(self, params):
+        ids = [i for i in params.get('id', '').split(',') if i]
+        return {'items': [{
+            'id': video_id,
+            'contentDetails': {'duration': fake_duration(video_id)},
+            'statistics': {'viewCount': str(stable_hash(video_id) % 10**6),
+                           'likeCount': str(stable_hash(video_id) % 10**4)}
+        } for video_id in ids]}
+
+
+def fake_duration(video_id):
+    """Every eighth video is a Short; the rest run 1-40 minutes."""
+    h = stable_hash(video_id)
+    if h % 8 == 0:
+        return f'PT{h % 55 + 5}S'
+    return f'PT{h % 40 + 1}M{h % 60}S'
+
+
+class FakeOpenAIHandler(FakeHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.fail_or_delay('chat'):
+            return
+        if 'chat' in self.config.payloads:
+            return self.send_json(200, self.config.payloads['chat'])
+
+        prompt = ' '.join(str(m.get('content', '')) for m in body.get('messages', []))
+        logprobs = None
+        if 'Queries:\n' in prompt:
+            # Batched prompt: one numbered query per line, answered line by line
+            lines = [line.split('. ', 1) for line in prompt.rsplit('Queries:\n', 1)[1].splitlines()]
+            content = '\n'.join(f'{number}: {fake_verdict(query)}' for number, query in lines)
+        else:
+            query = prompt.rsplit('Query:', 1)[-1]
+            verdict = fake_verdict(query)
+            content = self.fake_reply(verdict, query)
+            if body.get('logprobs'):
+                logprobs = fake_logprobs(verdict, query)
+
+        # Roughly 4 characters per token; max_tokens cuts the reply short like a real model
+        completion_tokens = len(content) // 4 + 1
+        max_tokens = body.get('max_tokens') or body.get('max_completion_tokens')
+        finish_reason = 'stop'
+        if max_tokens and completion_tokens > max_tokens:
+            content, completion_tokens, finish_reason = content[:max_tokens * 4], max_tokens, 'length'
+        time.sleep(completion_tokens * self.config.token_latency)
+
+        prompt_tokens = len(prompt) // 4
+        cached_tokens = self.cached_tokens(prompt)
+        self.config.count('chat_prompt_tokens', prompt_tokens)
+        self.config.count('chat_completion_tokens', completion_tokens)
+        self.config.count('chat_cached_tokens', cached_tokens)
+        self.send_json(200, {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'finish_reason': finish_reason, 'logprobs': logprobs,
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens,
+                      'prompt_tokens_details': {'cached_tokens': cached_tokens}}
+        })
+
+    def fake_reply(self, verdict, query):
+        if random.random() >= self.config.chatty_rate:
+            return verdict
+        reason = 'matches' if verdict == 'ALLOW' else 'does not match'
+        return random.choice([
+            f'{verdict}.',
+            f'**{verdict}**',
+            f'{verdict.capitalize()}',
+            f'{verdict}\n\nThe query "{query.strip()}" {reason} the allowed topics, so it should '
+            f'{"run" if verdict == "ALLOW" else "be blocked"}.'
+        ])
+
+    def cached_tokens(self, prompt):
+        """
+        Prompt caching like OpenAI's: the longest prefix seen before, in 128-token steps
+        from `cache_min_tokens` up.
+        """
+        steps = range(self.config.cache_min_tokens, len(prompt) // 4 + 1, 128) if self.config.cache_min_tokens else []
+        cached = 0
+        with self.config.lock:
+            for tokens in steps:
+                prefix = stable_hash(prompt[:tokens * 4])
+                if prefix in self.config.prefixes:
+                    cached = tokens
+                self.config.prefixes.add(prefix)
+        return cached
+
+
+def fake_logprobs(verdict, query):
+    """First-token logprobs, more or less sure depending on the query."""
+    other = 'DENY' if verdict == 'ALLOW' else 'ALLOW'
+    p = 0.6 + (stable_hash(query) % 400) / 1000
+    top = [{'token': verdict, 'logprob': math.log(p), 'bytes': None},
+           {'token': other, 'logprob': math.log(1 - p), 'bytes': None}]
+    return {'content': [{**top[0], 'top_logprobs': top}]}
+
+
+class FakeServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when hundreds of clients connect at once
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients give up on slow requests (timeouts, hedging), so broken connections are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """
+    The part of the Redis protocol state.RedisBackend uses: GET, SET (PX, NX), DEL,
+    DBSIZE, FLUSHDB and optimistic WATCH/MULTI/EXEC transactions. Keys past
+    `max_keys` are evicted least recently written first, like allkeys-lru would.
+    """
+
+    store = None
+
+    def handle(self):
+        self.watched = {}
+        self.queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            self.wfile.write(self.execute(command))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    def execute(self, command):
+        name = command[0].upper()
+        store = self.store
+        if self.queued is not None and name not in ('EXEC', 'DISCARD', 'MULTI', 'WATCH'):
+            self.queued.append(command)
+            return b'+QUEUED\r\n'
+        if name == 'MULTI':
+            self.queued = []
+            return b'+OK\r\n'
+        if name == 'EXEC':
+            queued, self.queued = self.queued or [], None
+            with store.lock:
+                changed = any(store.version(key) != version for key, version in self.watched.items())
+                self.watched = {}
+                if changed:
+                    return b'*-1\r\n'
+                replies = [self.run(command) for command in queued]
+            return b'*%d\r\n' % len(replies) + b''.join(replies)
+        if name == 'WATCH':
+            with store.lock:
+                for key in command[1:]:
+                    self.watched[key] = store.version(key)
+            return b'+OK\r\n'
+        if name in ('UNWATCH', 'DISCARD'):
+            self.watched, self.queued = {}, None
+            return b'+OK\r\n'
+        with store.lock:
+            return self.run(command)
+
+    def run(self, command):
+        name, args = command[0].upper(), command[1:]
+        store = self.store
+        if name in ('PING', 'AUTH', 'SELECT'):
+            return b'+OK\r\n' if name != 'PING' else b'+PONG\r\n'
+        if name == 'GET':
+            value = store.get(args[0])
+            if value is None:
+                return b'$-1\r\n'
+            data = value.encode('utf-8')
+            return b'$%d\r\n%s\r\n' % (len(data), data)
+        if name == 'SET':
+            options = [arg.upper() for arg in args[2:]]
+            if 'NX' in options and store.get(args[0]) is not None:
+                return b'$-1\r\n'
+            ttl = int(args[2 + options.index('PX') + 1]) / 1000 if 'PX' in options else None
+            store.set(args[0], args[1], ttl)
+            return b'+OK\r\n'
+        if name == 'DEL':
+            return b':%d\r\n' % sum(store.delete(key) for key in args)
+        if name == 'DBSIZE':
+            return b':%d\r\n' % store.size()
+        if name == 'FLUSHDB':
+            store.entries.clear()
+            return b'+OK\r\n'
+        return b'-ERR unknown command %s\r\n' % name.encode('utf-8')
+
+
+class FakeRedisStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.entries = {}       # key -> (value, expires_at or None, version)
+        self.versions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or (entry[1] is not None and entry[1] < time.time()):
+            return None
+        return entry[0]
+
+    def version(self, key):
+        entry = self.entries.get(key)
+        return entry[2] if entry is not None else 0
+
+    def set(self, key, value, ttl):
+        self.versions += 1
+        self.entries.pop(key, None)
+        self.entries[key] = (value, time.time() + ttl if ttl is not None else None, self.versions)
+        while len(self.entries) > self.max_keys:
+            del self.entries[next(iter(self.entries))]
+
+    def delete(self, key):
+        self.versions += 1
+        return 1 if self.entries.pop(key, None) is not None else 0
+
+    def size(self):
+        now = time.time()
+        return sum(1 for _, expires_at, _ in self.entries.values() if expires_at is None or expires_at >= now)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def start_redis(port=0, max_keys=100000):
+    """
+    Starts the fake Redis-protocol server on a background thread.
+
+    Returns:
+        tuple: (server, url) with the redis:// URL to put in STATE_REDIS_URL.
+    """
+    handler = type('FakeRedisHandler', (FakeRedisHandler,), {'store': FakeRedisStore(max_keys)})
+    server = FakeRedisServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'redis://127.0.0.1:{server.server_address[1]}/0'
+
+
+def start(handler_class, config, port=0):
+    """
+    Starts a fake server on a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The server; its address is `server.server_address`.
+    """
+    handler = type(handler_class.__name__, (handler_class,), {'config': config})
+    server = FakeServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fakes(config, youtube_port=0, openai_port=0, openai_config=None):
+    """
+    Args:
+        openai_config (FakeConfig): Separate behaviour for the OpenAI stand-in; it
+            shares `config` by default.
+
+    Returns:
+        tuple: (youtube_server, openai_server, env) where `env` holds the variables
+        that point the app at them.
+    """
+    youtube = start(FakeYouTubeHandler, config, youtube_port)
+    openai = start(FakeOpenAIHandler, openai_config or config, openai_port)
+    env = {
+        'YOUTUBE_API_BASE': f'http://127.0.0.1:{youtube.server_address[1]}/youtube/v3',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{openai.server_address[1]}/v1'
+    }
+    return youtube, openai, env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run local fake YouTube and OpenAI servers.')
+    parser.add_argument('--youtube-port', type=int, default=9101)
+    parser.add_argument('--openai-port', type=int, default=9102)
+    parser.add_argument('--latency', type=float, default=0.15, help='Mean response delay in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Uniform +/- delay jitter in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+    parser.add_argument('--payloads', help='JSON file with canned responses per endpoint.')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Fraction of requests answered slowly.')
+    parser.add_argument('--slow-latency', type=float, default=5.0, help='Delay of the slow requests in seconds.')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='GPT delay per completion token in seconds.')
+    parser.add_argument('--chatty-rate', type=float, default=0.0,
+                        help='Fraction of GPT verdicts with punctuation, markdown or an explanation.')
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help='Shortest cached GPT prompt prefix.')
+    parser.add_argument('--redis-port', type=int, help='Also serve a fake Redis on this port.')
+    args = parser.parse_args()
+
+    payloads = None
+    if args.payloads:
+        with open(args.payloads, 'r') as f:
+            payloads = json.load(f)
+    config = FakeConfig(args.latency, args.jitter, args.error_rate, payloads,
+                        slow_rate=args.slow_rate, slow_latency=args.slow_latency, token_latency=args.token_latency,
+                        chatty_rate=args.chatty_rate, cache_min_tokens=args.cache_min_tokens)
+    _, _, env = start_fakes(config, args.youtube_port, args.openai_port)
+    if args.redis_port is not None:
+        env['STATE_REDIS_URL'] = start_redis(args.redis_port)[1]
+    for name, value in env.items():
+        print(f'{name}={value}')
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print(json.dumps(config.requests, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+# bench_load.py
+#
+# Load benchmark for the API. By default it starts the fake YouTube/OpenAI servers from
+# bench_fakes.py and the app itself, then measures each endpoint at several concurrency levels.
+#
+#   python bench_load.py [--concurrency 1,8,32] [--requests 200] [--output results.json]
+#   python bench_load.py --server asgi                 (serve the app with asgi.py under uvicorn)
+#   python bench_load.py --url http://127.0.0.1:5000   (benchmark an already running server)
+#   python bench_load.py --compare results.json        (print changes against an earlier run)
+#
+# Reports p50/p95/p99 latency (ms), requests per second and errors per endpoint and level.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from bench_fakes import FakeConfig, start_fakes
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = ['python tutorial', 'guitar chords', 'linear algebra', 'operations research', 'rust ownership',
+           'sql joins', 'music theory', 'ex-yu rock', 'algorithms course', 'minecraft lets play']
+
+SERVERS = {
+    'flask': (
+        "import sys; from app import app; "
+        "app.run(host='127.0.0.1', port=int(sys.argv[1]), debug=False, use_reloader=False, threaded=True)"
+    ),
+    'asgi': (
+        "import sys, uvicorn; "
+        "uvicorn.run('asgi:application', host='127.0.0.1', port=int(sys.argv[1]), log_level='warning', backlog=4096)"
+    )
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Client:
+    """Keep-alive HTTP client used by one load thread."""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.connection = None
+
+    def get(self, path):
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request('GET', path)
+                response = self.connection.getresponse()
+                body = response.read()
+                return response.status, body
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+
+def search_flow(client, query):
+    """
+    Starts a search and long-polls for its result.
+
+    Returns:
+        int: Final status code.
+    """
+    status, body = client.get('/api/search?' + urllib.parse.urlencode({'query': query}))
+    if status != 202:
+        return status
+    job_id = json.loads(body)['job_id']
+    while True:
+        status, _ = client.get('/api/searchresults?' + urllib.parse.urlencode({'job_id': job_id, 'wait': 25}))
+        if status != 202:
+            return status
+
+
+def make_scenarios(query_pool):
+    def queries():
+        return random.choice(query_pool)
+    return {
+        'search': lambda client: search_flow(client, queries()),
+        'playlists': lambda client: client.get('/api/playlists')[0],
+        'channels': lambda client: client.get('/api/channels')[0]
+    }
+
+
+def run_level(base_url, scenario, concurrency, total):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        nonlocal errors
+        client = Client(base_url)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status = scenario(client)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                # 403 is a legitimate DENY verdict, not a failure
+                if status not in (200, 304, 403):
+                    errors += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(fake_env, state_dir, server='flask'):
+    port = free_port()
+    env = dict(os.environ)
+    env.update(fake_env)
+    env.setdefault('YOUTUBE_API_KEY', 'bench')
+    # Keep benchmark state away from the real cache, log and ledger files
+    env.update({
+        'VERDICT_CACHE_FILE': '',
+        'VERDICT_LOG_FILE': os.path.join(state_dir, 'verdict_log.jsonl'),
+        'QUOTA_LEDGER_FILE': '',
+        'YOUTUBE_DAILY_QUOTA': '100000000',
+        'VIDEO_DETAILS_CACHE_FILE': '',
+        'LIBRARY_DB': os.path.join(state_dir, 'library.db'),
+        'LIBRARY_SYNC_INTERVAL': '0'
+    })
+    process = subprocess.Popen([sys.executable, '-c', SERVERS[server], str(port)], cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if Client(base_url).get('/api/playlists')[0] == 200:
+                return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError('App did not start')
+
+
+def compare(current, previous):
+    old = {(r['endpoint'], r['concurrency']): r for r in previous['results']}
+    lines = []
+    for r in current['results']:
+        o = old.get((r['endpoint'], r['concurrency']))
+        if o is None:
+            continue
+        lines.append(f"{r['endpoint']:>10} c={r['concurrency']:<4} "
+                     f"p50 {o['p50_ms']:>9} -> {r['p50_ms']:<9} "
+                     f"p99 {o['p99_ms']:>9} -> {r['p99_ms']:<9} "
+                     f"rps {o['rps']:>8} -> {r['rps']}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load benchmark for the FocusTube API.')
+    parser.add_argument('--url', help='Benchmark this running server instead of starting one.')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='flask',
+                        help='How to serve the app when --url is not given.')
+    parser.add_argument('--endpoints', default='search,playlists,channels')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and level.')
+    parser.add_argument('--distinct-queries', type=int, default=len(QUERIES),
+                        help='Size of the search query pool; larger pools mean fewer cache hits.')
+    parser.add_argument('--latency', type=float, default=0.15, help='Fake upstream latency in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fake upstream error rate.')
+    parser.add_argument('--output', help='Write results as JSON to this file.')
+    parser.add_argument('--compare', help='Earlier --output file to compare against.')
+    args = parser.parse_args()
+
+    query_pool = [QUERIES[i % len(QUERIES)] + ('' if i < len(QUERIES) else f' {i}')
+                  for i in range(args.distinct_queries)]
+    scenarios = make_scenarios(query_pool)
+    endpoints = [e for e in args.endpoints.split(',') if e]
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    process = None
+    fake_config = None
+    state_dir = tempfile.TemporaryDirectory()
+    try:
+        base_url = args.url
+        if base_url is None:
+            fake_config = FakeConfig(latency=args.latency, error_rate=args.error_rate)
+            _, _, fake_env = start_fakes(fake_config)
+            process, base_url = start_app(fake_env, state_dir.name, args.server)
+
+        results = []
+        for endpoint in endpoints:
+            for level in levels:
+                result = run_level(base_url, scenarios[endpoint], level, args.requests)
+                result['endpoint'] = endpoint
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        state_dir.cleanup()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {'server': args.url or args.server, 'requests': args.requests,
+                     'distinct_queries': args.distinct_queries, 'fake_latency': args.latency, 'fake_error_rate': args.error_rate},
+        'results': results
+    }
+    if fake_config is not None:
+        # Calls (and prompt tokens) that reached the fake upstreams over the whole run
+        report['upstream_requests'] = fake_config.requests
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            print(compare(report, json.load(f)))
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# bench_startup.py
+#
+# Startup benchmark: time from process start to the first 200 from /api/playlists.
+#
+#   python bench_startup.py [--runs 5] [--save bench_startup.json]
+#   python bench_startup.py --compare bench_startup.json [--tolerance 0.25]
+#
+# --compare exits with status 1 if the median got more than `tolerance` slower than
+# the saved result, so it can gate changes that touch the import path.
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVER = (
+    "import sys; from app import app; "
+    "app.run(host='127.0.0.1', port=int(sys.argv[1]), debug=False, use_reloader=False)"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_once(path, timeout):
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault('YOUTUBE_API_KEY', 'bench')
+    # Startup only: no background library sync against the real API
+    env['LIBRARY_SYNC_INTERVAL'] = '0'
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {process.returncode}')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError(f'No 200 from {path} within {timeout}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time from process start to the first 200 response.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/playlists')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--save', help='Write the result to this JSON file.')
+    parser.add_argument('--compare', help='Compare against a result saved with --save.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown.')
+    args = parser.parse_args()
+
+    samples = [measure_once(args.path, args.timeout) for _ in range(args.runs)]
+    result = {
+        'path': args.path,
+        'runs': args.runs,
+        'median_s': round(statistics.median(samples), 4),
+        'min_s': round(min(samples), 4),
+        'max_s': round(max(samples), 4)
+    }
+
+    status = 0
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        result['baseline_median_s'] = baseline['median_s']
+        result['change'] = round(result['median_s'] / baseline['median_s'] - 1, 4)
+        if result['change'] > args.tolerance:
+            status = 1
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=4)
+
+    print(json.dumps(result, indent=4))
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# bench_tail.py
+#
+# Tail latency test for the upstream deadlines, hedging, circuit breakers and fallbacks in
+# upstream.py. Each scenario starts the fake YouTube/OpenAI servers from bench_fakes.py with
+# a different fault, runs the app against them and checks the search latency bounds.
+#
+#   python bench_tail.py [--server flask|asgi] [--scenarios baseline,slow-tail,...]
+#                        [--requests 200] [--concurrency 8] [--output results.json]
+#
+# Scenarios:
+#   baseline        healthy upstreams
+#   slow-tail       2% of GPT and YouTube calls take 3s; hedging must keep p99 well under that
+#   openai-hang     GPT never answers; searches must end within the deadline, then fail fast
+#   youtube-errors  YouTube answers 503 after a warm-up; cached pages must be served stale
+#   youtube-hang    YouTube never answers; searches must fail within the deadline
+#
+# Exits with status 1 if a scenario misses its bounds.
+
+import argparse
+import itertools
+import json
+import sys
+import tempfile
+import time
+from bench_fakes import FakeConfig, start_fakes
+from bench_load import QUERIES, Client, run_level, search_flow, start_app
+
+SEARCH_DEADLINE = 2.0
+
+# fault settings per fake, app environment, and the bounds checked
+SCENARIOS = {
+    'baseline': {
+        'youtube': {}, 'openai': {},
+        'env': {'LOCAL_CLASSIFIER': '0'},
+        'max_p99_ms': 1000, 'max_error_rate': 0.0
+    },
+    'slow-tail': {
+        'youtube': {'slow_rate': 0.02, 'slow_latency': 3.0}, 'openai': {'slow_rate': 0.02, 'slow_latency': 3.0},
+        # Unbatched, so the warm-up makes enough GPT calls for their p95 to be known
+        'env': {'LOCAL_CLASSIFIER': '0', 'HEDGE_SEARCH': '1', 'GPT_BATCHING': '0'},
+        'max_p99_ms': 1500, 'max_error_rate': 0.0
+    },
+    'openai-hang': {
+        'youtube': {}, 'openai': {'latency': 30.0},
+        'env': {'LOCAL_CLASSIFIER': '1'},
+        'max_p99_ms': (SEARCH_DEADLINE + 1) * 1000, 'max_error_rate': 0.0,
+        'expect_open': 'openai'
+    },
+    'youtube-errors': {
+        'youtube': {}, 'openai': {},
+        'env': {'LOCAL_CLASSIFIER': '0', 'SEARCH_CACHE_TTL': '1', 'SEARCH_CACHE_STALE_TTL': '1'},
+        'warm_up_then': {'error_rate': 1.0},
+        'max_p99_ms': 1000, 'max_error_rate': 0.0,
+        'expect_open': 'youtube'
+    },
+    'youtube-hang': {
+        'youtube': {'latency': 30.0}, 'openai': {},
+        'env': {'LOCAL_CLASSIFIER': '0'},
+        'max_p99_ms': (SEARCH_DEADLINE + 1) * 1000, 'max_error_rate': 1.0,
+        'expect_open': 'youtube'
+    }
+}
+
+FAKE_LATENCY = {'latency': 0.05, 'jitter': 0.01}
+
+
+def query_source(distinct):
+    """
+    Returns a scenario function searching `distinct` different queries in turn
+    (None: a new query every time, so nothing is answered from the caches).
+    """
+    counter = itertools.count()
+
+    def scenario(client):
+        n = next(counter)
+        if distinct is not None:
+            n %= distinct
+        return search_flow(client, f'{QUERIES[n % len(QUERIES)]} {n}')
+    return scenario
+
+
+def run_scenario(name, spec, server, requests, concurrency):
+    youtube_config = FakeConfig(**{**FAKE_LATENCY, **spec['youtube']})
+    openai_config = FakeConfig(**{**FAKE_LATENCY, **spec['openai']})
+    _, _, fake_env = start_fakes(youtube_config, openai_config=openai_config)
+    fake_env.update({'SEARCH_DEADLINE': str(SEARCH_DEADLINE), **spec['env']})
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        process, base_url = start_app(fake_env, state_dir, server)
+        try:
+            if 'warm_up_then' in spec:
+                # Cache every query while the upstreams are healthy, then break them
+                distinct = min(requests, 40)
+                run_level(base_url, query_source(distinct), concurrency, distinct)
+                for field, value in spec['warm_up_then'].items():
+                    setattr(youtube_config, field, value)
+                time.sleep(1.5)
+                scenario = query_source(distinct)
+            else:
+                # Enough calls for the p95 each hedge waits for to be known
+                run_level(base_url, query_source(None), concurrency, 40)
+                scenario = query_source(None)
+            result = run_level(base_url, scenario, concurrency, requests)
+            stats = json.loads(Client(base_url).get('/api/cache/stats')[1])
+        finally:
+            process.terminate()
+            process.wait()
+
+    result.update({
+        'scenario': name,
+        'upstreams': stats['upstreams'],
+        'search_fallbacks': stats['search']['fallbacks'],
+        'fake_requests': {'youtube': youtube_config.requests, 'openai': openai_config.requests}
+    })
+    failures = []
+    if result['p99_ms'] > spec['max_p99_ms']:
+        failures.append(f"p99 {result['p99_ms']}ms above {spec['max_p99_ms']}ms")
+    if result['errors'] > spec['max_error_rate'] * result['requests']:
+        failures.append(f"{result['errors']} errors")
+    expected = spec.get('expect_open')
+    if expected and not stats['upstreams'][expected]['breaker']['opened']:
+        failures.append(f'{expected} circuit never opened')
+    result['failures'] = failures
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tail latency test of the upstream deadlines and fallbacks.')
+    parser.add_argument('--server', choices=('flask', 'asgi'), default='flask')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='Searches per scenario.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='Write results as JSON to this file.')
+    args = parser.parse_args()
+
+    results = []
+    for name in [s for s in args.scenarios.split(',') if s]:
+        result = run_scenario(name, SCENARIOS[name], args.server, args.requests, args.concurrency)
+        print(json.dumps({k: result[k] for k in ('scenario', 'p50_ms', 'p95_ms', 'p99_ms', 'errors', 'failures')}),
+              file=sys.stderr)
+        results.append(result)
+
+    report = {'server': args.server, 'search_deadline': SEARCH_DEADLINE, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    sys.exit(1 if any(r['failures'] for r in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# bench_validation.py
+#
+# Token and latency benchmark of the GPT query validation. Starts the fake OpenAI server from
+# bench_fakes.py and validates the same queries with the old free-form prompt ("before") and
+# with validation.ValidationEngine, one query per call ("after") and in batches ("after-batched").
+#
+#   python bench_validation.py [--queries 200] [--concurrency 8] [--latency 0.05]
+#                              [--token-latency 0.01] [--chatty-rate 0.1] [--logprobs]
+#                              [--cache-min-tokens 1024] [--output results.json]
+#
+# Reports p50/p95/p99 latency (ms) per validation, prompt/completion/cached tokens per
+# validation, accuracy against the fake's own verdicts, and replies that could not be read.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bench_fakes import FakeConfig, fake_verdict, start_fakes
+from bench_load import QUERIES, percentile
+from filters import FILTERS
+from validation import ValidationEngine, UnparseableVerdict
+
+# The prompt validation used before validation.py, for the "before" numbers
+LEGACY_PROMPT = (
+    "I will be sending you YouTube query requests for my focus YouTube wrapper, then a filter, "
+    "then the query to test. You need to respond with ALLOW if you think the query should run or DENY if the query "
+    "doesn't match the filters. Below I will provide the filters. "
+    "The query must only be about:"
+)
+
+BATCH_SIZE = 10
+
+
+def make_queries(count):
+    return [f'{QUERIES[n % len(QUERIES)]} {n}' for n in range(count)]
+
+
+def usage_of(completion):
+    usage = completion.usage
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return usage.prompt_tokens, usage.completion_tokens, (getattr(details, 'cached_tokens', None) or 0)
+
+
+def validate_before(gpt, engine, queries):
+    completion = gpt.complete(gpt.completion_args(f"{LEGACY_PROMPT} {FILTERS} Query: {queries[0]}"))
+    content = completion.choices[0].message.content
+    # The old code compared the reply verbatim
+    verdicts = {1: content == 'ALLOW'} if content in ('ALLOW', 'DENY') else {}
+    return verdicts, usage_of(completion)
+
+
+def validate_after(gpt, engine, queries):
+    completion = gpt.complete(engine.request(queries[0]))
+    try:
+        verdicts = {1: engine.verdict(completion).allowed}
+    except UnparseableVerdict:
+        verdicts = {}
+    return verdicts, usage_of(completion)
+
+
+def validate_batched(gpt, engine, queries):
+    completion = gpt.complete(engine.batch_request(queries))
+    verdicts = {n: v.allowed for n, v in engine.batch_verdicts(completion, len(queries)).items()}
+    return verdicts, usage_of(completion)
+
+
+MODES = {
+    'before': (validate_before, 1),
+    'after': (validate_after, 1),
+    'after-batched': (validate_batched, BATCH_SIZE)
+}
+
+
+def run_mode(name, gpt, engine, queries, concurrency):
+    validate, batch_size = MODES[name]
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+
+    def timed(batch):
+        start = time.perf_counter()
+        verdicts, usage = validate(gpt, engine, batch)
+        return batch, verdicts, usage, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(timed, batches))
+    elapsed = time.perf_counter() - start
+
+    latencies, tokens = [], [0, 0, 0]
+    correct = unparsed = 0
+    for batch, verdicts, usage, latency in results:
+        # Every query of a batch waits for the whole call
+        latencies.extend([latency] * len(batch))
+        tokens = [total + used for total, used in zip(tokens, usage)]
+        for n, query in enumerate(batch, 1):
+            if n not in verdicts:
+                unparsed += 1
+            elif verdicts[n] == (fake_verdict(query) == 'ALLOW'):
+                correct += 1
+    latencies.sort()
+    count = len(queries)
+    return {
+        'mode': name,
+        'validations': count,
+        'calls': len(batches),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'validations_per_second': round(count / elapsed, 1),
+        'prompt_tokens_per_validation': round(tokens[0] / count, 1),
+        'completion_tokens_per_validation': round(tokens[1] / count, 2),
+        'cached_tokens_per_validation': round(tokens[2] / count, 1),
+        'accuracy': round(correct / count, 4),
+        'unparsed': unparsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tokens and latency per GPT query validation, before and after.')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake GPT delay per call in seconds.')
+    parser.add_argument('--token-latency', type=float, default=0.01,
+                        help='Fake GPT delay per completion token in seconds.')
+    parser.add_argument('--chatty-rate', type=float, default=0.1,
+                        help='Fraction of fake verdicts with punctuation, markdown or an explanation.')
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help='Shortest cached prompt prefix.')
+    parser.add_argument('--logprobs', action='store_true', help='Ask for first-token logprobs in "after".')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--output', help='Write results as JSON to this file.')
+    args = parser.parse_args()
+
+    openai_config = FakeConfig(latency=args.latency, jitter=args.latency / 5, token_latency=args.token_latency,
+                               chatty_rate=args.chatty_rate, cache_min_tokens=args.cache_min_tokens)
+    _, _, env = start_fakes(FakeConfig(), openai_config=openai_config)
+    # Before the client is created on the first call
+    os.environ['OPENAI_BASE_URL'] = env['OPENAI_BASE_URL']
+    import gpt
+    # Loads the openai package outside the timings
+    gpt.complete(ValidationEngine(FILTERS).request('warm up'))
+
+    engine = ValidationEngine(FILTERS, max_tokens=int(os.getenv('GPT_MAX_TOKENS', '2')), logprobs=args.logprobs)
+    queries = make_queries(args.queries)
+    results = []
+    for name in [m for m in args.modes.split(',') if m]:
+        result = run_mode(name, gpt, engine, queries, args.concurrency)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'fake': {'latency': args.latency, 'token_latency': args.token_latency, 'chatty_rate': args.chatty_rate,
+                 'cache_min_tokens': args.cache_min_tokens},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
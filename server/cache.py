@@ -0,0 +1,320 @@
+# cache.py
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry expiry time.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is evicted.
+        ttl (float): Default seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()    # key -> (value, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns:
+            The cached value, or None if the key is missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """
+        Like get(), but leaves the counters and LRU order untouched.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.time():
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def dump(self):
+        """
+        Returns:
+            list: Unexpired [key, value, expires_at] rows, least recently used first.
+        """
+        now = time.time()
+        with self.lock:
+            return [[key, value, expires_at] for key, (value, expires_at) in self.entries.items()
+                    if expires_at >= now]
+
+    def load(self, rows):
+        now = time.time()
+        with self.lock:
+            for key, value, expires_at in rows:
+                if expires_at >= now:
+                    self.entries[key] = (value, expires_at)
+                    self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+
+class PersistentLRUCache(LRUCache):
+    """
+    LRUCache that is warmed from a JSON file and written back to it atomically,
+    at most once every `save_interval` seconds.
+
+    Args:
+        path (str): File to persist to; None disables persistence.
+        save_interval (float): Minimum seconds between writes.
+    """
+
+    def __init__(self, path=None, save_interval=30, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.save_interval = save_interval
+        self.last_save = time.time()
+        self.save_lock = threading.Lock()
+        if path:
+            try:
+                with open(path, 'r') as f:
+                    self.load(json.load(f))
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def set(self, key, value, ttl=None):
+        super().set(key, value, ttl=ttl)
+        if self.path and time.time() - self.last_save > self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self.save_lock:
+            atomic_write_json(self.path, self.dump())
+            self.last_save = time.time()
+
+
+class SWRCache:
+    """
+    Stale-while-revalidate cache for upstream results.
+
+    Fresh entries are returned as-is. Once an entry is older than `ttl` it is still
+    returned immediately, and a background refresh replaces it. Entries older than
+    `stale_ttl` are treated as missing.
+
+    Args:
+        ttl (float): Seconds an entry is fresh.
+        stale_ttl (float): Seconds an entry may be served at all.
+        max_entries (int): Entry count bound (LRU eviction).
+        max_bytes (int): Approximate memory bound, measured as serialized JSON size.
+        refresh_workers (int): Threads used for background refreshes.
+        refresh_allowed (callable): Optional check run before each background refresh;
+            refreshes are skipped while it returns False.
+        store (SharedCache): Optional store shared with other worker processes. Entries are
+            written through to it, and local misses are looked up in it.
+    """
+
+    def __init__(self, ttl=600, stale_ttl=86400, max_entries=1000, max_bytes=16 * 1024 * 1024,
+                 refresh_workers=2, refresh_allowed=None, store=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> (value, stored_at, size)
+        self.bytes = 0
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.skipped_refreshes = 0
+        self.refresh_allowed = refresh_allowed
+        self.store = store
+        self.shared_hits = 0
+        self.fallbacks = 0
+
+    def get_or_load(self, key, loader, prefer_stale=False):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss.
+
+        With `prefer_stale`, an entry past `stale_ttl` that has not been evicted yet is
+        still returned instead of calling `loader`.
+        `loader` may raise; empty results are returned but not cached.
+        """
+        found, value = self.lookup(key, loader, prefer_stale)
+        if found:
+            return value
+
+        value = loader()
+        if value:
+            self.set(key, value)
+        return value
+
+    def lookup(self, key, loader, prefer_stale=False):
+        """
+        The cache half of get_or_load, for callers that load misses themselves (e.g. with
+        an async client): counts the hit or miss and refreshes stale entries with `loader`.
+
+        Returns:
+            tuple: (found, value).
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load_shared(key)
+        with self.lock:
+            if entry is not None:
+                # Evicted or replaced since it was read without the lock
+                entry = self.entries.get(key)
+            if entry is not None and (prefer_stale or now - entry[1] <= self.stale_ttl):
+                self.entries.move_to_end(key)
+                if now - entry[1] <= self.ttl:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    if key not in self.refreshing:
+                        if self.refresh_allowed is None or self.refresh_allowed():
+                            self.refreshing.add(key)
+                            self.executor.submit(self._refresh, key, loader)
+                        else:
+                            self.skipped_refreshes += 1
+                return True, entry[0]
+            self.misses += 1
+        return False, None
+
+    def _load_shared(self, key):
+        """
+        Copies an entry another worker stored into this one, keeping its age.
+        """
+        shared = self.store.peek(key)
+        if shared is None:
+            return None
+        self._set_local(key, shared['value'], shared['stored_at'])
+        with self.lock:
+            self.shared_hits += 1
+            return self.entries.get(key)
+
+    def peek(self, key):
+        """
+        Returns:
+            The stored value regardless of age (up to `stale_ttl`), or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load_shared(key)
+        if entry is None or time.time() - entry[1] > self.stale_ttl:
+            return None
+        return entry[0]
+
+    def stale(self, key):
+        """
+        Last resort when the loader fails: the value still held for `key`, however old.
+
+        Returns:
+            The value, or None if nothing is left.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load_shared(key)
+        if entry is None:
+            return None
+        with self.lock:
+            self.fallbacks += 1
+        return entry[0]
+
+    def set(self, key, value):
+        stored_at = time.time()
+        self._set_local(key, value, stored_at)
+        if self.store is not None:
+            self.store.set(key, {'value': value, 'stored_at': stored_at}, ttl=self.stale_ttl)
+
+    def _set_local(self, key, value, stored_at):
+        size = len(json.dumps(value))
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, stored_at, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def _refresh(self, key, loader):
+        try:
+            value = loader()
+            if value:
+                self.set(key, value)
+                with self.lock:
+                    self.refreshes += 1
+        except Exception as e:
+            logger.warning("Background refresh of %r failed: %s", key, e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'skipped_refreshes': self.skipped_refreshes,
+                'shared_hits': self.shared_hits,
+                'fallbacks': self.fallbacks,
+                'hit_ratio': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,101 @@
+# catalog.py
+
+import hashlib
+import json
+import os
+import threading
+from flask import current_app, request
+
+
+class Catalog:
+    """
+    Process-wide, parsed copy of one of the JSON data files (playlists.json, channels.json).
+
+    The file is parsed once and re-read only when its mtime, size or inode changes.
+    The serialized API response and its ETag are kept alongside the parsed items.
+
+    Args:
+        path (str): Path of the JSON file.
+        key (str): Top-level key holding the list of items.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+        # (signature, items, body, etag), replaced in one assignment so readers never see
+        # the items of one version with the body or ETag of another
+        self.state = self._build(None, [])
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _build(signature, items):
+        body = json.dumps(items).encode('utf-8')
+        return signature, items, body, hashlib.sha1(body).hexdigest()
+
+    def _refresh(self):
+        """
+        Returns:
+            tuple: The current (signature, items, body, etag).
+        """
+        signature = self._stat()
+        state = self.state
+        if signature == state[0]:
+            return state
+        with self.lock:
+            state = self.state
+            if signature == state[0]:
+                return state
+            try:
+                with open(self.path, 'r') as f:
+                    items = json.load(f).get(self.key, [])
+            except FileNotFoundError:
+                items = []
+            state = self.state = self._build(signature, items)
+            return state
+
+    def items(self):
+        """
+        Returns:
+            list: A shallow copy of the items, safe for the caller to modify.
+        """
+        return list(self._refresh()[1])
+
+    def response(self):
+        """
+        Returns:
+            tuple: The JSON body as bytes and its ETag.
+        """
+        _, _, body, etag = self._refresh()
+        return body, etag
+
+
+catalogs = {}
+catalogs_lock = threading.Lock()
+
+
+def get_catalog(base_dir, filename, key):
+    path = os.path.join(base_dir, filename)
+    with catalogs_lock:
+        catalog = catalogs.get(path)
+        if catalog is None:
+            catalog = catalogs[path] = Catalog(path, key)
+        return catalog
+
+
+def catalog_response(catalog):
+    """
+    Builds a JSON response for a catalog, answering 304 when the client's
+    If-None-Match already names the current version.
+    """
+    body, etag = catalog.response()
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,174 @@
+# classifier.py
+
+import math
+import re
+import threading
+import zlib
+
+
+# Words in FILTERS that say nothing about the topic
+STOPWORDS = {
+    'a', 'about', 'an', 'and', 'anything', 'at', 'basically', 'be', 'does', 'ex', 'for', 'general',
+    'good', 'has', 'have', 'how', 'i', "i'd", 'in', 'is', 'it', 'learning', 'of', 'on', 'or', 'play',
+    'related', 'study', 'that', 'the', 'to', 'topics', 'with', 'yu'
+}
+
+# Obvious on-topic terms that FILTERS only implies
+ALLOW_SEED_TERMS = {
+    'algorithm', 'algorithms', 'calculus', 'chords', 'compiler', 'database', 'databases',
+    'java', 'javascript', 'lecture', 'linux', 'math', 'mathematics', 'physics', 'python', 'rust',
+    'sql', 'statistics', 'tutorial'
+}
+
+# Obvious off-topic terms. A match DENYs without GPT, so only words with no on-topic sense
+# ("chemical reaction", "gameplay programming" and "python shorts" stay with GPT)
+DENY_TERMS = {
+    'asmr', 'fortnite', 'gossip', 'minecraft', 'mukbang', 'prank', 'pranks', 'tiktok', 'unboxing', 'vlog'
+}
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def features(query, n_buckets):
+    """
+    Hashed word, word-bigram and character-trigram features of a query.
+    """
+    tokens = tokenize(query)
+    grams = [f"w:{t}" for t in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for t in tokens:
+        padded = f" {t} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return [zlib.crc32(g.encode('utf-8')) % n_buckets for g in grams]
+
+
+class QueryClassifier:
+    """
+    Local ALLOW/DENY classifier that answers confident cases without GPT.
+
+    Combines a term index compiled from the filter text with a naive Bayes scorer over
+    hashed n-grams, trained on past GPT verdicts. Returns None when unsure.
+
+    Args:
+        filters (str): The filter text; its content words become allow terms.
+        allow_threshold (float): Minimum ALLOW probability to answer ALLOW.
+        deny_threshold (float): Maximum ALLOW probability to answer DENY.
+        min_examples (int): Verdicts needed per class before the scorer is used.
+        min_coverage (float): Fraction of a query's features that must have been seen in training.
+        n_buckets (int): Size of the hashed feature space.
+    """
+
+    def __init__(self, filters, allow_threshold=0.95, deny_threshold=0.05, min_examples=25,
+                 min_coverage=0.6, n_buckets=1 << 18):
+        self.allow_terms = {t for t in tokenize(filters) if t not in STOPWORDS and len(t) > 2}
+        self.allow_terms |= ALLOW_SEED_TERMS
+        self.deny_terms = set(DENY_TERMS)
+        self.allow_threshold = allow_threshold
+        self.deny_threshold = deny_threshold
+        self.min_examples = min_examples
+        self.min_coverage = min_coverage
+        self.n_buckets = n_buckets
+        self.counts = ({}, {})     # per class: bucket -> count (0 = DENY, 1 = ALLOW)
+        self.totals = [0, 0]
+        self.docs = [0, 0]
+        self.lock = threading.Lock()
+        self.stats_counts = {'local_allow': 0, 'local_deny': 0, 'deferred': 0}
+
+    def fit(self, examples):
+        for query, allowed in examples:
+            self.add_example(query, allowed)
+
+    def add_example(self, query, allowed):
+        cls = 1 if allowed else 0
+        with self.lock:
+            counts = self.counts[cls]
+            for f in features(query, self.n_buckets):
+                counts[f] = counts.get(f, 0) + 1
+                self.totals[cls] += 1
+            self.docs[cls] += 1
+
+    def term_signal(self, query):
+        """
+        Returns:
+            int: 1 if only allow terms match, -1 if only deny terms match, else 0.
+        """
+        tokens = set(tokenize(query))
+        allow = bool(tokens & self.allow_terms)
+        deny = bool(tokens & self.deny_terms)
+        return int(allow) - int(deny)
+
+    def score(self, query):
+        """
+        Returns:
+            float: Probability of ALLOW, or None if there is too little training data
+            or the query is mostly made of unseen features.
+        """
+        fs = features(query, self.n_buckets)
+        with self.lock:
+            if not fs or min(self.docs) < self.min_examples:
+                return None
+            seen = sum(1 for f in fs if f in self.counts[0] or f in self.counts[1])
+            if seen / len(fs) < self.min_coverage:
+                return None
+            vocab = len(self.counts[0].keys() | self.counts[1].keys())
+            log_odds = math.log(self.docs[1] / self.docs[0])
+            for f in fs:
+                p_allow = (self.counts[1].get(f, 0) + 1) / (self.totals[1] + vocab)
+                p_deny = (self.counts[0].get(f, 0) + 1) / (self.totals[0] + vocab)
+                log_odds += math.log(p_allow / p_deny)
+        return 1 / (1 + math.exp(-max(min(log_odds, 50), -50)))
+
+    def classify(self, query):
+        """
+        Returns:
+            bool: True for a confident ALLOW, False for a confident DENY,
+            None if the query should go to GPT.
+        """
+        verdict, _ = self.decide(query)
+        key = 'deferred' if verdict is None else ('local_allow' if verdict else 'local_deny')
+        with self.lock:
+            self.stats_counts[key] += 1
+        return verdict
+
+    def decide(self, query):
+        """
+        Only the trained scorer past its thresholds, or an off-topic term, decides locally.
+        Allow terms are too broad ("makeup tutorial", "science fiction movies") to ALLOW
+        a query on their own; they only keep the scorer from denying one.
+
+        Returns:
+            tuple: (verdict, 'scorer' or 'term'), or (None, None) if GPT has to decide.
+        """
+        term = self.term_signal(query)
+        p = self.score(query)
+        if p is not None and p >= self.allow_threshold and term >= 0:
+            return True, 'scorer'
+        if p is not None and p <= self.deny_threshold and term <= 0:
+            return False, 'scorer'
+        if term == -1 and (p is None or p < self.allow_threshold):
+            return False, 'term'
+        return None, None
+
+    def guess(self, query):
+        """
+        Verdict for when GPT cannot be asked. Follows decide(): an allow term alone or a
+        scorer short of its thresholds is no reason to ALLOW, and the caller DENYs.
+
+        Returns:
+            bool: The local verdict, or None if decide() would have asked GPT.
+        """
+        verdict, _ = self.decide(query)
+        return verdict
+
+    def stats(self):
+        with self.lock:
+            decided = self.stats_counts['local_allow'] + self.stats_counts['local_deny']
+            total = decided + self.stats_counts['deferred']
+            return {
+                **self.stats_counts,
+                'training_allow': self.docs[1],
+                'training_deny': self.docs[0],
+                'gpt_calls_saved_ratio': round(decided / total, 4) if total else 0.0
+            }
@@ -1,20 +1,28 @@
 # app.py
 
-import json
+import atexit
 import os
+import requests
 import re
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from flask import Flask, redirect, url_for, render_template, request, jsonify
 from flask_dance.consumer import OAuth2ConsumerBlueprint
 from flask_login import LoginManager, login_user, logout_user, current_user, UserMixin
 from flask_cors import CORS
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from catalog import get_catalog, catalog_response
+import storage
+import metrics
+import quota
+import ytapi
+from cache import PersistentLRUCache
+from library import library
 
 
 app = Flask(__name__)       # first we instantiate the Flask object    
 CORS(app)
+metrics.init_app(app)       # request timings and the /metrics endpoint
 
 load_dotenv()
 CLIENT_ID = os.getenv('CLIENT_ID')
@@ -69,50 +77,80 @@ def load_user(user_id):
 
 # Load and save JSON Data
 def load_json(filename, key):
-    file_path = os.path.join(BASE_DIR, filename)
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            return data.get(key, [])
-    except FileNotFoundError:
-        return []
+    return get_catalog(BASE_DIR, filename, key).items()
 
 def save_json(filename, key, items):
-    data = {key: items}
-    file_path = os.path.join(BASE_DIR, filename)
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    storage.write_items(os.path.join(BASE_DIR, filename), key, items)
+
+def add_json_item(filename, key, item, id_field):
+    return storage.add_item(os.path.join(BASE_DIR, filename), key, item, id_field)
+
+def remove_json_item(filename, key, id_field, value):
+    return storage.remove_item(os.path.join(BASE_DIR, filename), key, id_field, value)
 
 
 
 
 
 
-#!                                              BAD + DOESNT DO SHIT
 # Extract channel ID from YouTube link
-import requests
 from bs4 import BeautifulSoup
 
-def get_channel_id_from_url(url):
+# Handles, usernames, custom names and URLs already resolved to channel IDs. Misses are
+# cached too (as ''), for a shorter time, so repeated imports cost no network calls.
+channel_id_cache = PersistentLRUCache(
+    path=os.getenv('CHANNEL_ID_CACHE_FILE', os.path.join(BASE_DIR, 'channel_id_cache.json')) or None,
+    max_entries=50000,
+    ttl=90 * 86400
+)
+CHANNEL_ID_NEGATIVE_TTL = 86400
+atexit.register(channel_id_cache.save)
+metrics.register_cache('channel_ids', channel_id_cache.stats)
+
+def cached_channel_id(kind, value, resolve):
+    """
+    Looks `value` up in the resolution cache, calling `resolve(value)` on a miss.
+    Network and API errors are not cached.
+    """
+    key = f"{kind}:{value.strip().lower()}"
+    cached = channel_id_cache.get(key)
+    if cached is not None:
+        return cached or None
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        html = response.text
-
-        soup = BeautifulSoup(html, 'html.parser')
-        # Find the canonical link
-        link = soup.find('link', rel='canonical')
-        if link:
-            canonical_url = link['href']
-            # The canonical URL should be in the format https://www.youtube.com/channel/CHANNEL_ID
-            parsed_canonical = urlparse(canonical_url)
-            if '/channel/' in parsed_canonical.path:
-                channel_id = parsed_canonical.path.split('/channel/')[-1].split('/')[0]
-                return channel_id
-    except Exception as e:
-        print(f'Error fetching channel ID from URL: {e}')
+        channel_id = resolve(value)
+    except (ytapi.YouTubeApiError, requests.RequestException) as e:
+        app.logger.warning('Resolving %s failed: %s', key, e)
         return None
+    channel_id_cache.set(key, channel_id or '', ttl=None if channel_id else CHANNEL_ID_NEGATIVE_TTL)
+    return channel_id
+
+def first_channel_id(response):
+    items = response.get('items')
+    if items:
+        return items[0]['id']
+    return None
+
+def get_channel_id_from_url(url):
+    return cached_channel_id('url', url.split('?')[0].rstrip('/'), fetch_channel_id_from_url)
+
+def fetch_channel_id_from_url(url):
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    with metrics.upstream_call('youtube', 'channel_page'):
+        response = ytapi.session.get(url, headers=headers, timeout=10)
+    response.raise_for_status()
+    html = response.text
+
+    soup = BeautifulSoup(html, 'html.parser')
+    # Find the canonical link
+    link = soup.find('link', rel='canonical')
+    if link:
+        canonical_url = link['href']
+        # The canonical URL should be in the format https://www.youtube.com/channel/CHANNEL_ID
+        parsed_canonical = urlparse(canonical_url)
+        if '/channel/' in parsed_canonical.path:
+            channel_id = parsed_canonical.path.split('/channel/')[-1].split('/')[0]
+            return channel_id
+    return None
 
 def extract_channel_id(url):
     parsed_url = urlparse(url)
@@ -126,57 +164,103 @@ def extract_channel_id(url):
         # Legacy username URL
         username = path.split('/user/')[-1].split('/')[0]
         return get_channel_id_by_username(username)
+    elif path.startswith('/@'):
+        # Handle URL
+        handle = path[1:].split('/')[0]
+        return get_channel_id_by_handle(handle)
     else:
         # Attempt to fetch the channel ID by requesting the URL and parsing the HTML
         channel_id = get_channel_id_from_url(url)
         return channel_id
 
 def get_channel_id_by_username(username):
-    try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        request = youtube.channels().list(part='id', forUsername=username)
-        response = request.execute()
-        items = response.get('items')
-        if items:
-            return items[0]['id']
-    except HttpError:
-        return None
+    return cached_channel_id('user', username, lambda u: first_channel_id(
+        ytapi.call('channels', part='id', forUsername=u)))
 
 def get_channel_id_by_custom_name(custom_name):
     return get_channel_id_by_search_query(custom_name)
 
 def get_channel_id_by_handle(handle):
-    try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        request = youtube.channels().list(
-            part='id',
-            handle=handle
-        )
-        response = request.execute()
-        items = response.get('items')
-        if items:
-            return items[0]['id']
-        else:
-            return None
-    except HttpError as e:
-        print(f'YouTube API Error: {e}')
-        return None
+    return cached_channel_id('handle', handle, lambda h: first_channel_id(
+        ytapi.call('channels', part='id', forHandle=h)))
 
 def get_channel_id_by_search_query(query):
-    try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        request = youtube.search().list(
-            part='snippet',
-            q=query,
-            type='channel',
-            maxResults=1
-        )
-        response = request.execute()
+    def search(q):
+        response = ytapi.call('search', part='snippet', q=q, type='channel', maxResults=1)
         items = response.get('items')
         if items:
             return items[0]['snippet']['channelId']
-    except HttpError:
         return None
+    return cached_channel_id('search', query, search)
+
+
+
+
+# Bulk import and refresh: resolve links concurrently, look channels up 50 IDs per
+# channels.list call and write channels.json once at the end
+def import_channels(links, max_workers=8):
+    """
+    Adds many channels at once.
+
+    Args:
+        links (list): Channel URLs or bare channel IDs.
+        max_workers (int): Links resolved concurrently.
+
+    Returns:
+        dict: Lists of 'added', 'existing', 'unresolved' and 'not_found' entries.
+    """
+    links = [link.strip() for link in links if link.strip()]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resolved = list(executor.map(resolve_channel_link, links))
+
+    report = {'added': [], 'existing': [], 'unresolved': [], 'not_found': []}
+    report['unresolved'] = [link for link, channel_id in zip(links, resolved) if not channel_id]
+    channel_ids = list(dict.fromkeys(channel_id for channel_id in resolved if channel_id))
+
+    found = ytapi.get_channels(channel_ids)
+    report['not_found'] = [channel_id for channel_id in channel_ids if channel_id not in found]
+    new_channels = [{'name': found[channel_id]['snippet']['title'], 'channel_id': channel_id}
+                    for channel_id in channel_ids if channel_id in found]
+
+    def add(channels):
+        known = {c['channel_id'] for c in channels}
+        for channel in new_channels:
+            (report['existing'] if channel['channel_id'] in known else report['added']).append(channel)
+        return channels + report['added'] if report['added'] else None
+
+    storage.update_items(os.path.join(BASE_DIR, 'channels.json'), 'channels', add)
+    return report
+
+def resolve_channel_link(link):
+    if re.fullmatch(r'UC[\w-]{22}', link):
+        return link
+    if link.startswith('@'):
+        return get_channel_id_by_handle(link)
+    return extract_channel_id(link)
+
+def refresh_channel_titles():
+    """
+    Updates the name of every channel in channels.json from YouTube,
+    using ceil(N / 50) channels.list calls.
+
+    Returns:
+        dict: Channel ID -> new name, for the channels that were renamed.
+    """
+    channels = load_json('channels.json', 'channels')
+    found = ytapi.get_channels(c['channel_id'] for c in channels)
+    titles = {channel_id: item['snippet']['title'] for channel_id, item in found.items()}
+    renamed = {}
+
+    def rename(channels):
+        for c in channels:
+            title = titles.get(c['channel_id'])
+            if title and title != c['name']:
+                c['name'] = title
+                renamed[c['channel_id']] = title
+        return channels if renamed else None
+
+    storage.update_items(os.path.join(BASE_DIR, 'channels.json'), 'channels', rename)
+    return renamed
 
 
 
@@ -218,11 +302,8 @@ def add_playlist():
     if not name or not playlist_id:
         return 'Name and Playlist ID are required', 400
 
-    playlists = load_json('playlists.json', 'playlists')
-    # Check for duplication
-    if not any(p['id'] == playlist_id for p in playlists):
-        playlists.append({'name': name, 'id': playlist_id})
-        save_json('playlists.json', 'playlists', playlists)
+    # Skipped if a playlist with this ID already exists
+    add_json_item('playlists.json', 'playlists', {'name': name, 'id': playlist_id}, 'id')
 
     return redirect(url_for('admin'))
 
@@ -232,9 +313,8 @@ def remove_playlist():
         return redirect(url_for('google.login'))
 
     playlist_id = request.form.get('playlist_id')
-    playlists = load_json('playlists.json', 'playlists')
-    updated_playlists = [p for p in playlists if p['id'] != playlist_id]
-    save_json('playlists.json', 'playlists', updated_playlists)
+    remove_json_item('playlists.json', 'playlists', 'id', playlist_id)
+    library.remove_source(playlist_id)
     return redirect(url_for('admin'))
 
 @app.route('/add_channel', methods=['POST'])
@@ -253,44 +333,66 @@ def add_channel():
 
     # Fetch channel name using YouTube API
     try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        request_ = youtube.channels().list(part='snippet', id=channel_id)
-        response = request_.execute()
-        items = response.get('items')
+        items = ytapi.get_channels([channel_id])
         if items:
-            channel_name = items[0]['snippet']['title']
-            channels = load_json('channels.json', 'channels')
-            # Check for duplication
-            if not any(c['channel_id'] == channel_id for c in channels):
-                channels.append({'name': channel_name, 'channel_id': channel_id})
-                save_json('channels.json', 'channels', channels)
+            channel_name = items[channel_id]['snippet']['title']
+            # Skipped if a channel with this ID already exists
+            add_json_item('channels.json', 'channels', {'name': channel_name, 'channel_id': channel_id}, 'channel_id')
         else:
             return 'Channel not found', 404
-    except HttpError as e:
+    except (ytapi.YouTubeApiError, requests.RequestException) as e:
         return f'YouTube API Error: {e}', 500
 
     return redirect(url_for('admin'))
 
+@app.route('/add_channels', methods=['POST'])
+def add_channels():
+    """
+    Bulk import. Takes channel links or IDs, one per line, in the `channel_links`
+    form field or as a JSON body {"links": [...]}.
+
+    Returns:
+        JSON report of added, existing, unresolved and not found channels.
+    """
+    if not current_user.is_authenticated:
+        return redirect(url_for('google.login'))
+
+    if request.is_json:
+        links = (request.get_json(silent=True) or {}).get('links', [])
+    else:
+        links = re.split(r'[\s,]+', request.form.get('channel_links', ''))
+    if not any(link.strip() for link in links):
+        return 'No channel links provided', 400
+
+    try:
+        report = import_channels(links)
+    except (ytapi.YouTubeApiError, requests.RequestException) as e:
+        return f'YouTube API Error: {e}', 500
+
+    return jsonify(report)
+
 @app.route('/remove_channel', methods=['POST'])
 def remove_channel():
     if not current_user.is_authenticated:
         return redirect(url_for('google.login'))
 
     channel_id = request.form.get('channel_id')
-    channels = load_json('channels.json', 'channels')
-    updated_channels = [c for c in channels if c['channel_id'] != channel_id]
-    save_json('channels.json', 'channels', updated_channels)
+    remove_json_item('channels.json', 'channels', 'channel_id', channel_id)
+    library.remove_source(channel_id)
     return redirect(url_for('admin'))
 
 @app.route('/api/playlists')
 def api_playlists():
-    playlists = load_json('playlists.json', 'playlists')
-    return jsonify(playlists)
+    return catalog_response(get_catalog(BASE_DIR, 'playlists.json', 'playlists'))
 
 @app.route('/api/channels')
 def api_channels():
-    channels = load_json('channels.json', 'channels')
-    return jsonify(channels)
+    return catalog_response(get_catalog(BASE_DIR, 'channels.json', 'channels'))
+
+@app.before_request
+def set_quota_route():
+    # YouTube calls made while handling this request are charged to its endpoint
+    quota.route_local.name = request.endpoint
 
 @app.route('/logout')
 def logout():
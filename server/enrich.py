@@ -0,0 +1,178 @@
+# enrich.py
+
+import atexit
+import logging
+import os
+import re
+import requests
+import metrics
+import state
+import ytapi
+from cache import PersistentLRUCache
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# videos.list parts fetched for every video (1 quota unit per call of up to 50 IDs)
+DETAIL_PARTS = 'contentDetails,statistics'
+
+# Videos at most this long count as Shorts
+SHORTS_MAX_DURATION = int(os.getenv('SHORTS_MAX_DURATION', '60'))
+
+SORT_KEYS = {
+    'duration': lambda video: video.get('duration') or 0,
+    'views': lambda video: video.get('views') or 0
+}
+
+# Durations and view counts per video ID. Durations never change; view counts are
+# allowed to be a few days old. Deleted and private videos are remembered for a day.
+DETAILS_TTL = int(os.getenv('VIDEO_DETAILS_TTL', str(7 * 86400)))
+details_cache = state.shared_cache('video_details', ttl=DETAILS_TTL) or PersistentLRUCache(
+    path=os.getenv('VIDEO_DETAILS_CACHE_FILE', os.path.join(BASE_DIR, 'video_details_cache.json')) or None,
+    max_entries=int(os.getenv('VIDEO_DETAILS_CACHE_SIZE', '200000')),
+    ttl=DETAILS_TTL
+)
+MISSING_VIDEO_TTL = 86400
+atexit.register(details_cache.save)
+metrics.register_cache('video_details', details_cache.stats)
+
+ISO_DURATION = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?')
+
+
+def parse_duration(value):
+    """
+    Args:
+        value (str): ISO 8601 duration as returned by videos.list, e.g. "PT1H2M3S".
+
+    Returns:
+        int: Length in seconds, or None for live streams ("P0D") and unparseable values.
+    """
+    match = ISO_DURATION.fullmatch(value or '')
+    if match is None:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    total = ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+    return total or None
+
+
+def video_details(item):
+    statistics = item.get('statistics', {})
+    return {
+        'duration': parse_duration(item.get('contentDetails', {}).get('duration')),
+        'views': int(statistics['viewCount']) if 'viewCount' in statistics else None,
+        'likes': int(statistics['likeCount']) if 'likeCount' in statistics else None
+    }
+
+
+def missing_ids(videos):
+    """
+    Returns:
+        list: IDs of `videos` without cached details, without duplicates.
+    """
+    return [video_id for video_id in dict.fromkeys(video['videoId'] for video in videos)
+            if details_cache.get(video_id) is None]
+
+
+def store(video_ids, response):
+    """
+    Caches the details in a videos.list response; requested IDs it left out are
+    remembered as unavailable.
+    """
+    found = set()
+    for item in response.get('items', []):
+        details_cache.set(item['id'], video_details(item))
+        found.add(item['id'])
+    for video_id in video_ids:
+        if video_id not in found:
+            details_cache.set(video_id, {}, ttl=MISSING_VIDEO_TTL)
+
+
+def fetch_details(video_ids):
+    """
+    Fetches and caches details for `video_ids` in videos.list calls of 50 IDs.
+    """
+    for batch in ytapi.batches(video_ids):
+        store(batch, ytapi.call('videos', part=DETAIL_PARTS, id=','.join(batch),
+                                maxResults=ytapi.MAX_IDS_PER_CALL))
+
+
+def annotate(videos):
+    """
+    Returns:
+        list: Copies of `videos` with the cached 'duration' (seconds), 'views' and 'likes'.
+        Fields are None for videos whose details are unknown or unavailable.
+    """
+    annotated = []
+    for video in videos:
+        details = details_cache.peek(video['videoId']) or {}
+        annotated.append({**video, 'duration': details.get('duration'), 'views': details.get('views'),
+                          'likes': details.get('likes')})
+    return annotated
+
+
+def parse_filters(args):
+    """
+    Reads the focus filters from request arguments:
+    details=1, min_duration=<seconds>, max_duration=<seconds>, exclude_shorts=1,
+    sort=duration|-duration|views|-views.
+
+    Returns:
+        dict: The filters, or None if the request asked for neither filters nor details.
+
+    Raises:
+        ValueError: On a malformed value.
+    """
+    filters = {}
+    for name in ('min_duration', 'max_duration'):
+        if args.get(name):
+            filters[name] = int(args[name])
+    if args.get('exclude_shorts') in ('1', 'true'):
+        filters['exclude_shorts'] = True
+    sort = args.get('sort')
+    if sort:
+        if sort.lstrip('-') not in SORT_KEYS:
+            raise ValueError(f'Unknown sort order {sort!r}.')
+        filters['sort'] = sort
+    if not filters and args.get('details') not in ('1', 'true'):
+        return None
+    return filters
+
+
+def apply_filters(videos, filters):
+    """
+    Filters and sorts annotated videos. Videos with an unknown duration are dropped
+    by any duration filter.
+    """
+    min_duration = filters.get('min_duration')
+    if filters.get('exclude_shorts'):
+        min_duration = max(min_duration or 0, SHORTS_MAX_DURATION + 1)
+    max_duration = filters.get('max_duration')
+
+    kept = []
+    for video in videos:
+        duration = video.get('duration')
+        if (min_duration is not None or max_duration is not None) and duration is None:
+            continue
+        if min_duration is not None and duration < min_duration:
+            continue
+        if max_duration is not None and duration > max_duration:
+            continue
+        kept.append(video)
+
+    sort = filters.get('sort')
+    if sort:
+        kept.sort(key=SORT_KEYS[sort.lstrip('-')], reverse=sort.startswith('-'))
+    return kept
+
+
+def enrich_videos(videos, filters):
+    """
+    Adds details to `videos` (one videos.list call per 50 uncached IDs) and applies `filters`.
+    If videos.list fails, the videos go out with the details already cached.
+    """
+    try:
+        fetch_details(missing_ids(videos))
+    except (ytapi.YouTubeApiError, requests.RequestException) as e:
+        logger.warning("Fetching video details failed: %s", e)
+    return apply_filters(annotate(videos), filters)
@@ -0,0 +1,83 @@
+# eval_classifier.py
+#
+# Offline evaluation of the local query classifier against recorded GPT verdicts.
+#
+#   python eval_classifier.py [--log verdict_log.jsonl] [--train-fraction 0.8]
+#
+# The log is split chronologically: the classifier is trained on the first part and
+# replayed over the rest, as it would have been in production.
+
+import argparse
+import json
+import os
+from classifier import QueryClassifier
+from filters import FILTERS
+from verdicts import VerdictLog
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def evaluate(examples, train_fraction, allow_threshold, deny_threshold, online=True):
+    split = int(len(examples) * train_fraction)
+    classifier = QueryClassifier(FILTERS, allow_threshold=allow_threshold, deny_threshold=deny_threshold)
+    classifier.fit(examples[:split])
+
+    agree = false_allow = false_deny = deferred = 0
+    by_term = term_errors = 0
+    for query, allowed in examples[split:]:
+        verdict, source = classifier.decide(query)
+        if source == 'term':
+            by_term += 1
+            term_errors += verdict != allowed
+        if verdict is None:
+            deferred += 1
+            # In production the GPT verdict is learned right after
+            if online:
+                classifier.add_example(query, allowed)
+        elif verdict == allowed:
+            agree += 1
+        elif verdict:
+            false_allow += 1
+        else:
+            false_deny += 1
+
+    tested = len(examples) - split
+    decided = tested - deferred
+    return {
+        'train': split,
+        'tested': tested,
+        'decided_locally': decided,
+        'gpt_calls_saved_ratio': round(decided / tested, 4) if tested else 0.0,
+        'agreement': round(agree / decided, 4) if decided else None,
+        'false_allow': false_allow,
+        'false_deny': false_deny,
+        # Decided by an off-topic term alone, without the scorer
+        'term_decisions': by_term,
+        'term_error_rate': round(term_errors / by_term, 4) if by_term else None,
+        'allow_threshold': allow_threshold,
+        'deny_threshold': deny_threshold
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the local query classifier on recorded GPT verdicts.')
+    parser.add_argument('--log', default=os.path.join(BASE_DIR, 'verdict_log.jsonl'))
+    parser.add_argument('--train-fraction', type=float, default=0.8)
+    parser.add_argument('--allow-threshold', type=float, default=0.95)
+    parser.add_argument('--deny-threshold', type=float, default=0.05)
+    parser.add_argument('--sweep', action='store_true', help='Also try a range of thresholds.')
+    args = parser.parse_args()
+
+    examples = VerdictLog(args.log).read()
+    if not examples:
+        parser.error(f'No verdicts found in {args.log}')
+
+    reports = [evaluate(examples, args.train_fraction, args.allow_threshold, args.deny_threshold)]
+    if args.sweep:
+        for margin in (0.01, 0.02, 0.05, 0.1, 0.2):
+            reports.append(evaluate(examples, args.train_fraction, 1 - margin, margin))
+    print(json.dumps(reports if args.sweep else reports[0], indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# eval_similar.py
+#
+# Offline replay of a query log through the near-duplicate index in similar.py: how often a
+# query would have reused the verdict or the search page of an earlier, similar one, whether
+# the reused verdicts were right, and how much the reused results overlap with its own.
+#
+#   python eval_similar.py [--log verdict_log.jsonl] [--results search_results.jsonl] [--fetch]
+#                          [--verdict-threshold 0.85] [--reuse-threshold 0.9]
+#                          [--refresh-threshold 0.8] [--sweep]
+#   python eval_similar.py --synthetic 500     (generated variations of a few topics)
+#
+# The log is replayed in order; its lines need 'query' and 'allowed', like the verdict log.
+# Result overlap needs each query's own first page: --results is a JSON-lines file of
+# {"query": ..., "results": [video IDs]}, and --fetch adds the missing pages to it with
+# search.list calls (100 quota units each).
+
+import argparse
+import json
+import os
+import random
+from dotenv import load_dotenv
+from bench_fakes import fake_verdict
+from classifier import QueryClassifier
+from filters import FILTERS
+from similar import SimilarityIndex
+from verdicts import VerdictLog, normalize_query
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SEARCH_QUOTA_COST = 100
+
+SYNTHETIC_TOPICS = ['python', 'linear algebra', 'guitar chords', 'rust ownership', 'sql joins', 'music theory',
+                    'operations research', 'java', 'javascript', 'calculus', 'minecraft', 'fortnite']
+SYNTHETIC_TEMPLATES = ['{}', 'learn {}', '{} tutorial', 'learning {}', '{} for beginners', '{} course',
+                       '{} explained', 'intro to {}', 'best {} videos', '{} lecture {}', '{} part {}']
+
+
+def synthetic_log(count, seed=1):
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(count):
+        template = rng.choice(SYNTHETIC_TEMPLATES)
+        query = template.format(rng.choice(SYNTHETIC_TOPICS), rng.randint(1, 5))
+        examples.append((query, fake_verdict(query) == 'ALLOW'))
+    return examples
+
+
+def search_key(query):
+    return ' '.join(query.lower().split())
+
+
+def load_results(path):
+    results = {}
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    results[search_key(row['query'])] = row['results']
+                except (ValueError, KeyError):
+                    continue
+    return results
+
+
+def fetch_results(queries, results, path):
+    """
+    Adds the first page of every query missing from `results`, appending it to `path`.
+    """
+    import ytapi
+    with open(path, 'a') as f:
+        for query in queries:
+            if search_key(query) in results:
+                continue
+            response = ytapi.call('search', part='id', q=query, type='video', maxResults=10)
+            ids = [item['id']['videoId'] for item in response.get('items', [])]
+            results[search_key(query)] = ids
+            f.write(json.dumps({'query': query, 'results': ids}) + '\n')
+
+
+def overlap(own, reused):
+    """Share of the query's own first page that the reused page also holds."""
+    return len(set(own) & set(reused)) / len(own) if own else None
+
+
+def evaluate(examples, results, verdict_threshold, reuse_threshold, refresh_threshold):
+    index = SimilarityIndex()
+    terms = QueryClassifier(FILTERS)
+    verdicts = {}       # normalized query -> verdict of its own
+    pages = {}          # search key -> query whose own first page is cached
+    counts = dict.fromkeys(('exact_verdicts', 'verdict_reuses', 'gpt_calls', 'false_allow', 'false_deny',
+                            'exact_pages', 'page_reuses', 'page_refreshes', 'searches'), 0)
+    overlaps = {'reuse': [], 'refresh': []}
+
+    for query, allowed in examples:
+        key = normalize_query(query)
+        if not key:
+            continue
+        if key in verdicts:
+            verdict = verdicts[key]
+            counts['exact_verdicts'] += 1
+        else:
+            match = index.find(query, verdict_threshold, lambda similar: verdicts.get(normalize_query(similar)))
+            if match is not None and terms.term_signal(query) != (-1 if match.value else 1):
+                verdict = match.value
+                counts['verdict_reuses'] += 1
+                if verdict != allowed:
+                    counts['false_allow' if verdict else 'false_deny'] += 1
+            else:
+                # Asked GPT: the logged verdict
+                verdict = verdicts[key] = allowed
+                counts['gpt_calls'] += 1
+                index.add(query)
+        if not verdict:
+            continue
+
+        if search_key(query) in pages:
+            counts['exact_pages'] += 1
+            continue
+        match = index.find(query, refresh_threshold, lambda similar: pages.get(search_key(similar)))
+        if match is None:
+            counts['searches'] += 1
+        else:
+            band = 'reuse' if match.similarity >= reuse_threshold else 'refresh'
+            counts['page_reuses' if band == 'reuse' else 'page_refreshes'] += 1
+            own, reused = results.get(search_key(query)), results.get(search_key(match.value))
+            if own is not None and reused is not None:
+                overlaps[band].append(overlap(own, reused))
+            if band == 'reuse':
+                continue
+        # Searched now, or loaded in the background after serving the similar page
+        pages[search_key(query)] = query
+        index.add(query)
+
+    validated = counts['verdict_reuses'] + counts['gpt_calls']
+    borrowed = counts['page_reuses'] + counts['page_refreshes']
+    return {
+        'queries': len(examples),
+        **counts,
+        'verdict_reuse_rate': round(counts['verdict_reuses'] / validated, 4) if validated else 0.0,
+        'verdict_agreement': (round(1 - (counts['false_allow'] + counts['false_deny']) / counts['verdict_reuses'], 4)
+                              if counts['verdict_reuses'] else None),
+        'page_reuse_rate': round(borrowed / (borrowed + counts['searches']), 4) if borrowed + counts['searches'] else 0.0,
+        'quota_units_saved': counts['page_reuses'] * SEARCH_QUOTA_COST,
+        'result_overlap': {band: round(sum(values) / len(values), 4) if values else None
+                           for band, values in overlaps.items()},
+        'overlap_pairs': {band: len(values) for band, values in overlaps.items()},
+        'verdict_threshold': verdict_threshold,
+        'reuse_threshold': reuse_threshold,
+        'refresh_threshold': refresh_threshold
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a query log through the near-duplicate query index.')
+    parser.add_argument('--log', default=os.path.join(BASE_DIR, 'verdict_log.jsonl'))
+    parser.add_argument('--synthetic', type=int, help='Replay this many generated queries instead of a log.')
+    parser.add_argument('--results', default=os.path.join(BASE_DIR, 'search_results.jsonl'))
+    parser.add_argument('--fetch', action='store_true', help='Fetch missing first pages from YouTube.')
+    parser.add_argument('--verdict-threshold', type=float, default=0.85)
+    parser.add_argument('--reuse-threshold', type=float, default=0.9)
+    parser.add_argument('--refresh-threshold', type=float, default=0.8)
+    parser.add_argument('--sweep', action='store_true', help='Also try a range of thresholds.')
+    args = parser.parse_args()
+
+    examples = synthetic_log(args.synthetic) if args.synthetic else VerdictLog(args.log).read()
+    if not examples:
+        parser.error(f'No verdicts found in {args.log}')
+    results = load_results(args.results)
+    if args.fetch:
+        load_dotenv()
+        fetch_results([query for query, allowed in examples if allowed], results, args.results)
+
+    reports = [evaluate(examples, results, args.verdict_threshold, args.reuse_threshold, args.refresh_threshold)]
+    if args.sweep:
+        for threshold in (0.7, 0.75, 0.8, 0.85, 0.9, 0.95):
+            reports.append(evaluate(examples, results, threshold, max(threshold, args.reuse_threshold), threshold))
+    print(json.dumps(reports if args.sweep else reports[0], indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# filters.py
+
+# Allowed filters for query validation
+FILTERS = (
+    "computer science, programming, software engineering, anything I'd study at the Faculty of Organizational Sciences "
+    "in Belgrade (operations research, management, IT-related topics), learning guitar. "
+    "Basically anything that has to do with tech, science, learning to play guitar, music in general, ex-yu rock is good"
+)
@@ -1,18 +1,70 @@
-from openai import OpenAI
-client = OpenAI(api_key='api key')
+import threading
 
+# The OpenAI client (and the openai package itself) is only loaded on the first askGpt call,
+# keeping it off the startup path
+client = None
+async_client = None
+client_lock = threading.Lock()
 
-def askGpt(prompt):
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
+
+def get_client():
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                from openai import OpenAI
+                # Retries and timeouts are left to upstream.openai, which knows the request deadline
+                client = OpenAI(api_key='api key', max_retries=0)
+    return client
+
+
+def get_async_client(http_client=None):
+    """
+    Client for the async serving mode; `http_client` is the pooled httpx.AsyncClient to send through.
+    """
+    global async_client
+    if async_client is None:
+        with client_lock:
+            if async_client is None:
+                from openai import AsyncOpenAI
+                async_client = AsyncOpenAI(api_key='api key', http_client=http_client, max_retries=0)
+    return async_client
+
+
+def completion_args(prompt):
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
             {"role": "system", "content": "You are a helpful assistant."},
             {
                 "role": "user",
                 "content": f"{prompt}"
             }
         ]
-    )
+    }
+
+
+def askGpt(prompt, timeout=None):
+    completion = complete(completion_args(prompt), timeout)
 
     #print(completion.choices[0].message.content)
     return completion.choices[0].message.content
+
+
+async def askGptAsync(prompt, http_client=None, timeout=None):
+    completion = await complete_async(completion_args(prompt), http_client, timeout)
+    return completion.choices[0].message.content
+
+
+def complete(args, timeout=None):
+    """
+    Sends chat.completions.create arguments as they are (e.g. from validation.ValidationEngine).
+
+    Returns:
+        ChatCompletion: The whole completion, usage and logprobs included.
+    """
+    return get_client().chat.completions.create(**args, timeout=timeout)
+
+
+async def complete_async(args, http_client=None, timeout=None):
+    return await get_async_client(http_client).chat.completions.create(**args, timeout=timeout)
@@ -0,0 +1,46 @@
+# import_channels.py
+#
+# Bulk channel import and title refresh for channels.json.
+#
+#   python import_channels.py LINK_OR_ID [LINK_OR_ID ...]
+#   python import_channels.py --file channels.txt
+#   python import_channels.py --refresh
+#
+# --refresh is meant to run as a scheduled task; it renames channels whose
+# YouTube title changed, using one channels.list call per 50 channels.
+
+import argparse
+import json
+import sys
+from docs import import_channels, refresh_channel_titles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import channels into channels.json or refresh their titles.')
+    parser.add_argument('links', nargs='*', help='Channel URLs or IDs.')
+    parser.add_argument('--file', help='File with one channel URL or ID per line.')
+    parser.add_argument('--refresh', action='store_true', help='Refresh the titles of all known channels.')
+    parser.add_argument('--workers', type=int, default=8, help='Links resolved concurrently.')
+    args = parser.parse_args()
+
+    links = list(args.links)
+    if args.file:
+        with open(args.file, 'r') as f:
+            links += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    if not links and not args.refresh:
+        parser.error('Give channel links, --file or --refresh.')
+
+    result = {}
+    if links:
+        result['import'] = import_channels(links, max_workers=args.workers)
+    if args.refresh:
+        result['renamed'] = refresh_channel_titles()
+    print(json.dumps(result, indent=4))
+
+    if links and result['import']['unresolved'] + result['import']['not_found']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# index_library.py
+#
+# Rebuilds the full-text library index served by /api/library/search.
+#
+#   python index_library.py                  (every channel and playlist)
+#   python index_library.py ID [ID ...]      (only these channel or playlist IDs)
+#
+# Costs one playlistItems.list unit per 50 videos, plus one channels.list unit per channel.
+
+import argparse
+import json
+import os
+import sys
+import storage
+from dotenv import load_dotenv
+from library import library, index_channel, index_playlist
+from ytapi import YouTubeApiError
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the videos of the curated channels and playlists.')
+    parser.add_argument('ids', nargs='*', help='Channel or playlist IDs to reindex (default: all).')
+    args = parser.parse_args()
+    load_dotenv()
+
+    channels = storage.read_items(os.path.join(BASE_DIR, 'channels.json'), 'channels')
+    playlists = storage.read_items(os.path.join(BASE_DIR, 'playlists.json'), 'playlists')
+    sources = [(index_channel, c, c['channel_id']) for c in channels] + [(index_playlist, p, p['id']) for p in playlists]
+
+    result = {'indexed': {}, 'failed': {}, 'removed': []}
+    if not args.ids:
+        result['removed'] = library.prune(source_id for _, _, source_id in sources)
+    for index, entry, source_id in sources:
+        if args.ids and source_id not in args.ids:
+            continue
+        try:
+            result['indexed'][source_id] = index(library, entry)
+        except (YouTubeApiError, OSError) as e:
+            result['failed'][source_id] = str(e)
+    result['library'] = library.stats()
+    print(json.dumps(result, indent=4))
+
+    if result['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
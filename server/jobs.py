@@ -0,0 +1,233 @@
+# jobs.py
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks on a job started by another worker process
+REMOTE_POLL_INTERVAL = 0.1
+
+
+class Job:
+    def __init__(self, query):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.status = 'pending'
+        self.payload = None
+        self.status_code = None
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def finish(self, payload, status_code):
+        self.payload = payload
+        self.status_code = status_code
+        self.status = 'done' if status_code == 200 else 'error'
+        self.finished = time.time()
+        self.done.set()
+
+    def record(self):
+        return {'query': self.query, 'status': self.status, 'payload': self.payload, 'status_code': self.status_code}
+
+    @classmethod
+    def from_record(cls, job_id, record):
+        """
+        Rebuilds a job another worker process published to the shared results.
+        """
+        job = cls(record.get('query'))
+        job.id = job_id
+        if record['status'] != 'pending':
+            job.finish(record['payload'], record['status_code'])
+        return job
+
+
+class SharedResults:
+    """
+    Publishes job states to a shared store (state.SharedCache) so that a job started
+    by one worker process can be collected through any other.
+    """
+
+    def _publish(self, job):
+        if self.results is not None:
+            self.results.set(job.id, job.record(), ttl=self.ttl)
+
+    def _fetch(self, job_id):
+        if self.results is None:
+            return None
+        record = self.results.peek(job_id)
+        return Job.from_record(job_id, record) if record is not None else None
+
+
+class JobQueue(SharedResults):
+    """
+    Runs search jobs on a bounded worker pool and keeps their results around
+    long enough for the client that started them to collect them.
+
+    Args:
+        max_workers (int): Number of worker threads.
+        max_pending (int): Jobs allowed to be queued or running at once.
+        ttl (int): Seconds a finished job stays retrievable.
+        results (SharedCache): Optional store shared with the other worker processes.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64, ttl=300, results=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search-job')
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.results = results
+        self.jobs = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, query, fn, *args):
+        """
+        Starts `fn(*args)` as a job. `fn` must return a (payload, status_code) tuple.
+
+        Returns:
+            Job: The tracked job, or None if the queue is full.
+        """
+        with self.lock:
+            self._expire()
+            if self.pending >= self.max_pending:
+                return None
+            job = Job(query)
+            self.jobs[job.id] = job
+            self.pending += 1
+        self._publish(job)
+        self.executor.submit(self._run, job, fn, *args)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job if job is not None else self._fetch(job_id)
+
+    def wait(self, job_id, timeout):
+        """
+        Blocks until the job finishes or `timeout` seconds pass. Jobs of other worker
+        processes are polled in the shared results.
+
+        Returns:
+            Job: The job (check `job.done`), or None if the id is unknown.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+            return job
+
+        deadline = time.time() + timeout
+        job = self._fetch(job_id)
+        while job is not None and not job.done.is_set() and time.time() < deadline:
+            time.sleep(min(REMOTE_POLL_INTERVAL, max(deadline - time.time(), 0)))
+            job = self._fetch(job_id)
+        return job
+
+    def _run(self, job, fn, *args):
+        try:
+            payload, status_code = fn(*args)
+        except Exception:
+            logger.exception("Search job %s failed", job.id)
+            payload, status_code = {'error': 'An error occurred during the search.'}, 500
+        job.finish(payload, status_code)
+        self._publish(job)
+        with self.lock:
+            self.pending -= 1
+
+    def _expire(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished is not None and now - job.finished > self.ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+class AsyncJobQueue(SharedResults):
+    """
+    JobQueue for the asyncio serving mode: each job is a task on the event loop
+    instead of a worker thread, so waiting on GPT and YouTube costs no thread.
+
+    Args:
+        max_pending (int): Jobs allowed to be running at once.
+        ttl (int): Seconds a finished job stays retrievable.
+        results (SharedCache): Optional store shared with the other worker processes.
+    """
+
+    def __init__(self, max_pending=1024, ttl=300, results=None):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.results = results
+        self.jobs = {}
+        self.tasks = {}
+        self.pending = 0
+
+    def submit(self, query, fn, *args):
+        """
+        Starts the coroutine `fn(*args)` as a job. It must return a (payload, status_code) tuple.
+
+        Returns:
+            Job: The tracked job, or None if the queue is full.
+        """
+        self._expire()
+        if self.pending >= self.max_pending:
+            return None
+        job = Job(query)
+        self.jobs[job.id] = job
+        self.pending += 1
+        self.tasks[job.id] = asyncio.get_running_loop().create_task(self._run(job, fn, *args))
+        return job
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return job if job is not None else await self._off_loop(self._fetch, job_id)
+
+    async def wait(self, job_id, timeout):
+        """
+        Waits until the job finishes or `timeout` seconds pass.
+
+        Returns:
+            Job: The job (check `job.done`), or None if the id is unknown.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            task = self.tasks.get(job_id)
+            if task is not None and timeout > 0:
+                await asyncio.wait({task}, timeout=timeout)
+            return job
+
+        deadline = time.time() + timeout
+        job = await self._off_loop(self._fetch, job_id)
+        while job is not None and not job.done.is_set() and time.time() < deadline:
+            await asyncio.sleep(min(REMOTE_POLL_INTERVAL, max(deadline - time.time(), 0)))
+            job = await self._off_loop(self._fetch, job_id)
+        return job
+
+    async def _off_loop(self, fn, *args):
+        # The shared store is a database or a network round trip away
+        if self.results is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _run(self, job, fn, *args):
+        await self._off_loop(self._publish, job)
+        try:
+            payload, status_code = await fn(*args)
+        except Exception:
+            logger.exception("Search job %s failed", job.id)
+            payload, status_code = {'error': 'An error occurred during the search.'}, 500
+        job.finish(payload, status_code)
+        await self._off_loop(self._publish, job)
+        self.pending -= 1
+        self.tasks.pop(job.id, None)
+
+    def _expire(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished is not None and now - job.finished > self.ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -0,0 +1,353 @@
+# library.py
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import metrics
+import ytapi
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT,
+    playlist_id TEXT,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    published_at TEXT
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    source_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    position INTEGER,
+    PRIMARY KEY (source_id, video_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS memberships_video ON memberships (video_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+    title, description, content='videos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS videos_ai AFTER INSERT ON videos BEGIN
+    INSERT INTO videos_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS videos_ad AFTER DELETE ON videos BEGIN
+    INSERT INTO videos_fts (videos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS videos_au AFTER UPDATE ON videos BEGIN
+    INSERT INTO videos_fts (videos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    INSERT INTO videos_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+END;
+"""
+
+# bm25 column weights: a match in the title counts ten times one in the description
+RANK = 'bm25(videos_fts, 10.0, 1.0)'
+
+# Playlist entries YouTube keeps around for removed videos
+UNAVAILABLE_TITLES = {'Private video', 'Deleted video'}
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as a prefix
+    so results show up while the user is still typing. FTS5 operators in the text are
+    taken literally.
+
+    Returns:
+        str: The MATCH expression, or None if the text has no words.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def playlist_entries(response):
+    """
+    Returns:
+        list: {'videoId', 'title', 'description', 'publishedAt'} for the available
+        videos of a playlistItems.list page.
+    """
+    entries = []
+    for item in response.get('items', []):
+        snippet = item['snippet']
+        if snippet.get('title') in UNAVAILABLE_TITLES:
+            continue
+        entries.append({
+            'videoId': snippet['resourceId']['videoId'],
+            'title': snippet['title'],
+            'description': snippet.get('description', ''),
+            'publishedAt': snippet.get('publishedAt')
+        })
+    return entries
+
+
+class Library:
+    """
+    Full-text index of the videos in the curated channels and playlists, kept in SQLite.
+
+    A video listed by several sources is stored and ranked once. Each thread gets its
+    own connection; WAL mode lets searches run while a source is being reindexed.
+
+    Args:
+        path (str): SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as db:
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def replace_source(self, source_id, kind, name, videos, playlist_id=None):
+        """
+        Replaces everything indexed for one channel or playlist with `videos`
+        (as returned by playlist_entries, newest first for channels).
+        """
+        with self.connect() as db:
+            db.execute("""
+                INSERT INTO sources (source_id, kind, name, playlist_id, indexed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (source_id) DO UPDATE SET kind = excluded.kind, name = excluded.name,
+                    playlist_id = excluded.playlist_id, indexed_at = excluded.indexed_at
+            """, (source_id, kind, name, playlist_id, time.time()))
+            db.execute('DELETE FROM memberships WHERE source_id = ?', (source_id,))
+            self._upsert_videos(db, videos)
+            db.executemany('INSERT OR IGNORE INTO memberships (source_id, video_id, position) VALUES (?, ?, ?)',
+                           [(source_id, video['videoId'], position) for position, video in enumerate(videos)])
+            self._delete_orphans(db)
+
+    def prepend_videos(self, source_id, videos):
+        """
+        Adds videos uploaded since the source was indexed ahead of the ones it has,
+        keeping the newest-first order of channel uploads.
+        """
+        if not videos:
+            return
+        with self.connect() as db:
+            first = db.execute('SELECT coalesce(min(position), 0) FROM memberships WHERE source_id = ?',
+                               (source_id,)).fetchone()[0]
+            self._upsert_videos(db, videos)
+            db.executemany('INSERT OR IGNORE INTO memberships (source_id, video_id, position) VALUES (?, ?, ?)',
+                           [(source_id, video['videoId'], first - len(videos) + i) for i, video in enumerate(videos)])
+            db.execute('UPDATE sources SET indexed_at = ? WHERE source_id = ?', (time.time(), source_id))
+
+    def remove_source(self, source_id):
+        with self.connect() as db:
+            db.execute('DELETE FROM memberships WHERE source_id = ?', (source_id,))
+            db.execute('DELETE FROM sources WHERE source_id = ?', (source_id,))
+            self._delete_orphans(db)
+
+    def prune(self, source_ids):
+        """
+        Drops every indexed source not in `source_ids`, e.g. ones removed from the
+        catalogs while the app was not running.
+
+        Returns:
+            list: IDs of the dropped sources.
+        """
+        keep = set(source_ids)
+        stale = [row[0] for row in self.connect().execute('SELECT source_id FROM sources') if row[0] not in keep]
+        for source_id in stale:
+            self.remove_source(source_id)
+        return stale
+
+    def _upsert_videos(self, db, videos):
+        # Only changed rows are rewritten, so unchanged videos leave the FTS index alone
+        db.executemany("""
+            INSERT INTO videos (video_id, title, description, published_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (video_id) DO UPDATE SET title = excluded.title, description = excluded.description,
+                published_at = excluded.published_at
+            WHERE title IS NOT excluded.title OR description IS NOT excluded.description
+                OR published_at IS NOT excluded.published_at
+        """, [(v['videoId'], v['title'], v.get('description') or '', v.get('publishedAt')) for v in videos])
+
+    def _delete_orphans(self, db):
+        db.execute('DELETE FROM videos WHERE NOT EXISTS (SELECT 1 FROM memberships m WHERE m.video_id = videos.video_id)')
+
+    def source(self, source_id):
+        """
+        Returns:
+            dict: The indexed source's 'kind', 'name', 'playlist_id', 'indexed_at' and
+            'videos' count, or None if it is not indexed.
+        """
+        row = self.connect().execute("""
+            SELECT kind, name, playlist_id, indexed_at,
+                   (SELECT count(*) FROM memberships m WHERE m.source_id = s.source_id) AS videos
+            FROM sources s WHERE source_id = ?
+        """, (source_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def source_videos(self, source_id):
+        """
+        Returns:
+            list: {'videoId', 'title'} of the source's videos in playlist order (newest
+            first for channels), or None if the source is not indexed.
+        """
+        if self.source(source_id) is None:
+            return None
+        with metrics.STORAGE_LATENCY.time(operation='library_source_videos', file='library.db'):
+            rows = self.connect().execute("""
+                SELECT v.video_id, v.title FROM memberships m JOIN videos v ON v.video_id = m.video_id
+                WHERE m.source_id = ? ORDER BY m.position
+            """, (source_id,)).fetchall()
+        return [{'videoId': row['video_id'], 'title': row['title']} for row in rows]
+
+    def known_ids(self, source_id, video_ids):
+        """
+        Returns:
+            set: The IDs in `video_ids` already indexed for the source.
+        """
+        if not video_ids:
+            return set()
+        placeholders = ','.join('?' * len(video_ids))
+        return {row[0] for row in self.connect().execute(
+            f'SELECT video_id FROM memberships WHERE source_id = ? AND video_id IN ({placeholders})',
+            [source_id, *video_ids])}
+
+    def search(self, query, offset=0, limit=20, source_id=None):
+        """
+        Ranks indexed videos against `query` by BM25, title matches first.
+
+        Args:
+            query (str): Free text.
+            offset (int): Results to skip.
+            limit (int): Results to return.
+            source_id (str): Only search this channel or playlist.
+
+        Returns:
+            dict: 'total' matches and the page of 'results', each with 'videoId', 'title',
+            'snippet' (description excerpt), 'publishedAt' and the 'sources' listing it.
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return {'total': 0, 'results': []}
+
+        where = 'videos_fts MATCH ?'
+        params = [expression]
+        if source_id is not None:
+            where += ' AND EXISTS (SELECT 1 FROM memberships m WHERE m.video_id = v.video_id AND m.source_id = ?)'
+            params.append(source_id)
+
+        db = self.connect()
+        with metrics.STORAGE_LATENCY.time(operation='library_search', file='library.db'):
+            total = db.execute(f"""
+                SELECT count(*) FROM videos_fts JOIN videos v ON v.id = videos_fts.rowid WHERE {where}
+            """, params).fetchone()[0]
+            rows = db.execute(f"""
+                SELECT v.video_id, v.title, v.published_at,
+                       snippet(videos_fts, 1, '', '', '…', 24) AS snippet
+                FROM videos_fts JOIN videos v ON v.id = videos_fts.rowid
+                WHERE {where}
+                ORDER BY {RANK}, v.published_at DESC
+                LIMIT ? OFFSET ?
+            """, params + [limit, offset]).fetchall()
+            sources = self._sources_of(db, [row['video_id'] for row in rows])
+
+        return {
+            'total': total,
+            'results': [{
+                'videoId': row['video_id'],
+                'title': row['title'],
+                'snippet': row['snippet'],
+                'publishedAt': row['published_at'],
+                'sources': sources.get(row['video_id'], [])
+            } for row in rows]
+        }
+
+    def _sources_of(self, db, video_ids):
+        if not video_ids:
+            return {}
+        placeholders = ','.join('?' * len(video_ids))
+        sources = {}
+        for row in db.execute(f"""
+            SELECT m.video_id, s.source_id, s.kind, s.name FROM memberships m
+            JOIN sources s ON s.source_id = m.source_id WHERE m.video_id IN ({placeholders})
+        """, video_ids):
+            sources.setdefault(row['video_id'], []).append(
+                {'kind': row['kind'], 'id': row['source_id'], 'name': row['name']})
+        return sources
+
+    def stats(self):
+        db = self.connect()
+        counts = {kind: count for kind, count in db.execute('SELECT kind, count(*) FROM sources GROUP BY kind')}
+        return {
+            'videos': db.execute('SELECT count(*) FROM videos').fetchone()[0],
+            'channels': counts.get('channel', 0),
+            'playlists': counts.get('playlist', 0)
+        }
+
+
+def fetch_playlist(playlist_id, first_page=None):
+    """
+    Reads every page of a playlist.
+
+    Args:
+        playlist_id (str): Playlist to read.
+        first_page (dict): Already fetched playlistItems response for the first page.
+
+    Returns:
+        list: playlist_entries() of all pages, in playlist order.
+    """
+    videos = []
+    response = first_page
+    if response is None:
+        response = fetch_page(playlist_id)
+    while True:
+        videos.extend(playlist_entries(response))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return videos
+        response = fetch_page(playlist_id, page_token)
+
+
+def fetch_page(playlist_id, page_token=None):
+    return ytapi.call('playlistItems', part='snippet', playlistId=playlist_id, maxResults=50, pageToken=page_token)
+
+
+def index_channel(library, channel):
+    """
+    Indexes the uploads of a channels.json entry.
+
+    Returns:
+        int: Videos indexed, or None if the channel no longer exists.
+    """
+    playlist_id = ytapi.get_uploads_playlist_id(channel['channel_id'])
+    if playlist_id is None:
+        return None
+    videos = fetch_playlist(playlist_id)
+    library.replace_source(channel['channel_id'], 'channel', channel.get('name'), videos, playlist_id)
+    return len(videos)
+
+
+def index_playlist(library, playlist):
+    """
+    Indexes a playlists.json entry.
+
+    Returns:
+        int: Videos indexed.
+    """
+    videos = fetch_playlist(playlist['id'])
+    library.replace_source(playlist['id'], 'playlist', playlist.get('name'), videos, playlist['id'])
+    return len(videos)
+
+
+library = Library(os.getenv('LIBRARY_DB', os.path.join(BASE_DIR, 'library.db')))
@@ -0,0 +1,221 @@
+# metrics.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+registry = []
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.append(self)
+
+    def key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{format_labels(labels)} {value}" for name, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * len(self.buckets) + [0, 0.0]    # buckets, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, counts in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (('le', bound),), count))
+                samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), counts[-2]))
+                samples.append((f"{self.name}_count", key, counts[-2]))
+                samples.append((f"{self.name}_sum", key, round(counts[-1], 6)))
+        return samples
+
+
+class Callback(Metric):
+    """
+    Metric whose samples are read at scrape time from `fn()`, which returns
+    a list of (labels dict, value) pairs.
+    """
+
+    def __init__(self, name, help, fn, type='gauge'):
+        super().__init__(name, help)
+        self.fn = fn
+        self.type = type
+
+    def samples(self):
+        return [(self.name, tuple(labels.items()), value) for labels, value in self.fn()]
+
+
+REQUEST_LATENCY = Histogram('focustube_request_duration_seconds', 'HTTP request latency by route.',
+                            ['route', 'method', 'status'])
+REQUESTS_IN_FLIGHT = Gauge('focustube_requests_in_flight', 'HTTP requests currently being handled.', ['route'])
+UPSTREAM_LATENCY = Histogram('focustube_upstream_duration_seconds', 'Latency of calls to OpenAI and YouTube.',
+                             ['upstream', 'operation'])
+UPSTREAM_ERRORS = Counter('focustube_upstream_errors_total', 'Failed calls to OpenAI and YouTube.',
+                          ['upstream', 'operation'])
+STORAGE_LATENCY = Histogram('focustube_storage_duration_seconds', 'Time spent reading and writing the JSON catalogs.',
+                            ['operation', 'file'], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+
+@contextmanager
+def upstream_call(upstream, operation):
+    """
+    Times an upstream call and counts it as an error if the block raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream=upstream, operation=operation)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, upstream=upstream, operation=operation)
+
+
+caches = {}
+
+
+def cache_samples(field):
+    def fn():
+        samples = []
+        for name, stats in list(caches.items()):
+            value = stats().get(field)
+            if value is not None:
+                samples.append(({'cache': name}, value))
+        return samples
+    return fn
+
+
+CACHE_HITS = Callback('focustube_cache_hits_total', 'Cache hits (fresh only for stale-while-revalidate caches).', cache_samples('hits'),
+                      type='counter')
+CACHE_STALE_HITS = Callback('focustube_cache_stale_hits_total', 'Cache hits served stale.',
+                            cache_samples('stale_hits'), type='counter')
+CACHE_MISSES = Callback('focustube_cache_misses_total', 'Cache misses.', cache_samples('misses'), type='counter')
+CACHE_HIT_RATIO = Callback('focustube_cache_hit_ratio', 'Cache hit ratio since start.', cache_samples('hit_ratio'))
+CACHE_ENTRIES = Callback('focustube_cache_entries', 'Entries held by each cache.', cache_samples('size'))
+
+
+def register_cache(name, stats):
+    """
+    Exposes the counters returned by a cache's stats() method under the `cache` label.
+    """
+    caches[name] = stats
+
+
+def render():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+def init_app(app, timing_header=None):
+    """
+    Installs request timing hooks and the /metrics endpoint.
+
+    Args:
+        timing_header (bool): Add a Server-Timing header to every response.
+            Defaults to the TIMING_HEADER environment variable.
+    """
+    if timing_header is None:
+        timing_header = os.getenv('TIMING_HEADER', '0') == '1'
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_route = request.endpoint or 'unmatched'
+        REQUESTS_IN_FLIGHT.inc(route=g.metrics_route)
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            REQUEST_LATENCY.observe(elapsed, route=g.metrics_route, method=request.method,
+                                    status=response.status_code)
+            if timing_header:
+                response.headers['Server-Timing'] = f'app;dur={elapsed * 1000:.1f}'
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            REQUESTS_IN_FLIGHT.dec(route=route)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,223 @@
+# quota.py
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from storage import atomic_write_json, file_lock
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# YouTube Data API v3 cost, in quota units, of one call to each list endpoint
+QUOTA_COSTS = {
+    'search': 100,
+    'channels': 1,
+    'playlistItems': 1,
+    'playlists': 1,
+    'videos': 1
+}
+
+# Work priorities for the scheduler
+HIGH = 'high'       # interactive request with nothing cached to fall back on
+NORMAL = 'normal'   # interactive request that could be answered from stale data
+LOW = 'low'         # background refreshes, prefetching, speculation
+
+# The daily quota resets at midnight Pacific time (the tzdata package supplies the zone
+# where the OS has no zone database, as on Windows)
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+route_local = threading.local()
+
+
+@contextmanager
+def route(name):
+    """
+    Attributes YouTube calls made by this thread inside the block to `name`.
+    """
+    previous = getattr(route_local, 'name', None)
+    route_local.name = name
+    try:
+        yield
+    finally:
+        route_local.name = previous
+
+
+def current_route():
+    """
+    The route set with route(), else the thread's pool name (e.g. 'cache-refresh').
+    """
+    name = getattr(route_local, 'name', None)
+    if name:
+        return name
+    return threading.current_thread().name.rsplit('_', 1)[0]
+
+
+class QuotaLedger:
+    """
+    Counts YouTube quota units spent per endpoint and per route for the current quota day,
+    and decides which work is still worth spending quota on.
+
+    Each worker process keeps unsaved deltas in memory and adds them to the shared
+    ledger file under a file lock, so totals stay right across gunicorn workers.
+
+    Args:
+        daily_budget (int): Units available per day.
+        path (str): Ledger file; None keeps the ledger in memory only.
+        low_reserve (float): Fraction of the budget below which LOW work is refused.
+        normal_reserve (float): Fraction of the budget below which NORMAL work is refused.
+        flush_interval (float): Minimum seconds between writes to `path`.
+    """
+
+    def __init__(self, daily_budget=10000, path=None, low_reserve=0.3, normal_reserve=0.1, flush_interval=10):
+        self.daily_budget = daily_budget
+        self.path = path
+        self.low_reserve = low_reserve
+        self.normal_reserve = normal_reserve
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.day = self.today()
+        self.totals = {'endpoints': {}, 'routes': {}, 'exhausted': False}
+        self.pending = {'endpoints': {}, 'routes': {}, 'exhausted': False}
+        self.last_flush = 0
+        self.flush()
+
+    @staticmethod
+    def today():
+        return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def _roll_day(self):
+        day = self.today()
+        if day != self.day:
+            self.day = day
+            self.totals = {'endpoints': {}, 'routes': {}, 'exhausted': False}
+            self.pending = {'endpoints': {}, 'routes': {}, 'exhausted': False}
+
+    def record(self, endpoint, units=None, route_name=None, flush=True):
+        """
+        Charges one call to `endpoint` (units default to QUOTA_COSTS).
+
+        With `flush=False` the ledger file is left alone; the caller (e.g. on an event loop)
+        checks flush_due() and runs flush() where blocking is allowed.
+        """
+        units = QUOTA_COSTS.get(endpoint, 1) if units is None else units
+        route_name = route_name or current_route()
+        with self.lock:
+            self._roll_day()
+            for bucket in (self.totals, self.pending):
+                bucket['endpoints'][endpoint] = bucket['endpoints'].get(endpoint, 0) + units
+                bucket['routes'][route_name] = bucket['routes'].get(route_name, 0) + units
+        if flush and self.flush_due():
+            self.flush()
+
+    def flush_due(self):
+        """
+        Returns:
+            bool: Whether the ledger file should be written now. Claims the write, so
+            concurrent callers do not all flush.
+        """
+        with self.lock:
+            if time.time() - self.last_flush <= self.flush_interval:
+                return False
+            self.last_flush = time.time()
+            return True
+
+    def mark_exhausted(self):
+        """Called when YouTube itself reports quotaExceeded."""
+        with self.lock:
+            self._roll_day()
+            self.totals['exhausted'] = self.pending['exhausted'] = True
+        self.flush()
+
+    def spent(self):
+        with self.lock:
+            self._roll_day()
+            if self.totals['exhausted']:
+                return self.daily_budget
+            return sum(self.totals['endpoints'].values())
+
+    def remaining(self):
+        return max(self.daily_budget - self.spent(), 0)
+
+    def allow(self, priority, units=1):
+        """
+        Returns:
+            bool: Whether work of `priority` costing `units` should run now.
+        """
+        remaining = self.remaining() - units
+        if priority == LOW:
+            return remaining >= self.daily_budget * self.low_reserve
+        if priority == NORMAL:
+            return remaining >= self.daily_budget * self.normal_reserve
+        return remaining >= 0
+
+    def flush(self):
+        """
+        Adds this process's unsaved usage to the ledger file and reloads the combined totals.
+        """
+        self.last_flush = time.time()
+        if not self.path:
+            return
+        with file_lock(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    saved = json.load(f)
+            except (FileNotFoundError, ValueError):
+                saved = {}
+            with self.lock:
+                self._roll_day()
+                if saved.get('day') != self.day:
+                    saved = {'day': self.day, 'endpoints': {}, 'routes': {}, 'exhausted': False}
+                for key in ('endpoints', 'routes'):
+                    for name, units in self.pending[key].items():
+                        saved[key][name] = saved[key].get(name, 0) + units
+                saved['exhausted'] = saved.get('exhausted', False) or self.pending['exhausted']
+                self.pending = {'endpoints': {}, 'routes': {}, 'exhausted': False}
+                self.totals = {'endpoints': dict(saved['endpoints']), 'routes': dict(saved['routes']),
+                               'exhausted': saved['exhausted']}
+            atomic_write_json(self.path, saved, indent=4)
+
+    def snapshot(self):
+        spent = self.spent()
+        with self.lock:
+            return {
+                'day': self.day,
+                'daily_budget': self.daily_budget,
+                'spent': spent,
+                'remaining': max(self.daily_budget - spent, 0),
+                'exhausted': self.totals['exhausted'],
+                'by_endpoint': dict(self.totals['endpoints']),
+                'by_route': dict(self.totals['routes']),
+                'allows': {
+                    LOW: self.daily_budget - spent >= self.daily_budget * self.low_reserve,
+                    NORMAL: self.daily_budget - spent >= self.daily_budget * self.normal_reserve,
+                    HIGH: spent < self.daily_budget
+                }
+            }
+
+
+ledger_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """
+    `quota.ledger`, shared by every module that calls YouTube. Built on first use, so
+    importing this module reads no ledger file, and the configuration is read after the
+    entry point has loaded .env.
+    """
+    if name != 'ledger':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with ledger_lock:
+        if 'ledger' not in globals():
+            shared = QuotaLedger(
+                daily_budget=int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000')),
+                path=os.getenv('QUOTA_LEDGER_FILE', os.path.join(BASE_DIR, 'quota_ledger.json')) or None,
+                low_reserve=float(os.getenv('QUOTA_LOW_RESERVE', '0.3')),
+                normal_reserve=float(os.getenv('QUOTA_NORMAL_RESERVE', '0.1'))
+            )
+            atexit.register(shared.flush)
+            globals()['ledger'] = shared
+        return globals()['ledger']
@@ -0,0 +1,167 @@
+# similar.py
+
+import math
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from verdicts import normalize_query
+
+# Words that barely change what a query is about: their n-grams count for little
+FILLER_WORDS = {
+    'a', 'an', 'and', 'basic', 'basics', 'beginner', 'best', 'complete', 'course', 'easy', 'explained',
+    'for', 'full', 'guide', 'how', 'in', 'intro', 'introduction', 'learn', 'lesson', 'of', 'on', 'the',
+    'to', 'tutorial', 'video', 'with'
+}
+FILLER_WEIGHT = 0.25
+
+# Numbers tell apart "lecture 3" and "lecture 7": their n-grams count double
+NUMBER_WEIGHT = 2.0
+
+SUFFIXES = ('ing', 'ers', 'er', 'ed', 'es', 's')
+
+# best match: the stored query, its cosine similarity and what `accept` returned for it
+Match = namedtuple('Match', ['query', 'similarity', 'value'])
+
+
+def stem(word):
+    """Crude suffix stripping, so "learning" and "learn" share their n-grams."""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+FILLER_STEMS = {stem(word) for word in FILLER_WORDS}
+
+
+def vectorize(query, n=3):
+    """
+    Weighted character n-grams of the stemmed words of a query, each word padded with
+    spaces so its start and end count. Word order is ignored.
+
+    Returns:
+        dict: n-gram -> weight.
+    """
+    vector = {}
+    for word in re.findall(r'\w+', query.lower()):
+        stemmed = stem(word)
+        if stemmed in FILLER_STEMS:
+            weight = FILLER_WEIGHT
+        elif word.isdigit():
+            weight = NUMBER_WEIGHT
+        else:
+            weight = 1.0
+        padded = f' {stemmed} '
+        for i in range(max(len(padded) - n + 1, 1)):
+            gram = padded[i:i + n]
+            vector[gram] = vector.get(gram, 0.0) + weight
+    return vector
+
+
+def norm(vector):
+    return math.sqrt(sum(w * w for w in vector.values()))
+
+
+class SimilarityIndex:
+    """
+    Index of past queries for finding near-duplicates ("learn python", "python learning",
+    "learning python tutorial") by cosine similarity of weighted character n-grams.
+
+    Only the queries are stored; callers look up what they reuse (verdicts, search pages)
+    in their own caches through `accept`. Candidates are gathered from an inverted index,
+    rarest n-grams first, so a lookup scores at most `max_candidates` queries.
+
+    Args:
+        max_entries (int): Queries kept before the least recently added is dropped.
+        max_candidates (int): Queries scored per lookup.
+        n (int): N-gram length.
+    """
+
+    def __init__(self, max_entries=20000, max_candidates=200, n=3):
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.n = n
+        self.entries = OrderedDict()    # normalized query -> (query, vector, norm)
+        self.postings = {}              # n-gram -> set of normalized queries
+        self.lock = threading.Lock()
+        self.lookups = 0
+
+    def add(self, query):
+        key = normalize_query(query)
+        if not key:
+            return
+        vector = vectorize(query, self.n)
+        query = ' '.join(query.split())
+        with self.lock:
+            if key in self.entries:
+                # Keep the latest spelling: it is the one the caches were just written for
+                _, vector, length = self.entries.pop(key)
+                self.entries[key] = (query, vector, length)
+                return
+            self.entries[key] = (query, vector, norm(vector))
+            for gram in vector:
+                self.postings.setdefault(gram, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(*self.entries.popitem(last=False))
+
+    def fit(self, queries):
+        for query in queries:
+            self.add(query)
+
+    def _remove(self, key, entry):
+        for gram in entry[1]:
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def similar(self, query, threshold):
+        """
+        Returns:
+            list: (stored query, similarity) pairs at or above `threshold`, most similar
+            first. A query never matches its own normalized form.
+        """
+        key = normalize_query(query)
+        vector = vectorize(query, self.n)
+        length = norm(vector)
+        if not length:
+            return []
+        with self.lock:
+            self.lookups += 1
+            candidates = set()
+            for gram in sorted(vector, key=lambda g: len(self.postings.get(g, ()))):
+                candidates.update(self.postings.get(gram, ()))
+                if len(candidates) >= self.max_candidates:
+                    break
+            candidates.discard(key)
+            scored = []
+            for candidate in candidates:
+                stored, stored_vector, stored_length = self.entries[candidate]
+                dot = sum(w * stored_vector.get(gram, 0.0) for gram, w in vector.items())
+                similarity = dot / (length * stored_length)
+                if similarity >= threshold:
+                    scored.append((stored, similarity))
+        scored.sort(key=lambda pair: -pair[1])
+        return scored
+
+    def find(self, query, threshold, accept=None):
+        """
+        Returns:
+            Match: The most similar stored query at or above `threshold` for which
+            `accept(stored query)` returns something other than None, or None.
+        """
+        for stored, similarity in self.similar(query, threshold):
+            value = accept(stored) if accept is not None else True
+            if value is not None:
+                return Match(stored, round(similarity, 4), value)
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'ngrams': len(self.postings),
+                'lookups': self.lookups
+            }
@@ -0,0 +1,250 @@
+# singleflight.py
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from storage import atomic_write_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+# Shared results older than this are pruned from the shared directory
+PRUNE_AGE = 600
+
+# Threads blocked on cross-process locks, and reading and writing the shared results,
+# for the asyncio serving mode
+lock_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='singleflight-lock')
+
+
+class SharedCallError(Exception):
+    """Raised in a process that waited on a call another process made, when that call failed."""
+
+
+class SharedFlights:
+    """
+    Cross-process half of single-flight: the process making a call holds a file lock
+    for its key and leaves the outcome in a small JSON file. A process that had to wait
+    for the lock reads that outcome instead of repeating the call, as long as it was
+    written after it started waiting.
+
+    Args:
+        directory (str): Directory shared by the worker processes.
+        name (str): Prefix keeping different kinds of calls apart.
+    """
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.last_prune = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.directory, f'{self.name}-{digest}.json')
+
+    def lock(self, key):
+        return file_lock(self.path(key))
+
+    def read(self, key, since):
+        """
+        Returns:
+            dict: {'result': ...} or {'error': message} written after `since`, else None.
+        """
+        try:
+            with open(self.path(key), 'r') as f:
+                shared = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if shared.get('key') != key or shared.get('finished', 0) < since:
+            return None
+        return shared
+
+    def write(self, key, result=None, error=None):
+        shared = {'key': key, 'finished': time.time()}
+        if error is not None:
+            shared['error'] = str(error)
+        else:
+            shared['result'] = result
+        try:
+            atomic_write_json(self.path(key), shared)
+        except (TypeError, ValueError, OSError) as e:
+            logger.warning("Could not share the result of %r: %s", key, e)
+        self.prune()
+
+    def prune(self):
+        now = time.time()
+        if now - self.last_prune < PRUNE_AGE:
+            return
+        self.last_prune = now
+        for filename in os.listdir(self.directory):
+            # Never the .lock sidecars: unlinking one while a worker holds it would let the
+            # next worker lock a new file and run the same call concurrently
+            if not filename.startswith(f'{self.name}-') or filename.endswith('.lock'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if now - os.path.getmtime(path) > PRUNE_AGE:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+
+def shared_outcome(shared):
+    if 'error' in shared:
+        raise SharedCallError(shared['error'])
+    return shared['result']
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs `fn`, the
+    others wait for it and get its result or its exception.
+
+    Args:
+        name (str): Kind of call, used in stats and shared file names.
+        shared_dir (str): Directory for coalescing across worker processes; None
+            coalesces within this process only.
+    """
+
+    def __init__(self, name, shared_dir=None):
+        self.name = name
+        self.shared = SharedFlights(shared_dir, name) if shared_dir else None
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.counts = {'calls': 0, 'coalesced': 0, 'coalesced_shared': 0}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.counts['calls'] += 1
+            else:
+                self.counts['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = self._run(key, fn)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, key, fn):
+        if self.shared is None:
+            return fn()
+        started = time.time()
+        with self.shared.lock(key):
+            shared = self.shared.read(key, started)
+            if shared is not None:
+                with self.lock:
+                    self.counts['calls'] -= 1
+                    self.counts['coalesced_shared'] += 1
+                return shared_outcome(shared)
+            try:
+                result = fn()
+            except Exception as e:
+                self.shared.write(key, error=e)
+                raise
+            self.shared.write(key, result)
+            return result
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, 'in_flight': len(self.calls)}
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for the asyncio serving mode: `fn` returns a coroutine and waiting
+    callers await a future. The cross-process lock and the shared result files are
+    handled on worker threads.
+    """
+
+    async def do(self, key, fn):
+        call = self.calls.get(key)
+        if call is not None:
+            self.counts['coalesced'] += 1
+            return await asyncio.shield(call)
+
+        call = self.calls[key] = asyncio.get_running_loop().create_future()
+        self.counts['calls'] += 1
+        try:
+            result = await self._run(key, fn)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # Waiters were not cancelled themselves; give them an ordinary error
+                e = SharedCallError('The coalesced call was cancelled.')
+            call.set_exception(e)
+            # Mark the exception retrieved in case nobody else was waiting
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+    async def _run(self, key, fn):
+        if self.shared is None:
+            return await fn()
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        lock = self.shared.lock(key)
+        acquiring = loop.run_in_executor(lock_pool, lock.__enter__)
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The lock is still taken on the worker thread; let go of it once it is
+            acquiring.add_done_callback(lambda f: f.exception() or lock.__exit__(None, None, None))
+            raise
+        try:
+            shared = await loop.run_in_executor(lock_pool, self.shared.read, key, started)
+            if shared is not None:
+                self.counts['calls'] -= 1
+                self.counts['coalesced_shared'] += 1
+                return shared_outcome(shared)
+            try:
+                result = await fn()
+            except Exception as e:
+                await loop.run_in_executor(lock_pool, functools.partial(self.shared.write, key, error=e))
+                raise
+            await loop.run_in_executor(lock_pool, self.shared.write, key, result)
+            return result
+        finally:
+            # Unlocking never waits, unlike locking
+            lock.__exit__(None, None, None)
+
+
+def combined_stats(flights):
+    """
+    Returns:
+        dict: Name -> summed stats of the flights with that name.
+    """
+    combined = {}
+    for flight in flights:
+        totals = combined.setdefault(flight.name, {})
+        for field, value in flight.stats().items():
+            totals[field] = totals.get(field, 0) + value
+    return combined
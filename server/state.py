@@ -0,0 +1,405 @@
+# state.py
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    In-process key/value store with the same interface as the shared backends, shared by
+    the threads of one process only. The app does not use it: with STATE_BACKEND=memory
+    its caches stay the in-process ones (see shared_cache()). stress_state.py tests
+    it as the reference for the other backends.
+
+    Values are stored as JSON text, like in the shared backends, so callers never
+    get back an object another thread can mutate.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is evicted.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key -> (json text, expires_at)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl):
+        self.entries[key] = (value, time.time() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def compare_and_set(self, key, expected, value, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            current = entry[0] if entry is not None and entry[1] >= time.time() else None
+            if current != expected:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {'backend': self.name, 'size': len(self.entries), 'max_entries': self.max_entries}
+
+
+class SQLiteBackend:
+    """
+    Key/value store in an SQLite database in WAL mode, shared by every worker process
+    on the node. Compare-and-set runs in an IMMEDIATE transaction. Once the table grows
+    past `max_entries`, expired rows and then the least recently written are deleted.
+
+    Args:
+        path (str): Database file.
+        max_entries (int): Size bound.
+        prune_every (int): Writes between size checks.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_entries=100000, prune_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.writes = 0
+        self.local = threading.local()
+        with self.connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    written_at REAL NOT NULL
+                )
+            """)
+            db.execute('CREATE INDEX IF NOT EXISTS state_written ON state (written_at)')
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def get(self, key):
+        row = self.connect().execute('SELECT value FROM state WHERE key = ? AND expires_at >= ?',
+                                     (key, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, key, value, ttl):
+        with self.connect() as db:
+            self._store(db, key, value, ttl)
+        self._wrote()
+
+    def _store(self, db, key, value, ttl):
+        now = time.time()
+        db.execute('INSERT OR REPLACE INTO state (key, value, expires_at, written_at) VALUES (?, ?, ?, ?)',
+                   (key, value, now + ttl, now))
+
+    def delete(self, key):
+        with self.connect() as db:
+            db.execute('DELETE FROM state WHERE key = ?', (key,))
+
+    def compare_and_set(self, key, expected, value, ttl):
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('SELECT value FROM state WHERE key = ? AND expires_at >= ?',
+                             (key, time.time())).fetchone()
+            if (row[0] if row is not None else None) != expected:
+                return False
+            self._store(db, key, value, ttl)
+        self._wrote()
+        return True
+
+    def _wrote(self):
+        self.writes += 1
+        if self.writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        with self.connect() as db:
+            db.execute('DELETE FROM state WHERE expires_at < ?', (time.time(),))
+            db.execute("""
+                DELETE FROM state WHERE key IN (
+                    SELECT key FROM state ORDER BY written_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def stats(self):
+        size = self.connect().execute('SELECT count(*) FROM state').fetchone()[0]
+        return {'backend': self.name, 'size': size, 'max_entries': self.max_entries}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RespConnection:
+    """
+    Minimal client for the Redis serialization protocol (RESP2), enough for
+    GET/SET/DEL and WATCH/MULTI/EXEC.
+    """
+
+    def __init__(self, host, port, db=0, password=None, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.command('AUTH', password)
+        if db:
+            self.command('SELECT', db)
+
+    def command(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self.sock.sendall(b''.join(parts))
+        return self.read()
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Redis connection closed.')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)[:-2]
+            return data.decode('utf-8')
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read() for _ in range(length)]
+        raise RedisError(f'Unexpected reply {line!r}')
+
+    def close(self):
+        self.sock.close()
+
+
+class RedisBackend:
+    """
+    Key/value store on a Redis-protocol server (Redis, Valkey, KeyDB, ...), shared by
+    every worker that can reach it. Every key gets a TTL; the size bound is the
+    server's own (configure maxmemory with an allkeys-lru or volatile-lru policy).
+    Compare-and-set uses WATCH/MULTI/EXEC, so it needs no server-side scripting.
+
+    Args:
+        url (str): redis://[:password@]host[:port][/db]
+    """
+
+    name = 'redis'
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.local = threading.local()
+
+    def connection(self):
+        # One connection per thread, as WATCH state belongs to the connection
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = RespConnection(self.host, self.port, self.db, self.password)
+        return conn
+
+    def command(self, *args):
+        try:
+            return self.connection().command(*args)
+        except (OSError, ConnectionError):
+            # The server may have closed an idle connection; retry once on a new one
+            self.local.conn = None
+            return self.connection().command(*args)
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, value, ttl):
+        self.command('SET', key, value, 'PX', max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def compare_and_set(self, key, expected, value, ttl):
+        if expected is None:
+            return self.command('SET', key, value, 'PX', max(int(ttl * 1000), 1), 'NX') is not None
+        conn = self.connection()
+        try:
+            conn.command('WATCH', key)
+            if conn.command('GET', key) != expected:
+                conn.command('UNWATCH')
+                return False
+            conn.command('MULTI')
+            conn.command('SET', key, value, 'PX', max(int(ttl * 1000), 1))
+            return conn.command('EXEC') is not None
+        except (OSError, ConnectionError):
+            self.local.conn = None
+            raise
+
+    def stats(self):
+        return {'backend': self.name, 'size': self.command('DBSIZE'), 'server': f'{self.host}:{self.port}'}
+
+
+def backend_from_env():
+    """
+    Builds the backend chosen with STATE_BACKEND: 'sqlite' (STATE_DB, shared by the
+    workers of one node) or 'redis' (STATE_REDIS_URL). 'memory' (default) builds none.
+    """
+    kind = os.getenv('STATE_BACKEND', 'memory')
+    max_entries = int(os.getenv('STATE_MAX_ENTRIES', '100000'))
+    if kind == 'sqlite':
+        path = os.getenv('STATE_DB') or os.path.join(tempfile.gettempdir(), 'focustube-state.db')
+        return SQLiteBackend(path, max_entries=max_entries)
+    if kind == 'redis':
+        return RedisBackend(os.getenv('STATE_REDIS_URL', 'redis://127.0.0.1:6379/0'))
+    if kind != 'memory':
+        raise ValueError(f'Unknown STATE_BACKEND {kind!r}.')
+    return None
+
+
+class SharedCache:
+    """
+    LRUCache-compatible view of one namespace of a state backend, so caches can be
+    shared between worker processes by swapping the object they use.
+
+    Args:
+        backend: MemoryBackend, SQLiteBackend or RedisBackend.
+        namespace (str): Key prefix keeping this cache apart from others.
+        ttl (float): Default seconds an entry stays valid.
+    """
+
+    def __init__(self, backend, namespace, ttl=300):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get(self, key):
+        value = self.peek(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key):
+        try:
+            text = self.backend.get(self.key(key))
+        except (OSError, ConnectionError, RedisError, sqlite3.Error) as e:
+            self._failed('read', e)
+            return None
+        return json.loads(text) if text is not None else None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(self.key(key), json.dumps(value), self.ttl if ttl is None else ttl)
+        except (OSError, ConnectionError, RedisError, sqlite3.Error) as e:
+            self._failed('write', e)
+
+    def delete(self, key):
+        try:
+            self.backend.delete(self.key(key))
+        except (OSError, ConnectionError, RedisError, sqlite3.Error) as e:
+            self._failed('delete', e)
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        """
+        Sets `key` to `value` only if it currently holds `expected` (None: is absent).
+
+        Returns:
+            bool: Whether the value was set.
+        """
+        expected = json.dumps(expected) if expected is not None else None
+        return self.backend.compare_and_set(self.key(key), expected, json.dumps(value),
+                                            self.ttl if ttl is None else ttl)
+
+    def _failed(self, operation, error):
+        # A broken shared store degrades to cache misses instead of failed requests
+        with self.lock:
+            self.errors += 1
+        logger.warning("State backend %s in %r failed: %s", operation, self.namespace, error)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def save(self):
+        """Nothing to do: every write already went to the backend."""
+
+
+# The node's state backend, chosen once per process (None: state stays in-process)
+backend = backend_from_env()
+
+
+def stats():
+    """
+    Returns:
+        dict: The shared backend's stats, or None when there is none.
+    """
+    return backend.stats() if backend is not None else None
+
+
+def shared_cache(namespace, ttl=300):
+    """
+    Returns:
+        SharedCache: A view of `namespace` in the shared backend, or None when state
+        is kept in-process (STATE_BACKEND=memory) and callers should use their own caches.
+    """
+    if backend is None:
+        return None
+    return SharedCache(backend, namespace, ttl)
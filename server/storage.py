@@ -0,0 +1,111 @@
+# storage.py
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows: single-process development only
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive inter-process lock for `path`, held on a sidecar `.lock` file so the
+    data file itself can be replaced while locked.
+    """
+    with open(f"{path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """
+    Writes `data` to a temporary file next to `path`, fsyncs it and renames it over
+    `path`. Readers see either the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def read_items(path, key):
+    """
+    Reads the list stored under `key`. Never blocks on writers.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get(key, [])
+    except FileNotFoundError:
+        return []
+
+
+def write_items(path, key, items):
+    with file_lock(path):
+        atomic_write_json(path, {key: items}, indent=4)
+
+
+def update_items(path, key, update):
+    """
+    Applies `update(items)` to the current on-disk list under the file lock.
+
+    `update` returns the new list, or None to leave the file untouched. Because the
+    list is re-read inside the lock, concurrent updates from other threads or
+    worker processes are never lost.
+
+    Returns:
+        bool: True if the file was rewritten.
+    """
+    with file_lock(path):
+        items = read_items(path, key)
+        updated = update(items)
+        if updated is None:
+            return False
+        atomic_write_json(path, {key: updated}, indent=4)
+        return True
+
+
+def add_item(path, key, item, id_field):
+    """
+    Appends `item` unless an item with the same `id_field` already exists.
+
+    Returns:
+        bool: True if the item was added.
+    """
+    def add(items):
+        if any(i.get(id_field) == item[id_field] for i in items):
+            return None
+        return items + [item]
+    return update_items(path, key, add)
+
+
+def remove_item(path, key, id_field, value):
+    """
+    Removes every item whose `id_field` equals `value`.
+
+    Returns:
+        bool: True if anything was removed.
+    """
+    def remove(items):
+        kept = [i for i in items if i.get(id_field) != value]
+        return kept if len(kept) != len(items) else None
+    return update_items(path, key, remove)
@@ -0,0 +1,130 @@
+# stress_state.py
+#
+# Stress test for the state.py backends: many processes (threads for the in-process
+# backend) increment one counter with compare-and-set and write their own keys, then
+# the counter, TTL expiry and the size bound are checked.
+#
+#   python stress_state.py [--backend sqlite|redis|memory|all] [--processes 8] [--operations 200]
+#                          [--redis-url redis://127.0.0.1:6379/0]
+#
+# Without --redis-url the redis backend runs against the fake server in bench_fakes.py.
+# Exits with status 1 if an increment was lost or a bound was not kept.
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import state
+from bench_fakes import start_redis
+
+COUNTER = 'stress:counter'
+
+
+def make_backend(kind, target, max_entries):
+    if kind == 'sqlite':
+        return state.SQLiteBackend(target, max_entries=max_entries, prune_every=50)
+    if kind == 'redis':
+        return state.RedisBackend(target)
+    return target
+
+
+def increment(backend):
+    """
+    Returns:
+        int: Compare-and-set attempts the increment took.
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        current = backend.get(COUNTER)
+        if backend.compare_and_set(COUNTER, current, str(int(current or 0) + 1), 600):
+            return attempts
+
+
+def worker(kind, target, max_entries, worker_id, operations, conflicts):
+    backend = make_backend(kind, target, max_entries)
+    retries = 0
+    for i in range(operations):
+        retries += increment(backend) - 1
+        backend.set(f'stress:{worker_id}:{i}', json.dumps({'worker': worker_id, 'i': i}), 600)
+    conflicts.put(retries)
+
+
+def run(kind, processes, operations, target, max_entries):
+    shared = kind != 'memory'
+    conflicts = multiprocessing.Queue() if shared else _ThreadQueue()
+    start = time.perf_counter()
+    workers = [(multiprocessing.Process if shared else threading.Thread)(
+        target=worker, args=(kind, target, max_entries, w, operations, conflicts)) for w in range(processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    backend = make_backend(kind, target, max_entries)
+    counter = int(backend.get(COUNTER) or 0)
+    backend.set('stress:short', '1', 0.2)
+    time.sleep(0.3)
+    expired = backend.get('stress:short') is None
+    if kind == 'sqlite':
+        backend.prune()
+    size = backend.stats()['size']
+    return {
+        'backend': kind,
+        'processes': processes,
+        'operations_per_process': operations,
+        'expected_counter': processes * operations,
+        'counter': counter,
+        'cas_retries': sum(conflicts.get() for _ in range(processes)),
+        'ttl_expired': expired,
+        'size': size,
+        'max_entries': max_entries,
+        'increments_per_second': round(processes * operations / elapsed, 1)
+    }
+
+
+class _ThreadQueue(list):
+    put = list.append
+
+    def get(self):
+        return self.pop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent compare-and-set stress test for state.py')
+    parser.add_argument('--backend', default='all', choices=('memory', 'sqlite', 'redis', 'all'))
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--redis-url', help='Real Redis-protocol server to test instead of the fake one.')
+    args = parser.parse_args()
+
+    # Writers add operations + 1 keys each; the bound must keep the store smaller than that
+    max_entries = args.processes * args.operations // 2
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in (('memory', 'sqlite', 'redis') if args.backend == 'all' else (args.backend,)):
+            if kind == 'sqlite':
+                target = os.path.join(directory, 'state.db')
+            elif kind == 'redis':
+                target = args.redis_url or start_redis(max_keys=max_entries)[1]
+            else:
+                target = state.MemoryBackend(max_entries=max_entries)
+            result = run(kind, args.processes, args.operations, target, max_entries)
+            if kind == 'redis' and args.redis_url:
+                # A real server's size bound is its own maxmemory setting
+                result['max_entries'] = None
+            results.append(result)
+
+    print(json.dumps(results, indent=4))
+    failed = [r for r in results if r['counter'] != r['expected_counter'] or not r['ttl_expired']
+              or (r['max_entries'] is not None and r['size'] > r['max_entries'])]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
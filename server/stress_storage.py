@@ -0,0 +1,69 @@
+# stress_storage.py
+#
+# Stress test for storage.py: many processes add and remove items in one JSON file
+# concurrently, then the file is checked for lost or resurrected writes.
+#
+#   python stress_storage.py [--processes 8] [--operations 200]
+#
+# Exits with status 1 if any write was lost.
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import storage
+
+KEY = 'channels'
+
+
+def worker(path, worker_id, operations):
+    # Every worker adds its own items and removes every other one again
+    for i in range(operations):
+        item_id = f"{worker_id}-{i}"
+        storage.add_item(path, KEY, {'name': item_id, 'channel_id': item_id}, 'channel_id')
+        if i % 2:
+            storage.remove_item(path, KEY, 'channel_id', item_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent add/remove stress test for storage.py')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'channels.json')
+        storage.write_items(path, KEY, [])
+
+        processes = [multiprocessing.Process(target=worker, args=(path, w, args.operations))
+                     for w in range(args.processes)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+
+        with open(path, 'r') as f:
+            items = json.load(f)[KEY]
+
+    expected = {f"{w}-{i}" for w in range(args.processes) for i in range(args.operations) if i % 2 == 0}
+    found = [item['channel_id'] for item in items]
+    lost = expected - set(found)
+    unexpected = set(found) - expected
+    duplicates = len(found) - len(set(found))
+
+    print(json.dumps({
+        'processes': args.processes,
+        'operations_per_process': args.operations,
+        'expected_items': len(expected),
+        'found_items': len(found),
+        'lost': len(lost),
+        'unexpected': len(unexpected),
+        'duplicates': duplicates
+    }, indent=4))
+    sys.exit(1 if lost or unexpected or duplicates else 0)
+
+
+if __name__ == '__main__':
+    main()
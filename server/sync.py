@@ -0,0 +1,296 @@
+# sync.py
+#
+# Background sync of the curated channels and playlists into the library index.
+#
+#   python sync.py           (one pass, e.g. from cron)
+#   python sync.py --full    (one pass re-reading every source in full)
+#
+# The app runs the same pass every LIBRARY_SYNC_INTERVAL seconds on a background thread,
+# the first LIBRARY_SYNC_DELAY seconds after it starts.
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import requests
+import metrics
+import quota
+import storage
+import upstream
+import ytapi
+from dotenv import load_dotenv
+from library import fetch_page, library, playlist_entries
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds between sync passes; 0 turns the background worker off
+SYNC_INTERVAL = int(os.getenv('LIBRARY_SYNC_INTERVAL', '3600'))
+
+# Seconds the background worker waits before its first pass, so starting (or importing) the
+# app makes no YouTube calls
+SYNC_DELAY = int(os.getenv('LIBRARY_SYNC_DELAY', '300'))
+
+# Channels are read in full this often, so deleted uploads drop out of the index
+FULL_SYNC_INTERVAL = int(os.getenv('LIBRARY_FULL_SYNC_INTERVAL', str(7 * 86400)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    source_id TEXT PRIMARY KEY,
+    etag TEXT,
+    synced_at REAL,
+    full_synced_at REAL,
+    changed_at REAL,
+    new_videos INTEGER NOT NULL DEFAULT 0,
+    not_modified INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_runs (
+    name TEXT PRIMARY KEY,
+    started_at REAL,
+    finished_at REAL
+);
+"""
+
+
+class LibrarySync:
+    """
+    Keeps the library index in step with channels.json and playlists.json.
+
+    Each source's first page is requested with the ETag of the last sync, so an
+    unchanged source costs one empty 304 response. A changed channel is read page by
+    page only until the first video already indexed, and the new uploads are put in
+    front; a changed playlist, whose new entries can be anywhere, is read in full.
+    Sync spends LOW priority quota and stops when the budget runs low.
+
+    Args:
+        library (Library): Index to keep up to date.
+        catalog_dir (str): Directory holding channels.json and playlists.json.
+    """
+
+    def __init__(self, library, catalog_dir):
+        self.library = library
+        self.catalog_dir = catalog_dir
+        self.lock = threading.Lock()
+        self.progress = {'running': False, 'done': 0, 'total': 0, 'current': None}
+        self.thread = None
+        with library.connect() as db:
+            db.executescript(SCHEMA)
+
+    def sources(self):
+        channels = storage.read_items(os.path.join(self.catalog_dir, 'channels.json'), 'channels')
+        playlists = storage.read_items(os.path.join(self.catalog_dir, 'playlists.json'), 'playlists')
+        return ([('channel', c['channel_id'], c.get('name')) for c in channels]
+                + [('playlist', p['id'], p.get('name')) for p in playlists])
+
+    def claim(self, interval):
+        """
+        Starts a pass unless another worker process started one within `interval` seconds.
+
+        Returns:
+            bool: Whether this process should run the pass.
+        """
+        now = time.time()
+        with self.library.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute("SELECT started_at FROM sync_runs WHERE name = 'library'").fetchone()
+            if row is not None and row[0] is not None and now - row[0] < interval:
+                return False
+            db.execute("INSERT INTO sync_runs (name, started_at) VALUES ('library', ?) "
+                       "ON CONFLICT (name) DO UPDATE SET started_at = excluded.started_at", (now,))
+            return True
+
+    def run_once(self, full=False):
+        """
+        Syncs every source once.
+
+        Returns:
+            dict: Per-source outcome ('new_videos', 'not_modified', 'error' or 'skipped').
+        """
+        sources = self.sources()
+        self.library.prune(source_id for _, source_id, _ in sources)
+        with self.library.connect() as db:
+            db.execute('DELETE FROM sync_state WHERE source_id NOT IN (SELECT source_id FROM sources)')
+        with self.lock:
+            self.progress = {'running': True, 'done': 0, 'total': len(sources), 'current': None,
+                             'started_at': time.time()}
+
+        results = {}
+        try:
+            with quota.route('library-sync'):
+                for kind, source_id, name in sources:
+                    with self.lock:
+                        self.progress['current'] = source_id
+                    if not quota.ledger.allow(quota.LOW, 1):
+                        results[source_id] = 'skipped'
+                    else:
+                        try:
+                            results[source_id] = self.sync_source(kind, source_id, name, full)
+                        except (ytapi.YouTubeApiError, requests.RequestException, upstream.UpstreamUnavailable) as e:
+                            logger.warning("Syncing %s %s failed: %s", kind, source_id, e)
+                            self.save_state(source_id, error=str(e))
+                            results[source_id] = 'error'
+                    with self.lock:
+                        self.progress['done'] += 1
+        finally:
+            # Even a pass cut short by an unexpected error ends, so /admin/sync stops showing it
+            with self.lock:
+                self.progress.update(running=False, current=None, finished_at=time.time())
+            with self.library.connect() as db:
+                db.execute("UPDATE sync_runs SET finished_at = ? WHERE name = 'library'", (time.time(),))
+        return results
+
+    def sync_source(self, kind, source_id, name, full=False):
+        state = self.state(source_id)
+        indexed = self.library.source(source_id)
+        units = 0
+
+        playlist_id = indexed['playlist_id'] if indexed else None
+        if playlist_id is None:
+            if kind == 'channel':
+                playlist_id = ytapi.get_uploads_playlist_id(source_id)
+                units += 1
+                if playlist_id is None:
+                    self.save_state(source_id, units=units, error='Channel not found on YouTube.')
+                    return 'error'
+            else:
+                playlist_id = source_id
+
+        # A full rescan ignores the ETag; otherwise only playlists are read in full once they change
+        rescan = full or indexed is None or time.time() - (state.get('full_synced_at') or 0) > FULL_SYNC_INTERVAL
+        first_page, etag = ytapi.conditional_call('playlistItems', None if rescan else state.get('etag'),
+                                                  part='snippet', playlistId=playlist_id, maxResults=50)
+        units += 1
+        if first_page is None:
+            self.save_state(source_id, units=units, not_modified=True)
+            return 'not_modified'
+
+        if rescan or kind == 'playlist':
+            videos = []
+            page = first_page
+            while True:
+                videos.extend(playlist_entries(page))
+                if not page.get('nextPageToken'):
+                    break
+                page = fetch_page(playlist_id, page['nextPageToken'])
+                units += 1
+            new_videos = len(videos) - (indexed['videos'] if indexed else 0)
+            self.library.replace_source(source_id, kind, name, videos, playlist_id)
+            self.save_state(source_id, etag=etag, units=units, new_videos=max(new_videos, 0), full=rescan)
+            return {'new_videos': max(new_videos, 0), 'full': True}
+
+        new = []
+        page = first_page
+        while True:
+            entries = playlist_entries(page)
+            known = self.library.known_ids(source_id, [entry['videoId'] for entry in entries])
+            # Uploads are newest first: everything from the first known video on is indexed already
+            reached = next((i for i, entry in enumerate(entries) if entry['videoId'] in known), None)
+            new.extend(entries[:reached])
+            if reached is not None or not page.get('nextPageToken'):
+                break
+            page = fetch_page(playlist_id, page['nextPageToken'])
+            units += 1
+        self.library.prepend_videos(source_id, new)
+        self.save_state(source_id, etag=etag, units=units, new_videos=len(new))
+        return {'new_videos': len(new), 'full': False}
+
+    def state(self, source_id):
+        row = self.library.connect().execute('SELECT * FROM sync_state WHERE source_id = ?', (source_id,)).fetchone()
+        return dict(row) if row is not None else {}
+
+    def save_state(self, source_id, etag=None, units=0, new_videos=0, not_modified=False, full=False, error=None):
+        now = time.time()
+        with self.library.connect() as db:
+            db.execute('INSERT OR IGNORE INTO sync_state (source_id) VALUES (?)', (source_id,))
+            db.execute("""
+                UPDATE sync_state SET
+                    etag = coalesce(?, etag),
+                    synced_at = CASE WHEN ? IS NULL THEN ? ELSE synced_at END,
+                    full_synced_at = CASE WHEN ? THEN ? ELSE full_synced_at END,
+                    changed_at = CASE WHEN ? > 0 THEN ? ELSE changed_at END,
+                    new_videos = new_videos + ?,
+                    not_modified = not_modified + ?,
+                    units = units + ?,
+                    error = ?
+                WHERE source_id = ?
+            """, (etag, error, now, full, now, new_videos, now, new_videos, int(not_modified), units, error, source_id))
+
+    def status(self):
+        """
+        Returns:
+            dict: Progress of the running pass, the last pass, and per source the lag
+            since its last successful sync, its last change, and the quota units spent.
+        """
+        now = time.time()
+        db = self.library.connect()
+        run = db.execute("SELECT started_at, finished_at FROM sync_runs WHERE name = 'library'").fetchone()
+        rows = db.execute("""
+            SELECT s.source_id, s.kind, s.name, st.synced_at, st.full_synced_at, st.changed_at,
+                   st.new_videos, st.not_modified, st.units, st.error,
+                   (SELECT count(*) FROM memberships m WHERE m.source_id = s.source_id) AS videos
+            FROM sources s LEFT JOIN sync_state st ON st.source_id = s.source_id
+            ORDER BY s.kind, s.name
+        """).fetchall()
+        sources = []
+        for row in rows:
+            source = dict(row)
+            source['lag_seconds'] = round(now - source['synced_at'], 1) if source['synced_at'] else None
+            sources.append(source)
+        with self.lock:
+            progress = dict(self.progress)
+        return {
+            'interval': SYNC_INTERVAL,
+            'progress': progress,
+            'last_run': dict(run) if run is not None else None,
+            'units_spent': sum(source['units'] or 0 for source in sources),
+            'sources': sources
+        }
+
+    def start(self, interval=SYNC_INTERVAL, delay=SYNC_DELAY):
+        """
+        Runs a pass every `interval` seconds on a daemon thread, the first after `delay`
+        seconds. With several worker processes, only the one that claims a pass runs it.
+        """
+        if interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.loop, args=(interval, delay), name='library-sync', daemon=True)
+        self.thread.start()
+
+    def loop(self, interval, delay=0):
+        time.sleep(delay)
+        while True:
+            try:
+                if self.claim(interval):
+                    self.run_once()
+            except Exception:
+                logger.exception("Library sync failed")
+            time.sleep(min(interval, 60))
+
+
+library_sync = LibrarySync(library, BASE_DIR)
+
+metrics.Callback('focustube_library_sync_lag_seconds', 'Seconds since each curated source was last synced.',
+                 lambda: [({'source': s['source_id'], 'kind': s['kind']}, s['lag_seconds'])
+                          for s in library_sync.status()['sources'] if s['lag_seconds'] is not None])
+metrics.Callback('focustube_library_sync_units_total', 'YouTube quota units spent syncing each curated source.',
+                 lambda: [({'source': s['source_id'], 'kind': s['kind']}, s['units'] or 0)
+                          for s in library_sync.status()['sources']], type='counter')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync the curated channels and playlists into the library index.')
+    parser.add_argument('--full', action='store_true', help='Read every source in full.')
+    args = parser.parse_args()
+    load_dotenv()
+    results = library_sync.run_once(full=args.full)
+    quota.ledger.flush()
+    print(json.dumps({'results': results, 'status': library_sync.status()}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+# conftest.py
+#
+# The server modules are flat and imported by name, as when running from server/.
+#
+#   python -m pytest server/tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+# test_classifier.py
+
+import pytest
+from classifier import QueryClassifier
+from filters import FILTERS
+
+ALLOWED = ['python lecture', 'linear algebra lecture', 'sql joins lecture', 'compiler design lecture',
+           'guitar chords lecture']
+DENIED = ['celebrity gossip drama', 'funny cat compilation', 'celebrity drama compilation', 'cat gossip drama',
+          'funny celebrity compilation']
+
+
+@pytest.fixture
+def classifier():
+    return QueryClassifier(FILTERS)
+
+
+@pytest.fixture
+def trained():
+    classifier = QueryClassifier(FILTERS, min_examples=25)
+    classifier.fit([(f'{query} {n}', True) for query in ALLOWED for n in range(5)])
+    classifier.fit([(f'{query} {n}', False) for query in DENIED for n in range(5)])
+    return classifier
+
+
+def test_deny_term_decides_locally(classifier):
+    assert classifier.decide('minecraft lets play') == (False, 'term')
+
+
+@pytest.mark.parametrize('query', ['chemical reaction explained', 'nuclear chain reaction', 'python shorts',
+                                   'gameplay programming in unity'])
+def test_ambiguous_words_go_to_gpt(classifier, query):
+    assert classifier.decide(query) == (None, None)
+
+
+@pytest.mark.parametrize('query', ['makeup tutorial', 'science fiction movies', 'python tutorial'])
+def test_allow_term_alone_goes_to_gpt(classifier, query):
+    assert classifier.decide(query) == (None, None)
+
+
+def test_untrained_scorer_abstains(classifier):
+    assert classifier.score('python lecture 1') is None
+
+
+def test_trained_scorer_decides(trained):
+    assert trained.decide('python lecture 3') == (True, 'scorer')
+    assert trained.decide('celebrity gossip compilation') == (False, 'scorer')
+
+
+def test_unseen_query_goes_to_gpt(trained):
+    assert trained.decide('quantum chromodynamics') == (None, None)
+
+
+def test_classify_counts_outcomes(classifier):
+    classifier.classify('minecraft lets play')
+    classifier.classify('python tutorial')
+    stats = classifier.stats()
+    assert (stats['local_deny'], stats['deferred']) == (1, 1)
+
+
+@pytest.mark.parametrize('query', ['makeup tutorial', 'science fiction movies', 'quantum chromodynamics'])
+def test_guess_fails_closed_when_unsure(classifier, query):
+    # None: fallback_verdict DENYs
+    assert classifier.guess(query) is None
+
+
+def test_guess_follows_decide(classifier, trained):
+    assert classifier.guess('minecraft lets play') is False
+    assert trained.guess('python lecture 3') is True
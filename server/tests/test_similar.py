@@ -0,0 +1,57 @@
+# test_similar.py
+
+import pytest
+from similar import SimilarityIndex
+
+# The defaults of SIMILAR_VERDICT_THRESHOLD, SIMILAR_REUSE_THRESHOLD and SIMILAR_REFRESH_THRESHOLD
+VERDICT, REUSE, REFRESH = 0.85, 0.9, 0.8
+
+
+@pytest.fixture
+def index():
+    index = SimilarityIndex()
+    index.fit(['java tutorial', 'javascript tutorial', 'python tutorial', 'linear algebra lecture 3'])
+    return index
+
+
+def test_filler_words_barely_count(index):
+    # 'java' reuses the first page of 'java tutorial' as it is
+    match = index.find('java', REUSE)
+    assert match.query == 'java tutorial'
+    assert match.similarity == pytest.approx(0.9428, abs=1e-4)
+
+
+def test_word_order_and_suffixes_are_ignored(index):
+    match = index.find('learning python', VERDICT)
+    assert match.query == 'python tutorial'
+    assert match.similarity >= REUSE
+
+
+def test_different_topics_do_not_match(index):
+    assert index.find('java', REFRESH).query == 'java tutorial'
+    assert [query for query, _ in index.similar('javascript', REFRESH)] == ['javascript tutorial']
+
+
+def test_numbers_keep_lectures_apart(index):
+    # Close enough to show while lecture 7 loads, but never reused as it is or for a verdict
+    match = index.find('linear algebra lecture 7', REFRESH)
+    assert match.query == 'linear algebra lecture 3'
+    assert REFRESH <= match.similarity < VERDICT
+
+
+def test_query_never_matches_itself(index):
+    assert index.find('Java  Tutorial', REFRESH) is None
+
+
+def test_accept_picks_the_first_usable_match(index):
+    pages = {'javascript tutorial': ['page']}
+    # 'java tutorial' is more similar, but has no cached page
+    assert index.find('java', 0.4, pages.get).query == 'javascript tutorial'
+    assert index.find('java', REFRESH, pages.get) is None
+
+
+def test_oldest_queries_are_dropped():
+    small = SimilarityIndex(max_entries=2)
+    small.fit(['java tutorial', 'python tutorial', 'rust tutorial'])
+    assert small.find('java', REFRESH) is None
+    assert small.stats()['size'] == 2
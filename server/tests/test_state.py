@@ -0,0 +1,50 @@
+# test_state.py
+
+import threading
+import pytest
+from state import SQLiteBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / 'state.db'))
+
+
+def test_compare_and_set_creates_only_missing_keys(backend):
+    assert backend.compare_and_set('job', None, 'a', 60)
+    assert not backend.compare_and_set('job', None, 'b', 60)
+    assert backend.get('job') == 'a'
+
+
+def test_compare_and_set_replaces_the_expected_value(backend):
+    backend.set('job', 'pending', 60)
+    assert not backend.compare_and_set('job', 'done', 'x', 60)
+    assert backend.compare_and_set('job', 'pending', 'done', 60)
+    assert backend.get('job') == 'done'
+
+
+def test_expired_values_count_as_missing(backend):
+    backend.set('job', 'old', -1)
+    assert backend.get('job') is None
+    assert not backend.compare_and_set('job', 'old', 'new', 60)
+    assert backend.compare_and_set('job', None, 'new', 60)
+    assert backend.get('job') == 'new'
+
+
+def test_compare_and_set_has_one_winner(backend):
+    # Every thread opens its own connection, as every worker process does
+    start = threading.Barrier(8)
+    wins = []
+
+    def claim(n):
+        start.wait()
+        if backend.compare_and_set('leader', None, str(n), 60):
+            wins.append(n)
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(wins) == 1
+    assert backend.get('leader') == str(wins[0])
@@ -0,0 +1,69 @@
+# test_upstream.py
+
+import pytest
+import upstream
+from upstream import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(upstream.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['opened'] == 1
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record(False)
+    clock[0] += 9.9
+    assert not breaker.allow()
+    clock[0] += 0.1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record(False)
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        breaker.record(False)
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()['opened'] == 2
+    clock[0] += 5
+    assert not breaker.allow()
+    clock[0] += 5
+    assert breaker.allow()
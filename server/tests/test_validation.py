@@ -0,0 +1,43 @@
+# test_validation.py
+
+import pytest
+from validation import parse_verdict, parse_verdicts
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('ALLOW', True),
+    ('DENY', False),
+    ('allow', True),
+    ('  Deny.  ', False),
+    ('**ALLOW**', True),
+    ('"DENY"', False),
+    ('ALLOW - the query is about programming.', True),
+    ('Denied', False),
+    ('ALL', True),      # cut short by max_tokens
+    ('DEN', False),
+])
+def test_parse_verdict(text, expected):
+    assert parse_verdict(text) is expected
+
+
+@pytest.mark.parametrize('text', ['', None, 'A', 'Maybe', 'I think ALLOW', '42', 'DENYING'])
+def test_parse_verdict_unreadable(text):
+    assert parse_verdict(text) is None
+
+
+def test_parse_verdicts_reads_every_line_format():
+    text = '1: ALLOW\n2. deny\n**3** - ALLOW\n 4) DENY'
+    assert parse_verdicts(text, 4) == {1: True, 2: False, 3: True, 4: False}
+
+
+def test_parse_verdicts_skips_out_of_range_and_missing_numbers():
+    assert parse_verdicts('0: ALLOW\n2: DENY\n5: ALLOW', 3) == {2: False}
+
+
+def test_parse_verdicts_drops_conflicting_answers():
+    assert parse_verdicts('1: ALLOW\n1: DENY\n2: ALLOW\n2: ALLOW', 2) == {2: True}
+
+
+def test_parse_verdicts_ignores_prose():
+    assert parse_verdicts('Here are the verdicts:\n1: ALLOW\nThanks!', 1) == {1: True}
+    assert parse_verdicts(None, 2) == {}
@@ -0,0 +1,419 @@
+# upstream.py
+#
+# Deadlines, hedged requests and circuit breakers for the calls to YouTube and OpenAI.
+#
+# A request sets its deadline once (`with upstream.deadline(seconds):`); every upstream
+# call made under it, on this thread or in tasks started from this coroutine, gets at most
+# what is left of it as its timeout.
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import metrics
+
+# Absolute time.monotonic() by which the current request must be answered
+current_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+# Below this many seconds of budget an upstream call is not even started
+MIN_BUDGET = 0.05
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that cannot answer in time."""
+
+
+class DeadlineExceeded(UpstreamUnavailable, TimeoutError):
+    pass
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Gives the upstream calls inside the block at most `seconds` in total. A deadline
+    already set further out is tightened, never extended.
+    """
+    at = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining():
+    """
+    Returns:
+        float: Seconds left before the current deadline, or None without one.
+    """
+    at = current_deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def is_failure(error):
+    """
+    Timeouts, connection errors and 5xx or 429 answers count against an upstream;
+    other error answers (not found, bad request) show it is up.
+    """
+    status = getattr(error, 'status', None)
+    if not isinstance(status, int):
+        status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return True
+
+
+class LatencyWindow:
+    """
+    Latencies of the last `size` successful calls of one operation.
+    """
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, min_samples=20):
+        """
+        Returns:
+            float: The p-th percentile, or None until `min_samples` calls were seen.
+        """
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream after `failure_threshold` failures in a row. After
+    `reset_timeout` seconds one probe call is let through: if it succeeds the circuit
+    closes again, if it fails it stays open for another `reset_timeout`.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.counts = {'opened': 0, 'rejected': 0}
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self.counts['rejected'] += 1
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.probing = False
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counts['opened'] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def stats(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, **self.counts}
+
+
+class Guard:
+    """
+    Wraps the calls to one upstream service.
+
+    Each call gets the upstream's `timeout` or what is left of the request deadline,
+    whichever is shorter, and fails fast with CircuitOpenError while the circuit is open.
+    A call still running at the p95 latency observed for its operation gets one hedged
+    attempt; the first answer wins and the other attempt is abandoned. A failed first
+    attempt is retried the same way. Hedges are limited to `hedge_ratio` of the calls,
+    so a slow upstream does not get twice the load.
+
+    Blocking calls run on the guard's own threads, so the caller stops waiting at the
+    deadline even if the HTTP client has no way to give up sooner.
+
+    Args:
+        name (str): Label used in metrics.
+        timeout (float): Longest a single call may take.
+        failure_threshold, reset_timeout: See CircuitBreaker.
+        hedge_ratio (float): Hedged attempts allowed per call, on average.
+        max_threads (int): Blocking attempts run at once; further ones queue.
+    """
+
+    def __init__(self, name, timeout=10, failure_threshold=5, reset_timeout=10, hedge_ratio=0.1, max_threads=32):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.hedge_ratio = hedge_ratio
+        self.hedge_tokens = 1.0
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix=f'{name}-upstream')
+        self.counts = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'timeouts': 0, 'failures': 0}
+
+    def latency(self, operation):
+        with self.lock:
+            window = self.latencies.get(operation)
+            if window is None:
+                window = self.latencies[operation] = LatencyWindow()
+            return window
+
+    def budget(self, timeout=None):
+        """
+        Returns:
+            float: Seconds the next call may take.
+
+        Raises:
+            DeadlineExceeded: If the request deadline leaves no time for it.
+        """
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        left = remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+        if timeout < MIN_BUDGET:
+            self._count('timeouts')
+            raise DeadlineExceeded(f'No time left to call {self.name}.')
+        return timeout
+
+    def _start(self, operation, timeout, hedge):
+        """
+        Checks the breaker and decides when to hedge.
+
+        Returns:
+            float: Seconds after which a second attempt may start, or None for never.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'{self.name} is unavailable (circuit open).')
+        with self.lock:
+            self.counts['calls'] += 1
+            self.hedge_tokens = min(self.hedge_tokens + self.hedge_ratio, 10.0)
+        if not hedge:
+            return None
+        # Until the p95 is known, only a failed attempt is retried
+        p95 = self.latency(operation).percentile(95)
+        return timeout if p95 is None else p95
+
+    def _take_hedge(self):
+        with self.lock:
+            if self.hedge_tokens < 1:
+                return False
+            self.hedge_tokens -= 1
+            self.counts['hedges'] += 1
+            return True
+
+    def _finish(self, operation, timeout, error):
+        if error is None:
+            self.breaker.record(True)
+            return
+        failed = is_failure(error)
+        if isinstance(error, DeadlineExceeded):
+            self._count('timeouts')
+            # A deadline tighter than the usual latency says nothing about the upstream
+            p95 = self.latency(operation).percentile(95)
+            failed = p95 is None or timeout >= p95
+        if failed:
+            self._count('failures')
+        self.breaker.record(not failed)
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def _attempt(self, operation, fn, timeout):
+        started = time.perf_counter()
+        result = fn(timeout)
+        self.latency(operation).add(time.perf_counter() - started)
+        return result
+
+    def call(self, operation, fn, timeout=None, hedge=True):
+        """
+        Calls `fn(timeout)` on the guard's threads under the deadline, breaker and hedging.
+
+        Args:
+            operation (str): What is called, e.g. 'search'; latencies are kept per operation.
+            fn (callable): Makes one attempt, taking at most the seconds it is given.
+            timeout (float): Cap below the upstream's own timeout.
+            hedge (bool): Whether a second attempt may be sent (only for idempotent,
+                cheap calls).
+
+        Raises:
+            DeadlineExceeded, CircuitOpenError, or whatever the last attempt raised.
+        """
+        timeout = self.budget(timeout)
+        hedge_after = self._start(operation, timeout, hedge)
+        started = time.monotonic()
+        end = started + timeout
+        hedge_at = None if hedge_after is None else started + hedge_after
+        first = self.executor.submit(self._attempt, operation, fn, timeout)
+        pending = {first}
+        error = None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= end:
+                    raise DeadlineExceeded(f'{self.name} {operation} took longer than {timeout:.2f}s.')
+                done, pending = wait(pending, timeout=(end if hedge_at is None else min(end, hedge_at)) - now,
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if not is_failure(e):
+                            raise
+                        error = e
+                        continue
+                    if future is not first:
+                        self._count('hedge_wins')
+                    error = None
+                    return result
+                if hedge_at is not None and (not pending or time.monotonic() >= hedge_at):
+                    hedge_at = None
+                    left = end - time.monotonic()
+                    if left >= MIN_BUDGET and self._take_hedge():
+                        pending.add(self.executor.submit(self._attempt, operation, fn, left))
+                if not pending:
+                    raise error
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+            self._finish(operation, timeout, error)
+
+    async def call_async(self, operation, fn, timeout=None, hedge=True):
+        """
+        Event loop version of call(): `fn(timeout)` is a coroutine function, and an
+        abandoned attempt is cancelled rather than left to run out.
+        """
+        timeout = self.budget(timeout)
+        hedge_after = self._start(operation, timeout, hedge)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        end = started + timeout
+        hedge_at = None if hedge_after is None else started + hedge_after
+
+        async def attempt(seconds):
+            attempt_started = time.perf_counter()
+            result = await fn(seconds)
+            self.latency(operation).add(time.perf_counter() - attempt_started)
+            return result
+
+        first = asyncio.ensure_future(attempt(timeout))
+        pending = {first}
+        error = None
+        try:
+            while True:
+                now = loop.time()
+                if now >= end:
+                    raise DeadlineExceeded(f'{self.name} {operation} took longer than {timeout:.2f}s.')
+                done, pending = await asyncio.wait(pending, timeout=(end if hedge_at is None else min(end, hedge_at)) - now,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not is_failure(e):
+                            raise
+                        error = e
+                        continue
+                    if task is not first:
+                        self._count('hedge_wins')
+                    error = None
+                    return result
+                if hedge_at is not None and (not pending or loop.time() >= hedge_at):
+                    hedge_at = None
+                    left = end - loop.time()
+                    if left >= MIN_BUDGET and self._take_hedge():
+                        pending.add(asyncio.ensure_future(attempt(left)))
+                if not pending:
+                    raise error
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            self._finish(operation, timeout, error)
+
+    def degraded(self):
+        """
+        Returns:
+            bool: Whether calls are currently being refused, so callers can go straight
+            to their fallback.
+        """
+        return self.breaker.stats()['state'] == CircuitBreaker.OPEN
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            operations = list(self.latencies)
+        return {
+            **counts,
+            'timeout': self.timeout,
+            'breaker': self.breaker.stats(),
+            'p95_ms': {operation: round(p95 * 1000, 1) for operation in operations
+                       if (p95 := self.latency(operation).percentile(95)) is not None}
+        }
+
+
+def guard_from_env(name, timeout):
+    prefix = name.upper()
+    return Guard(
+        name,
+        timeout=float(os.getenv(f'{prefix}_TIMEOUT', str(timeout))),
+        failure_threshold=int(os.getenv('BREAKER_FAILURES', '5')),
+        reset_timeout=float(os.getenv('BREAKER_RESET_SECONDS', '10')),
+        hedge_ratio=float(os.getenv('HEDGE_RATIO', '0.1')),
+        max_threads=int(os.getenv(f'{prefix}_THREADS', '32'))
+    )
+
+
+youtube = guard_from_env('youtube', 10)
+openai = guard_from_env('openai', 15)
+guards = (youtube, openai)
+
+BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+metrics.Callback('focustube_upstream_circuit_state', 'Circuit breaker state (0 closed, 1 half open, 2 open).',
+                 lambda: [({'upstream': g.name}, BREAKER_STATES[g.breaker.stats()['state']]) for g in guards])
+metrics.Callback('focustube_upstream_guard_total', 'Guarded upstream calls, hedges, timeouts and failures.',
+                 lambda: [({'upstream': g.name, 'outcome': k}, v) for g in guards
+                          for k, v in g.stats().items() if isinstance(v, int)], type='counter')
+metrics.Callback('focustube_upstream_rejected_total', 'Calls refused while the circuit was open.',
+                 lambda: [({'upstream': g.name}, g.breaker.stats()['rejected']) for g in guards], type='counter')
+
+
+def stats():
+    return {g.name: g.stats() for g in guards}
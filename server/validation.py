@@ -0,0 +1,174 @@
+# validation.py
+
+import math
+import re
+from collections import namedtuple
+
+# Static instructions, sent first and unchanged on every call so the provider can cache them
+INSTRUCTIONS = (
+    "You screen YouTube search queries for a focus app. A query is allowed only if it is about "
+    "the allowed topics below. Reply with exactly one word: ALLOW or DENY."
+)
+
+BATCH_INSTRUCTIONS = (
+    "You will get several numbered queries. Judge each one on its own and answer with exactly "
+    "one line per query, in the form `<number>: ALLOW` or `<number>: DENY`, and nothing else."
+)
+
+# "3: ALLOW", "3. deny", "**3** - ALLOW", ...
+VERDICT_LINE = re.compile(r'^\W*(\d+)\W+(ALLOW|DENY)\b', re.IGNORECASE | re.MULTILINE)
+
+# Completion tokens allowed per query of a batch ("12: ALLOW\n" is about 5)
+BATCH_TOKENS_PER_QUERY = 6
+
+# confidence: probability of the verdict from the first token's logprobs, or None without them
+Verdict = namedtuple('Verdict', ['allowed', 'confidence'])
+
+
+class UnparseableVerdict(ValueError):
+    pass
+
+
+def parse_verdict(text):
+    """
+    Reads a one-word verdict, ignoring case, whitespace, punctuation and anything after
+    the first word; a reply cut short by max_tokens ('ALL', 'DEN') still counts.
+
+    Returns:
+        bool: True for ALLOW, False for DENY, None for anything else.
+    """
+    match = re.match(r'\W*([A-Za-z]+)', text or '')
+    if match is None:
+        return None
+    word = match.group(1).upper()
+    if len(word) < 2:
+        return None
+    if 'ALLOW'.startswith(word) or word.startswith('ALLOW'):
+        return True
+    if 'DENY'.startswith(word) or word.startswith('DENIED'):
+        return False
+    return None
+
+
+def parse_verdicts(text, count):
+    """
+    Returns:
+        dict: Query number -> True (ALLOW) / False (DENY) for every well-formed line
+        numbered 1..count. Numbers the model skipped or answered twice differently are left out.
+    """
+    verdicts = {}
+    conflicting = set()
+    for number, verdict in VERDICT_LINE.findall(text or ''):
+        number = int(number)
+        if not 1 <= number <= count:
+            continue
+        allowed = verdict.upper() == 'ALLOW'
+        if verdicts.get(number, allowed) != allowed:
+            conflicting.add(number)
+        verdicts[number] = allowed
+    for number in conflicting:
+        del verdicts[number]
+    return verdicts
+
+
+def first_token_confidence(choice):
+    """
+    Returns:
+        float: Probability that the first token starts ALLOW, among the top candidates
+        that start ALLOW or DENY, or None if the reply came without logprobs.
+    """
+    logprobs = getattr(choice, 'logprobs', None)
+    if logprobs is None or not logprobs.content:
+        return None
+    mass = {True: 0.0, False: 0.0}
+    for candidate in logprobs.content[0].top_logprobs or [logprobs.content[0]]:
+        allowed = parse_verdict(candidate.token)
+        if allowed is not None:
+            mass[allowed] += math.exp(candidate.logprob)
+    total = mass[True] + mass[False]
+    return mass[True] / total if total else None
+
+
+class ValidationEngine:
+    """
+    Builds the GPT requests that validate queries and reads the verdicts.
+
+    The instructions and filters form a system message that never changes, followed by
+    a user message holding only the query, so every call shares the same prefix. Output
+    is capped at `max_tokens` (ALLOW and DENY take one or two tokens) at temperature 0,
+    and replies are parsed leniently instead of compared verbatim.
+
+    Args:
+        filters (str): Topics queries must be about.
+        model (str): Chat model to ask.
+        max_tokens (int): Completion tokens allowed for a single verdict.
+        logprobs (bool): Also ask for the first token's top logprobs, to attach a confidence.
+    """
+
+    def __init__(self, filters, model='gpt-4o-mini', max_tokens=2, logprobs=False):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.logprobs = logprobs
+        self.system = f"{INSTRUCTIONS}\nAllowed topics: {filters}"
+        self.batch_system = f"{self.system}\n{BATCH_INSTRUCTIONS}"
+
+    def request(self, query):
+        """
+        Returns:
+            dict: Arguments for chat.completions.create.
+        """
+        args = {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': self.system},
+                {'role': 'user', 'content': f"Query: {' '.join(query.split())}"}
+            ],
+            'max_tokens': self.max_tokens,
+            'temperature': 0
+        }
+        if self.logprobs:
+            args.update(logprobs=True, top_logprobs=5)
+        return args
+
+    def batch_request(self, queries):
+        """
+        Returns:
+            dict: Arguments for one chat.completions.create call judging every query.
+        """
+        # Newlines are collapsed so a query cannot pose as another numbered line
+        lines = '\n'.join(f"{i}. {' '.join(query.split())}" for i, query in enumerate(queries, 1))
+        return {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': self.batch_system},
+                {'role': 'user', 'content': f"Queries:\n{lines}"}
+            ],
+            'max_tokens': BATCH_TOKENS_PER_QUERY * len(queries),
+            'temperature': 0
+        }
+
+    def verdict(self, completion):
+        """
+        Returns:
+            Verdict: The verdict of a request() completion.
+
+        Raises:
+            UnparseableVerdict: If the reply is neither ALLOW nor DENY.
+        """
+        choice = completion.choices[0]
+        allowed = parse_verdict(choice.message.content)
+        if allowed is None:
+            raise UnparseableVerdict(f"Unexpected verdict {choice.message.content!r}")
+        confidence = first_token_confidence(choice)
+        if confidence is not None and not allowed:
+            confidence = 1 - confidence
+        return Verdict(allowed, confidence)
+
+    def batch_verdicts(self, completion, count):
+        """
+        Returns:
+            dict: Query number -> Verdict for the lines of a batch_request() completion
+            that could be read.
+        """
+        verdicts = parse_verdicts(completion.choices[0].message.content, count)
+        return {number: Verdict(allowed, None) for number, allowed in verdicts.items()}
@@ -0,0 +1,120 @@
+# verdicts.py
+
+import hashlib
+import json
+import re
+import threading
+import time
+from cache import PersistentLRUCache
+
+
+def normalize_query(query: str) -> str:
+    """
+    Reduces a query to a canonical form so that trivially different spellings
+    share one verdict: case, punctuation, repeated whitespace and word order are ignored.
+
+    Args:
+        query (str): The raw search query.
+
+    Returns:
+        str: The normalized query, e.g. "Python  Tutorial!" -> "python tutorial".
+    """
+    tokens = re.findall(r'\w+', query.lower())
+    return ' '.join(sorted(tokens))
+
+
+class VerdictCache:
+    """
+    Caches GPT ALLOW/DENY verdicts for normalized queries.
+
+    Keys include a hash of the filter text, so editing FILTERS invalidates every verdict.
+
+    Args:
+        filters (str): The filter text the verdicts were given for.
+        max_entries (int): LRU size bound.
+        allow_ttl (float): Seconds an ALLOW verdict is trusted.
+        deny_ttl (float): Seconds a DENY verdict is trusted.
+        path (str): Optional JSON file the cache is persisted to and warmed from.
+        save_interval (float): Minimum seconds between writes to `path`.
+        shared (SharedCache): Optional store shared with other worker processes, used
+            instead of the in-process cache and its file.
+    """
+
+    def __init__(self, filters, max_entries=10000, allow_ttl=7 * 86400, deny_ttl=86400,
+                 path=None, save_interval=30, shared=None):
+        self.filters_hash = hashlib.sha1(filters.encode('utf-8')).hexdigest()[:12]
+        self.allow_ttl = allow_ttl
+        self.deny_ttl = deny_ttl
+        if shared is not None:
+            # Verdicts for another FILTERS text sit under other keys and simply expire
+            self.cache = shared
+            return
+        self.cache = PersistentLRUCache(path=path, save_interval=save_interval, max_entries=max_entries)
+        # Verdicts given for a different FILTERS text are dropped
+        for key in [key for key, _, _ in self.cache.dump() if not key.startswith(self.filters_hash + ':')]:
+            self.cache.delete(key)
+
+    def key(self, query):
+        return f"{self.filters_hash}:{normalize_query(query)}"
+
+    def get(self, query):
+        """
+        Returns:
+            bool: The cached verdict, or None on a miss.
+        """
+        return self.cache.get(self.key(query))
+
+    def peek(self, query):
+        return self.cache.peek(self.key(query))
+
+    def set(self, query, allowed):
+        ttl = self.allow_ttl if allowed else self.deny_ttl
+        self.cache.set(self.key(query), bool(allowed), ttl=ttl)
+
+    def stats(self):
+        return self.cache.stats()
+
+    def save(self):
+        """Writes the cache to its file atomically."""
+        self.cache.save()
+
+
+class VerdictLog:
+    """
+    Append-only JSON-lines record of GPT verdicts, used to train and evaluate
+    the local classifier.
+
+    Args:
+        path (str): File the verdicts are appended to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def append(self, query, allowed, confidence=None):
+        row = {'query': query, 'allowed': bool(allowed), 'ts': int(time.time())}
+        if confidence is not None:
+            row['confidence'] = round(confidence, 4)
+        line = json.dumps(row)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+    def read(self):
+        """
+        Returns:
+            list: (query, allowed) tuples in the order they were recorded.
+        """
+        examples = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        examples.append((row['query'], row['allowed']))
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return examples
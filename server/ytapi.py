@@ -0,0 +1,154 @@
+# ytapi.py
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+import quota
+import upstream
+
+API_BASE = os.getenv('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3')
+
+# One pooled, keep-alive session shared by every thread (requests sessions are thread-safe for GETs)
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+
+class YouTubeApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"YouTube API error {status}: {message}")
+        self.status = status
+
+
+def call(endpoint, timeout=10, **params):
+    """
+    Calls a YouTube Data API v3 list endpoint over the shared session.
+
+    Args:
+        endpoint (str): Resource name, e.g. 'channels' or 'playlistItems'.
+        timeout (float): Seconds to wait for the response.
+        **params: Query parameters; `None` values are dropped.
+
+    Returns:
+        dict: The decoded JSON response.
+
+    Raises:
+        YouTubeApiError: On a non-2xx response, or with status 429 when the daily
+        quota budget is used up.
+    """
+    return get(endpoint, timeout, params).json()
+
+
+def conditional_call(endpoint, etag, timeout=10, **params):
+    """
+    Like call(), but sends `etag` as If-None-Match so an unchanged resource comes
+    back as an empty 304.
+
+    Returns:
+        tuple: (decoded JSON response or None if unchanged, current ETag).
+    """
+    response = get(endpoint, timeout, params, {'If-None-Match': etag} if etag else None)
+    if response.status_code == 304:
+        return None, etag
+    body = response.json()
+    return body, body.get('etag') or response.headers.get('ETag')
+
+
+def get(endpoint, timeout, params, headers=None):
+    units = quota.QUOTA_COSTS.get(endpoint, 1)
+    if not quota.ledger.allow(quota.HIGH, units):
+        raise YouTubeApiError(429, 'Daily YouTube quota budget exhausted.')
+    # Attempts run on the guard's threads; the quota is charged to this thread's route
+    route = quota.current_route()
+
+    params = {k: v for k, v in params.items() if v is not None}
+    params['key'] = os.getenv('YOUTUBE_API_KEY')
+
+    def attempt(seconds):
+        quota.ledger.record(endpoint, units, route)
+        response = session.get(f"{API_BASE}/{endpoint}", params=params, headers=headers, timeout=seconds)
+        if not response.ok:
+            raise api_error(response)
+        return response
+
+    with metrics.upstream_call('youtube', endpoint):
+        try:
+            # Only one-unit calls are worth hedging
+            return upstream.youtube.call(endpoint, attempt, timeout, hedge=units == 1)
+        except upstream.UpstreamUnavailable as e:
+            raise YouTubeApiError(503 if isinstance(e, upstream.CircuitOpenError) else 504, str(e))
+
+
+def api_error(response):
+    try:
+        message = response.json()['error']['message']
+    except (ValueError, KeyError, TypeError):
+        message = response.text[:200]
+    if response.status_code == 403 and 'quota' in message.lower():
+        quota.ledger.mark_exhausted()
+    return YouTubeApiError(response.status_code, message)
+
+
+def get_uploads_playlist_id(channel_id):
+    """
+    Returns:
+        str: The channel's uploads playlist ID, or None if the channel does not exist.
+    """
+    return uploads_playlist(call('channels', part='contentDetails', id=channel_id))
+
+
+def iter_playlist_pages(playlist_id):
+    """
+    Follows a playlist's pages, yielding each page as a list of
+    {'videoId', 'title'} dictionaries.
+    """
+    page_token = None
+    while True:
+        response = call('playlistItems', part='snippet', playlistId=playlist_id,
+                        maxResults=50, pageToken=page_token)
+        yield playlist_page(response)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def playlist_page(response):
+    return [
+        {
+            'videoId': item['snippet']['resourceId']['videoId'],
+            'title': item['snippet']['title']
+        }
+        for item in response.get('items', [])
+    ]
+
+
+def uploads_playlist(response):
+    items = response.get('items')
+    if items:
+        return items[0]['contentDetails']['relatedPlaylists']['uploads']
+    return None
+
+
+# channels.list, videos.list etc. accept at most 50 IDs per call
+MAX_IDS_PER_CALL = 50
+
+
+def batches(ids, size=MAX_IDS_PER_CALL):
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def get_channels(channel_ids, part='snippet'):
+    """
+    Fetches channel resources in batches of 50 IDs per channels.list call.
+
+    Returns:
+        dict: Channel ID -> channel resource, for the channels that exist.
+    """
+    channels = {}
+    for batch in batches(dict.fromkeys(channel_ids)):
+        response = call('channels', part=part, id=','.join(batch), maxResults=MAX_IDS_PER_CALL)
+        for item in response.get('items', []):
+            channels[item['id']] = item
+    return channels